@@ -0,0 +1,98 @@
+# answer_cache.py
+"""
+Semantic cache of QA answers.
+Entries are partitioned by (namespace, maslul, profile), the profile being the
+user details the answer may depend on (age, gender); a lookup returns a stored
+answer when the cosine similarity between the new query embedding and a
+cached one is above the threshold. All entries are dropped when the index
+version changes (i.e. the knowledge base was rebuilt).
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+class AnswerPartition:
+    def __init__(self, max_entries):
+        self.entries = deque(maxlen=max_entries)   # (unit vector, answer, retrieved_docs, created_at)
+        self._matrix = None
+
+    def add(self, vector, answer, retrieved_docs):
+        self.entries.append((vector, answer, retrieved_docs, time.monotonic()))
+        self._matrix = None
+
+    def best_match(self, vector):
+        if not self.entries:
+            return None, -1.0
+        if self._matrix is None:
+            self._matrix = np.vstack([e[0] for e in self.entries])
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        return self.entries[best], float(scores[best])
+
+class SemanticAnswerCache:
+    def __init__(self, threshold = 0.95, max_entries = 512, ttl = 86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.index_version = None
+        self._partitions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(embedding):
+        v = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _check_version(self, index_version):
+        if index_version != self.index_version:
+            if self._partitions:
+                self.invalidations += 1
+            self._partitions = {}
+            self.index_version = index_version
+
+    def lookup(self, namespace, maslul, embedding, index_version, profile = ""):
+        """
+        Returns {"answer", "retrieved_docs", "similarity"} for a close enough
+        cached question, else None.
+        """
+        vector = self._unit(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            partition = self._partitions.get((namespace, maslul, profile))
+            entry, score = partition.best_match(vector) if partition else (None, -1.0)
+            if entry is not None and score >= self.threshold and time.monotonic() - entry[3] <= self.ttl:
+                self.hits += 1
+                return {"answer": entry[1], "retrieved_docs": entry[2], "similarity": score}
+            self.misses += 1
+            return None
+
+    def store(self, namespace, maslul, embedding, answer, retrieved_docs, index_version, profile = ""):
+        vector = self._unit(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            partition = self._partitions.setdefault((namespace, maslul, profile), AnswerPartition(self.max_entries))
+            partition.add(vector, answer, retrieved_docs)
+
+    def clear(self):
+        with self._lock:
+            self._partitions = {}
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": sum(len(p.entries) for p in self._partitions.values()),
+                "partitions": len(self._partitions),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "index_version": self.index_version,
+            }
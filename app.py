@@ -1,9 +1,21 @@
 import streamlit as st
 import requests
 
+from backend_client import BackendClient
+
 st.set_page_config(page_title="Health Fund Bot", layout="centered")
 st.title("🤖 Health Fund Chatbot")
 
+@st.cache_resource
+def get_backend():
+    """
+    One pooled backend client per Streamlit process (BACKEND_URL etc., see backend_client.py),
+    shared by every session and rerun so turns reuse keep-alive connections.
+    """
+    return BackendClient.from_env()
+
+backend = get_backend()
+
 # STATE
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
@@ -21,6 +33,8 @@ if "last_rag_query" not in st.session_state:
     st.session_state.last_rag_query = ""
 if "just_confirmed" not in st.session_state:
     st.session_state.just_confirmed = False  # tracks if we just confirmed the details 
+if "rendered_messages" not in st.session_state:
+    st.session_state.rendered_messages = 0   # history messages drawn by the last full run
 
 # HELPERS 
 CONFIRM_WORDS = {"אכן", "אמת", "כן", "מאשר", "אישרתי",
@@ -42,14 +56,45 @@ def user_just_confirmed(history) -> bool:
             any(w in last_user["content"].lower() for w in CONFIRM_WORDS) and
             prev_asst and assistant_requested_confirmation(prev_asst["content"]))
 
-def fetch_user_data(history):
+def stream_chat(payload, rag_info):
+    """
+    Calls /chat/stream and yields answer text as it arrives (for st.write_stream).
+    The RAG debug payload (sent as the first event) is stored into rag_info.
+    """
     try:
-        r = requests.post("http://localhost:8000/extract_user_data", json={"history": history})
-        if r.status_code == 200:
-            return r.json().get("user_data", {})
-    except Exception:
-        pass
-    return {}
+        for event, data in backend.chat_events(payload):
+            if event == "rag":
+                rag_info.update(data)
+            elif event in ("token", "error"):
+                yield data["text"]
+    except requests.RequestException:
+        yield "Server error."
+
+def clear_rag_debug():
+    st.session_state.last_retrieved_docs = []
+    st.session_state.last_namespace = ""
+    st.session_state.last_maslul = ""
+    st.session_state.last_rag_query = ""
+
+def render_message(m):
+    with st.chat_message(m["role"]):
+        st.markdown(m["content"])
+
+def render_rag_debug():
+    if not (st.session_state.last_retrieved_docs or
+            st.session_state.last_namespace or
+            st.session_state.last_maslul or
+            st.session_state.last_rag_query):
+        return
+    with st.expander("Debug: RAG context", expanded=False):
+        st.markdown(f"**RAG Query:** <span style='direction:ltr'>{st.session_state.last_rag_query}</span>", unsafe_allow_html=True)
+        st.markdown(f"**Namespace:** `{st.session_state.last_namespace}` &nbsp;&nbsp; **מסלול:** `{st.session_state.last_maslul}`")
+        st.markdown("---")
+        for i, d in enumerate(st.session_state.last_retrieved_docs, 1):
+            with st.container(border=True):
+                for k, v in d.items():
+                    if v:
+                        st.markdown(f"**{k}:** {v}")
 
 #  SIDEBAR / DEBUG 
 st.sidebar.markdown(f"**Current phase:** `{st.session_state.phase}`")
@@ -67,71 +112,68 @@ html, body, [data-testid="stAppViewContainer"], .block-container {direction:rtl;
 </style>
 """, unsafe_allow_html=True)
 
+# Drawn on full runs only: a new message reruns just the chat fragment below
+st.session_state.rendered_messages = len(st.session_state.chat_history)
 for m in st.session_state.chat_history:
-    with st.chat_message(m["role"]):
-        st.markdown(m["content"])
-
-# RAG DEBUG EXPANDER 
-if (st.session_state.last_retrieved_docs or
-        st.session_state.last_namespace or
-        st.session_state.last_maslul or
-        st.session_state.last_rag_query):
-    with st.expander("Debug: RAG context", expanded=False):
-        st.markdown(f"**RAG Query:** <span style='direction:ltr'>{st.session_state.last_rag_query}</span>", unsafe_allow_html=True)
-        st.markdown(f"**Namespace:** `{st.session_state.last_namespace}` &nbsp;&nbsp; **מסלול:** `{st.session_state.last_maslul}`")
-        st.markdown("---")
-        for i, d in enumerate(st.session_state.last_retrieved_docs, 1):
-            with st.container(border=True):
-                for k, v in d.items():
-                    if v:
-                        st.markdown(f"**{k}:** {v}")
-
-# CHAT INPUT 
-user_msg = st.chat_input("Type your message here…")
-
-if user_msg:
-    st.session_state.chat_history.append({"role": "user", "content": user_msg})
-
-    # if the user just confirm, then send confirmation message and move to QA phase.
-    if (st.session_state.phase == "user_info" and user_just_confirmed(st.session_state.chat_history)):
-        st.session_state.user_data = fetch_user_data(st.session_state.chat_history)
-        st.session_state.chat_history.append({
-            "role": "assistant",
-            "content": "תודה! הפרטים נקלטו בהצלחה. כעת אפשר לשאול שאלות על ההטבות והכיסויים במסלול שלך."
-        })
-        st.session_state.phase = "qa"
-        # Clear last rag context on phase switch
-        st.session_state.last_retrieved_docs = []
-        st.session_state.last_namespace = ""
-        st.session_state.last_maslul = ""
-        st.session_state.last_rag_query = ""
-        st.rerun()
-
-    # Otherwise normal backend call: if in QA phase, do RAG.
-    else:
-        try:
-            r = requests.post(
-                "http://localhost:8000/chat",
-                json={
+    render_message(m)
+
+@st.fragment
+def chat_turns():
+    """
+    Messages sent since the last full run, the chat input and the RAG debug of the
+    latest turn. Sending a message reruns only this fragment, so the history above
+    and the sidebar are not redrawn on every turn.
+    """
+    for m in st.session_state.chat_history[st.session_state.rendered_messages:]:
+        render_message(m)
+
+    # CHAT INPUT
+    user_msg = st.chat_input("Type your message here…")
+    if user_msg:
+        st.session_state.chat_history.append({"role": "user", "content": user_msg})
+        render_message({"role": "user", "content": user_msg})
+
+        # if the user just confirmed, one request extracts the details and ends onboarding
+        if (st.session_state.phase == "user_info" and user_just_confirmed(st.session_state.chat_history)):
+            try:
+                result = backend.confirm_user_data(st.session_state.chat_history)
+            except requests.RequestException:
+                result = {"user_data": {}, "phase": "user_info", "message": "Server error."}
+            st.session_state.chat_history.append({"role": "assistant", "content": result["message"]})
+            if result["phase"] == "qa":
+                st.session_state.user_data = result["user_data"]
+                st.session_state.phase = "qa"
+                # Clear last rag context on phase switch
+                clear_rag_debug()
+                # The sidebar shows the new phase and user data
+                st.rerun()
+            render_message(st.session_state.chat_history[-1])
+
+        # Otherwise normal backend call: if in QA phase, do RAG.
+        # The answer is streamed and rendered token by token.
+        else:
+            rag_info = {}
+            with st.chat_message("assistant"):
+                bot_reply = st.write_stream(stream_chat({
                     "history": st.session_state.chat_history,
                     "phase": st.session_state.phase,
-                    "user_data": st.session_state.user_data
-                })
-            if r.status_code == 200:
-                data = r.json()
-                bot_reply = data["answer"]
-                # debug info (may be empty in user-info phase)
-                st.session_state.last_retrieved_docs = data.get("retrieved_docs", [])
-                st.session_state.last_namespace = data.get("namespace", "")
-                st.session_state.last_maslul = data.get("maslul", "")
-                st.session_state.last_rag_query = data.get("rag_query", "")
-            else:
-                bot_reply = "Server error."
-        except Exception as e:
-            bot_reply = f"{e}"
-
-        st.session_state.chat_history.append({"role": "assistant", "content": bot_reply})
-        st.rerun()
+                    "user_data": st.session_state.user_data,
+                    # Lets the server answer follow-ups from the previous rows
+                    "previous_retrieved_docs": st.session_state.last_retrieved_docs
+                }, rag_info))
+            # debug info (may be empty in user-info phase); turns that needed no
+            # retrieval ("thanks") keep the previous rows for the next follow-up
+            if rag_info.get("retrieval") != "none":
+                st.session_state.last_retrieved_docs = rag_info.get("retrieved_docs", [])
+                st.session_state.last_namespace = rag_info.get("namespace", "")
+                st.session_state.last_maslul = rag_info.get("maslul", "")
+                st.session_state.last_rag_query = rag_info.get("rag_query", "")
+            st.session_state.chat_history.append({"role": "assistant", "content": bot_reply})
+
+    # RAG DEBUG EXPANDER
+    render_rag_debug()
+
+chat_turns()
 
 #  BUTTON 
 with st.sidebar:
@@ -139,10 +181,7 @@ with st.sidebar:
         st.session_state.chat_history = []
         st.session_state.phase = "user_info"
         st.session_state.user_data = {}
-        st.session_state.last_retrieved_docs = []
-        st.session_state.last_namespace = ""
-        st.session_state.last_maslul = ""
-        st.session_state.last_rag_query = ""
+        clear_rag_debug()
         st.rerun()
     st.markdown("""---""")
     st.markdown(
@@ -0,0 +1,82 @@
+# backend_client.py
+"""
+HTTP client of the Streamlit app for the FastAPI backend. One pooled
+requests.Session is shared by every turn and rerun (app.py caches it with
+st.cache_resource), so turns reuse keep-alive connections instead of opening
+a new one each time. Configured from the environment:
+
+    BACKEND_URL              base URL of server.py (http://localhost:8000)
+    BACKEND_CONNECT_TIMEOUT  seconds to connect (3.05)
+    BACKEND_READ_TIMEOUT     seconds between bytes of a response (60)
+    BACKEND_RETRIES          retries on connection errors and 502/503/504 (2)
+    BACKEND_POOL_SIZE        keep-alive connections kept per host (4)
+
+Requests are only retried when nothing was read yet (read retries are off),
+so a completion that is already streaming is never sent twice.
+"""
+import json
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class BackendClient:
+    def __init__(self, base_url = "http://localhost:8000", connect_timeout = 3.05, read_timeout = 60.0,
+                 retries = 2, pool_size = 4):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total = retries,
+            connect = retries,
+            read = 0,
+            status = retries,
+            status_forcelist = (502, 503, 504),
+            allowed_methods = None,     # the backend is stateless, POSTs are safe to resend
+            backoff_factor = 0.3,
+            raise_on_status = False
+        )
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size, max_retries = retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            base_url = os.getenv("BACKEND_URL", "http://localhost:8000"),
+            connect_timeout = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3.05")),
+            read_timeout = float(os.getenv("BACKEND_READ_TIMEOUT", "60")),
+            retries = int(os.getenv("BACKEND_RETRIES", "2")),
+            pool_size = int(os.getenv("BACKEND_POOL_SIZE", "4"))
+        )
+
+    def post(self, path, payload, **kwargs):
+        return self.session.post(f"{self.base_url}{path}", json = payload, timeout = self.timeout, **kwargs)
+
+    def confirm_user_data(self, history):
+        """
+        Ends onboarding in one request: {"user_data", "phase", "missing", "message"}
+        (see server.confirm_user_data_endpoint).
+        """
+        r = self.post("/confirm_user_data", {"history": history})
+        r.raise_for_status()
+        return r.json()
+
+    def chat_events(self, payload):
+        """
+        Calls /chat/stream and yields (event, data) for each server-sent event.
+        Raises requests.HTTPError on a non-200 response.
+        """
+        with self.post("/chat/stream", payload, stream = True) as r:
+            r.raise_for_status()
+            event = None
+            for raw in r.iter_lines():
+                line = raw.decode("utf-8")
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):])
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,81 @@
+# benchmarks/bench_backend_client.py
+"""
+Streamlit-side client benchmark: --turns sequential /chat/stream turns (what
+app.py sends) over real HTTP to the server on the local stubs, with a new
+requests.post connection per turn (before) vs the pooled BackendClient, plus
+the onboarding phase switch as /extract_user_data vs /confirm_user_data.
+
+    python benchmarks/bench_backend_client.py --turns 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at, QUESTION, USER_DATA
+
+ONBOARDING = [
+    {"role": "user", "content": "- שם מלא: יוסי כהן\n- מספר תעודת זהות: 123456789\n- מגדר: זכר\n- גיל: 35\n"
+                                "- קופת חולים: מכבי\n- מספר כרטיס קופה: 987654321\n- מסלול ביטוח: זהב"},
+    {"role": "assistant", "content": "האם כל הפרטים נכונים?"},
+    {"role": "user", "content": "כן"},
+]
+
+def per_connection_turn(base_url, payload):
+    with requests.post(f"{base_url}/chat/stream", json=payload, stream=True) as r:
+        for _ in r.iter_lines():
+            pass
+
+def pooled_turn(backend, payload):
+    for _ in backend.chat_events(payload):
+        pass
+
+def timed(fn, n):
+    latencies = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ["ANSWER_CACHE_ENABLED"] = "0"
+    stub = create_stub_app(embed_latency=0.01, chat_latency=0.05, query_latency=0.01)
+    stub_url, stub_server = start_in_thread(stub)
+    point_env_at(stub_url)
+    import server
+    base_url, app_server = start_in_thread(server.create_app())
+
+    from backend_client import BackendClient
+    backend = BackendClient(base_url)
+    payload = {"history": [{"role": "user", "content": QUESTION}], "phase": "qa", "user_data": USER_DATA}
+    pooled_turn(backend, payload)   # warm-up (server startup)
+
+    print(f"{args.turns} sequential /chat/stream turns")
+    for label, fn in (("new connection / turn", lambda: per_connection_turn(base_url, payload)),
+                      ("pooled BackendClient", lambda: pooled_turn(backend, payload))):
+        latencies = timed(fn, args.turns)
+        print(f"{label:<22} p50 {statistics.median(latencies) * 1000:6.1f} ms | "
+              f"mean {statistics.mean(latencies) * 1000:6.1f} ms")
+
+    old = timed(lambda: requests.post(f"{base_url}/extract_user_data", json={"history": ONBOARDING}).json(), 10)
+    new = timed(lambda: backend.confirm_user_data(ONBOARDING), 10)
+    print(f"phase switch: /extract_user_data (new connection) p50 {statistics.median(old) * 1000:.1f} ms | "
+          f"/confirm_user_data (pooled) p50 {statistics.median(new) * 1000:.1f} ms")
+    backend.close()
+    app_server.should_exit = True
+    stub_server.should_exit = True
+
+if __name__ == "__main__":
+    main()
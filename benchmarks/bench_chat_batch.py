@@ -0,0 +1,125 @@
+# benchmarks/bench_chat_batch.py
+"""
+Bulk Q&A benchmark over HTTP against local stubs: the standalone questions of
+fixtures/qa_conversations.json for every kupa and tier (--items of them), sent
+as sequential /chat calls vs one /chat/batch request. Reports wall time, time
+to the first NDJSON line, the upstream calls reaching the stubs and the
+per-item stage timings of the batch.
+
+    python benchmarks/bench_chat_batch.py --items 90 --concurrency 8
+"""
+import argparse
+import importlib
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "qa_conversations.json")
+KUPOT = ("מכבי", "מאוחדת", "כללית")
+TIERS = ("זהב", "כסף", "ארד")
+
+def build_items(n):
+    with open(FIXTURES, encoding="utf-8") as f:
+        conversations = json.load(f)
+    questions = [t["user"] for c in conversations for t in c["turns"] if t["route"] == "retrieve"]
+    combos = itertools.cycle(itertools.product(questions, KUPOT, TIERS))
+    return [{"id": f"q{i}", "question": q, "user_data": {"hmo_name": kupa, "membership_tier": tier}}
+            for i, (q, kupa, tier) in zip(range(n), combos)]
+
+def fresh_server():
+    """
+    A newly imported server (empty caches) on a uvicorn thread, once ready.
+    """
+    import server
+    server = importlib.reload(server)
+    logging.getLogger().setLevel(logging.WARNING)
+    base_url, app_server = start_in_thread(server.create_app())
+    while requests.get(f"{base_url}/healthz").status_code != 200:
+        time.sleep(0.05)
+    return base_url, app_server
+
+def sequential(base_url, items):
+    with requests.Session() as session:
+        for item in items:
+            session.post(f"{base_url}/chat", json={
+                "history": [{"role": "user", "content": item["question"]}],
+                "phase": "qa",
+                "user_data": item["user_data"],
+            }).raise_for_status()
+    return None, []
+
+def batch(base_url, items):
+    t0 = time.perf_counter()
+    first, results = None, []
+    with requests.post(f"{base_url}/chat/batch", json={"items": items}, stream=True) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if line:
+                first = first or time.perf_counter() - t0
+                results.append(json.loads(line))
+    return first, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=90)
+    parser.add_argument("--concurrency", type=int, default=8, help="CHAT_BATCH_CONCURRENCY")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--query-latency", type=float, default=0.03)
+    args = parser.parse_args()
+
+    os.environ["ANSWER_CACHE_ENABLED"] = "0"
+    os.environ["CHAT_BATCH_CONCURRENCY"] = str(args.concurrency)
+    stub = create_stub_app(args.embed_latency, args.chat_latency, args.query_latency)
+    base_url, stub_server = start_in_thread(stub)
+    point_env_at(base_url)
+    items = build_items(args.items)
+
+    runs, app_servers = {}, []
+    for label, fn in (("sequential /chat", sequential), ("/chat/batch", batch)):
+        # The reloaded module shares its globals with the previous app: stopping
+        # that app would close the new clients, so all apps stop at the end
+        base_url, app_server = fresh_server()
+        app_servers.append(app_server)
+        stub.state.stats.reset()
+        t0 = time.perf_counter()
+        first, results = fn(base_url, items)
+        runs[label] = (time.perf_counter() - t0, first, dict(stub.state.stats.calls))
+    for app_server in app_servers + [stub_server]:
+        app_server.should_exit = True
+    seq_wall, batch_wall = runs["sequential /chat"][0], runs["/chat/batch"][0]
+
+    summary = results[-1]
+    answered = [r for r in results[:-1] if "answer" in r]
+    print(f"{len(items)} questions, {len(summary['groups'])} (namespace, maslul) groups, "
+          f"completion concurrency {args.concurrency}")
+    print(f"{'':<16} {'wall s':>7} {'first line s':>13} {'embeddings':>11} {'query':>6} {'chat':>5}")
+    for label, (wall, first_line, calls) in runs.items():
+        first_text = f"{first_line:13.2f}" if first_line is not None else f"{'-':>13}"
+        print(f"{label:<16} {wall:7.2f} {first_text} {calls.get('embeddings', 0):11d} "
+              f"{calls.get('query', 0):6d} {calls.get('chat', 0):5d}")
+    print(f"speed-up {seq_wall / batch_wall:.1f}x | {len(answered)} answered, {summary['errors']} errors | "
+          f"embedded {summary['embedded_queries']} queries in {summary['embedding_calls']} call(s)")
+    retrievals = {}
+    for r in answered:
+        retrievals[r["retrieval"]] = retrievals.get(r["retrieval"], 0) + 1
+    print("items by retrieval path:", retrievals)
+    stages = sorted({s for r in answered for s in r["timings"]["stages_ms"]})
+    for stage in stages:
+        values = [r["timings"]["stages_ms"][stage] for r in answered if stage in r["timings"]["stages_ms"]]
+        print(f"  {stage:<12} p50 {statistics.median(values):8.1f} ms | max {max(values):8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_chat_concurrency.py
+"""
+Load benchmark for /chat against local stub services.
+Fires N concurrent QA-phase requests and compares wall time with the serial
+cost (N x single-request latency). With a non-blocking server the requests
+overlap and the stub's peak in-flight count approaches N.
+
+    python benchmarks/bench_chat_concurrency.py --requests 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_services import create_stub_app, start_in_thread
+
+USER_DATA = {"hmo_name": "מכבי", "membership_tier": "זהב"}
+QUESTION = "כמה עולה טיפול שיניים?"
+
+def point_env_at(base_url):
+    os.environ["AZURE_OPENAI_ENDPOINT"] = base_url
+    os.environ["AZURE_OPENAI_KEY1"] = "stub"
+    os.environ["AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT"] = "stub-embeddings"
+    os.environ["PINECONE_API_KEY"] = "stub"
+    os.environ["PINECONE_HOST"] = base_url
+
+async def run(n_requests):
+    import httpx
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+    await server.ensure_ready()
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://server", timeout=120) as c:
+        payload = {
+            "history": [{"role": "user", "content": QUESTION}],
+            "phase": "qa",
+            "user_data": USER_DATA,
+        }
+        # Warm-up (connection pool, first-call overhead)
+        t0 = time.perf_counter()
+        await c.post("/chat", json=payload)
+        single = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        responses = await asyncio.gather(*[c.post("/chat", json=payload) for _ in range(n_requests)])
+        wall = time.perf_counter() - t0
+    await server.client.close()
+    ok = sum(r.status_code == 200 for r in responses)
+    return single, wall, ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--query-latency", type=float, default=0.03)
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="keep the semantic answer cache on (identical questions then skip gpt-4o)")
+    args = parser.parse_args()
+    os.environ["ANSWER_CACHE_ENABLED"] = "1" if args.answer_cache else "0"
+
+    stub = create_stub_app(args.embed_latency, args.chat_latency, args.query_latency)
+    base_url, stub_server = start_in_thread(stub)
+    point_env_at(base_url)
+
+    single, wall, ok = asyncio.run(run(args.requests))
+    stub_server.should_exit = True
+
+    stats = stub.state.stats
+    serial = single * args.requests
+    print(f"requests:              {args.requests} ({ok} ok)")
+    print(f"single request:        {single * 1000:.1f} ms")
+    print(f"serial estimate:       {serial:.2f} s")
+    print(f"concurrent wall time:  {wall:.2f} s")
+    print(f"overlap factor:        {serial / wall:.1f}x")
+    print(f"peak upstream in-flight: {stats.peak_in_flight}")
+    print(f"upstream calls:        {stats.calls}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/bench_coalescing.py
+"""
+Traffic-spike benchmark for request coalescing: --requests concurrent QA
+/chat requests over a few distinct questions (e.g. after a campaign about
+dental benefits), with REQUEST_COALESCING off and on. Counts the embedding
+and vector-query calls reaching the stubs; with coalescing there must be at
+most one per unique question (exits non-zero otherwise, or on a failed request).
+
+    python benchmarks/bench_coalescing.py --requests 100
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at, USER_DATA
+
+# Questions answered by RAG (no single service named, so the structured lookup falls through)
+SPIKE_QUESTIONS = [
+    "כמה עולה טיפול שיניים?",
+    "מה מגיע לי על טיפולים?",
+    "What discounts do I get for dental care?",
+]
+
+async def spike(stub, n_requests, enabled):
+    import httpx
+    os.environ["REQUEST_COALESCING"] = "1" if enabled else "0"
+    import server
+    server = importlib.reload(server)
+    logging.getLogger().setLevel(logging.WARNING)
+    await server.ensure_ready()
+    stub.state.stats.reset()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://server", timeout=120) as c:
+        t0 = time.perf_counter()
+        responses = await asyncio.gather(*[
+            c.post("/chat", json={
+                "history": [{"role": "user", "content": SPIKE_QUESTIONS[i % len(SPIKE_QUESTIONS)]}],
+                "phase": "qa",
+                "user_data": USER_DATA,
+            })
+            for i in range(n_requests)
+        ])
+        wall = time.perf_counter() - t0
+        stats = (await c.get("/cache_stats")).json()["coalescing"]
+    await server.client.close()
+    ok = sum(r.status_code == 200 for r in responses)
+    return wall, ok, dict(stub.state.stats.calls), stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    os.environ["ANSWER_CACHE_ENABLED"] = "0"
+    stub = create_stub_app(embed_latency=0.05, chat_latency=0.3, query_latency=0.03)
+    base_url, stub_server = start_in_thread(stub)
+    point_env_at(base_url)
+
+    unique = min(args.requests, len(SPIKE_QUESTIONS))
+    print(f"{args.requests} concurrent requests, {unique} unique questions")
+    failures = []
+    for enabled in (False, True):
+        wall, ok, calls, stats = asyncio.run(spike(stub, args.requests, enabled))
+        print(f"coalescing {'on ' if enabled else 'off'}: {ok}/{args.requests} ok in {wall:.2f} s | "
+              f"upstream embeddings={calls.get('embeddings', 0)} query={calls.get('query', 0)} "
+              f"chat={calls.get('chat', 0)} | coalesced embedding={stats['embedding']['coalesced']} "
+              f"retrieval={stats['retrieval']['coalesced']}")
+        if ok != args.requests:
+            failures.append(f"coalescing {'on' if enabled else 'off'}: {args.requests - ok} failed requests")
+        for kind in ("embeddings", "query"):
+            if enabled and calls.get(kind, 0) > unique:
+                failures.append(f"coalescing on: {calls[kind]} upstream {kind} calls for {unique} unique questions")
+    stub_server.should_exit = True
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_context_assembly.py
+"""
+Micro-benchmark of RAG context assembly per request: the previous builder
+(page table lookup + f-string concatenation per row) vs joining the cached row
+snippets and the per-page blocks. Runs over top-4 BM25 retrievals
+for every sample question x kupa x maslul, checks both produce the same text,
+and reports CPU time and peak allocated bytes per call (tracemalloc).
+
+    python benchmarks/bench_context_assembly.py --repeat 2000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bm25_index import BM25Index
+from page_table import PageTable
+from records import KUPA_NAMESPACE_MAP, load_records
+from bench_structured_lookup import QUESTIONS
+
+def concat_context_text(page_table, retrieved_docs):
+    """
+    Context assembly before the pre-rendered snippets.
+    """
+    groups = {}
+    for c in retrieved_docs:
+        doc = page_table.resolve(c)
+        groups.setdefault((doc.get("intro", "").strip(), doc.get("kupa", "")), []).append(doc)
+
+    context_text = ""
+    for (intro, _), docs in groups.items():
+        if intro:
+            context_text += f"\nרקע: {intro}\n"
+        for d in docs:
+            context_text += f"● {d.get('service', '')} - {d.get('benefit', '')}\n"
+        if docs[0].get("phones"):
+            context_text += f"טלפון: {docs[0]['phones']}\n"
+        if docs[0].get("links"):
+            context_text += f"[לקישור לחץ כאן>>]({docs[0]['links']})\n"
+    return f"\nמידע רלוונטי מהידע שנשאב (RAG):\n{context_text}\n"
+
+def cpu_per_call(fn, retrievals, repeat):
+    t0 = time.process_time()
+    for _ in range(repeat):
+        for docs in retrievals:
+            fn(docs)
+    return (time.process_time() - t0) / (repeat * len(retrievals))
+
+def peak_bytes_per_call(fn, retrievals):
+    peaks = []
+    tracemalloc.start()
+    for docs in retrievals:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(docs)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return sum(peaks) / len(peaks)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    page_table = PageTable()
+    records = load_records(os.path.join(ROOT, "phase2_data"), page_table = page_table)
+
+    # Import the server for build_context_text; nothing is called on these placeholder endpoints
+    os.environ.update({"HYBRID_RETRIEVAL": "0", "STRUCTURED_LOOKUP": "0", "RETRIEVAL_BACKEND": "pinecone",
+                       "PINECONE_HOST": "http://127.0.0.1:9", "PINECONE_API_KEY": "x",
+                       "AZURE_OPENAI_ENDPOINT": "http://127.0.0.1:9", "AZURE_OPENAI_KEY1": "x",
+                       "KB_DATA_DIR": os.path.join(ROOT, "phase2_data"), "PARSE_CACHE_DIR": ""})
+    import server
+    server.page_table = page_table
+
+    bm25 = BM25Index.from_records(records)
+    retrievals = []
+    for question, _ in QUESTIONS:
+        for namespace in KUPA_NAMESPACE_MAP.values():
+            for maslul in ("זהב", "כסף", "ארד"):
+                docs = [m["metadata"] for m in bm25.search(question, namespace, maslul, top_k=4)]
+                if docs:
+                    retrievals.append(docs)
+
+    old = lambda docs: concat_context_text(page_table, docs)
+    new = server.build_context_text
+    mismatches = sum(old(docs) != new(docs) for docs in retrievals)
+    print(f"retrievals: {len(retrievals)} (top-4), identical context: {len(retrievals) - mismatches}/{len(retrievals)}")
+
+    for label, fn in (("concatenation", old), ("pre-rendered join", new)):
+        cpu = cpu_per_call(fn, retrievals, args.repeat)
+        peak = peak_bytes_per_call(fn, retrievals)
+        print(f"{label:<18} {cpu * 1e6:6.2f} us CPU / call   peak allocated {peak:7.0f} B / call")
+
+if __name__ == "__main__":
+    main()
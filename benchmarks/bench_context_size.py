@@ -0,0 +1,85 @@
+# benchmarks/bench_context_size.py
+"""
+Measures what moving page intros / kupa contacts into the page table saves:
+    - metadata bytes stored per service vector
+    - prompt tokens of the RAG context (intro repeated per row vs once per page)
+    - /chat response bytes (retrieved_docs with inline intros vs page_id + pages)
+over top-4 BM25 retrievals for every sample question x kupa x maslul.
+
+    python benchmarks/bench_context_size.py
+"""
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bm25_index import BM25Index
+from page_table import PageTable
+from records import KUPA_NAMESPACE_MAP, load_records
+from token_counter import count_tokens, tokenizer_name
+from bench_structured_lookup import QUESTIONS
+
+def inline_context_text(docs):
+    """
+    Context assembly before the page table: intro and contacts repeated per row.
+    """
+    context_text = ""
+    for c in docs:
+        intro = c.get('intro', '').strip()
+        intro_line = f"\nרקע: {intro}\n" if intro else ""
+        context_text += f"{intro_line}● {c.get('service', '')} - {c.get('benefit', '')}\n"
+        if c.get("phones"):
+            context_text += f"טלפון: {c['phones']}\n"
+        if c.get("links"):
+            context_text += f"[לקישור לחץ כאן>>]({c['links']})\n"
+    return f"\nמידע רלוונטי מהידע שנשאב (RAG):\n{context_text}\n"
+
+def json_bytes(value):
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+def main():
+    page_table = PageTable()
+    records = load_records(os.path.join(ROOT, "phase2_data"), page_table = page_table)
+    services = [r for r in records if r["metadata"].get("service")]
+
+    # Import the server for build_context_text; nothing is called on these placeholder endpoints
+    os.environ.update({"HYBRID_RETRIEVAL": "0", "STRUCTURED_LOOKUP": "0", "RETRIEVAL_BACKEND": "pinecone",
+                       "PINECONE_HOST": "http://127.0.0.1:9", "PINECONE_API_KEY": "x",
+                       "AZURE_OPENAI_ENDPOINT": "http://127.0.0.1:9", "AZURE_OPENAI_KEY1": "x",
+                       "KB_DATA_DIR": os.path.join(ROOT, "phase2_data"), "PARSE_CACHE_DIR": ""})
+    import server
+    server.page_table = page_table
+
+    inline_meta = sum(json_bytes(page_table.resolve(r["metadata"])) for r in services)
+    compact_meta = sum(json_bytes(r["metadata"]) for r in services)
+    print(f"service vectors: {len(services)}, pages: {len(page_table)}")
+    print(f"metadata bytes:  inline {inline_meta:,}  ->  page_id {compact_meta:,} "
+          f"+ page table {json_bytes(page_table.pages):,} "
+          f"({1 - (compact_meta + json_bytes(page_table.pages)) / inline_meta:.0%} smaller)")
+
+    bm25 = BM25Index.from_records(records)
+    totals = {"old_tokens": 0, "new_tokens": 0, "old_bytes": 0, "new_bytes": 0}
+    n = 0
+    for question, _ in QUESTIONS:
+        for namespace in KUPA_NAMESPACE_MAP.values():
+            for maslul in ("זהב", "כסף", "ארד"):
+                docs = [m["metadata"] for m in bm25.search(question, namespace, maslul, top_k=4)]
+                if not docs:
+                    continue
+                n += 1
+                inline_docs = [page_table.resolve(d) for d in docs]
+                totals["old_tokens"] += count_tokens(inline_context_text(inline_docs))
+                totals["new_tokens"] += count_tokens(server.build_context_text(docs))
+                totals["old_bytes"] += json_bytes({"retrieved_docs": inline_docs})
+                totals["new_bytes"] += json_bytes({"retrieved_docs": docs, "pages": server.referenced_pages(docs)})
+    print(f"\nretrievals: {n} (top-4), tokenizer: {tokenizer_name()}")
+    print(f"context tokens / turn:  {totals['old_tokens'] / n:7.1f}  ->  {totals['new_tokens'] / n:7.1f} "
+          f"({1 - totals['new_tokens'] / totals['old_tokens']:.0%} fewer)")
+    print(f"response bytes / turn:  {totals['old_bytes'] / n:7.0f}  ->  {totals['new_bytes'] / n:7.0f} "
+          f"({1 - totals['new_bytes'] / totals['old_bytes']:.0%} smaller)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/bench_embedding_batching.py
+"""
+Throughput of query embeddings under concurrency, one call per query vs
+micro-batched (EMBEDDING_BATCH_WINDOW_MS / EMBEDDING_MAX_BATCH). Sends
+--requests distinct queries from --concurrency workers through
+server.get_query_embedding against the stub, which charges a fixed latency
+per call plus a small per-input cost and returns 429 above --rate-limit
+calls per second (the client retries them).
+
+    python benchmarks/bench_embedding_batching.py --requests 400 --concurrency 64
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at
+
+async def run(stub, args, window_ms):
+    os.environ["EMBEDDING_BATCH_WINDOW_MS"] = str(window_ms)
+    os.environ["EMBEDDING_MAX_BATCH"] = str(args.max_batch)
+    import server
+    server = importlib.reload(server)
+    logging.getLogger().setLevel(logging.WARNING)
+    await server.ensure_ready()
+    stub.state.stats.reset()
+
+    queries = [f"שאלה מספר {i} על הטבות שיניים" for i in range(args.requests)]
+    latencies = []
+    next_query = 0
+
+    async def worker():
+        nonlocal next_query
+        while next_query < len(queries):
+            query = queries[next_query]
+            next_query += 1
+            t0 = time.perf_counter()
+            await server.get_query_embedding(query)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    wall = time.perf_counter() - t0
+    await server.client.close()
+    latencies.sort()
+    return {
+        "wall": wall,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "calls": stub.state.stats.calls.get("embeddings", 0),
+        "throttled": stub.state.stats.throttled,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--per-input-latency", type=float, default=0.001)
+    parser.add_argument("--rate-limit", type=float, default=100, help="stub embeddings calls/s before 429")
+    args = parser.parse_args()
+
+    stub = create_stub_app(embed_latency=args.embed_latency, embed_per_input_latency=args.per_input_latency,
+                           rate_limit=args.rate_limit)
+    base_url, stub_server = start_in_thread(stub)
+    point_env_at(base_url)
+    os.environ["STARTUP_WARM_UP"] = "0"
+
+    print(f"{args.requests} distinct queries, concurrency {args.concurrency}, stub limit {args.rate_limit:g} calls/s")
+    for label, window_ms in (("one call per query", 0), (f"batched ({args.window_ms:g} ms / {args.max_batch})", args.window_ms)):
+        r = asyncio.run(run(stub, args, window_ms))
+        print(f"{label:<26} {args.requests / r['wall']:7.0f} embeddings/s | p50 {r['p50'] * 1000:6.1f} ms "
+              f"p95 {r['p95'] * 1000:6.1f} ms | calls {r['calls']:4} | 429s {r['throttled']}")
+    stub_server.should_exit = True
+
+if __name__ == "__main__":
+    main()
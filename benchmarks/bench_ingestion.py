@@ -0,0 +1,67 @@
+# benchmarks/bench_ingestion.py
+"""
+Ingestion benchmark: per-chunk serial upload vs batched, concurrent upload,
+both against the local embedding/upsert stub.
+
+    python benchmarks/bench_ingestion.py --batch-size 64 --workers 4
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import create_stub_app, start_in_thread
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion pipeline benchmark")
+    parser.add_argument("--data-dir", default=os.path.join(ROOT, "phase2_data"))
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--upsert-latency", type=float, default=0.02)
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="stub returns 429 above this concurrency (exercises retries)")
+    args = parser.parse_args()
+
+    stub = create_stub_app(embed_latency=args.embed_latency, upsert_latency=args.upsert_latency,
+                           embed_per_input_latency=0.0005, max_in_flight=args.max_in_flight)
+    base_url, stub_server = start_in_thread(stub)
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": base_url,
+        "AZURE_OPENAI_KEY1": "stub",
+        "AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT": "stub-embeddings",
+        "PINECONE_API_KEY": "stub",
+        "PINECONE_HOST": base_url,
+        "INGEST_RETRY_BASE_DELAY": "0.05",
+    })
+
+    import upload_to_pinecone
+    from parse_html import parse_services_html
+
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(args.data_dir, "*.html"))):
+        chunks.extend(parse_services_html(path))
+
+    results = {}
+    for label, batch_size, workers in [("serial (1 x 1)", 1, 1),
+                                       (f"batched ({args.batch_size} x {args.workers})", args.batch_size, args.workers)]:
+        stub.state.stats.reset()
+        t0 = time.perf_counter()
+        records = upload_to_pinecone.upload_chunks_to_pinecone(chunks, embed_batch_size=batch_size, workers=workers)
+        elapsed = time.perf_counter() - t0
+        results[label] = (elapsed, len(records), dict(stub.state.stats.calls), stub.state.stats.throttled)
+
+    stub_server.should_exit = True
+    print()
+    for label, (elapsed, n, calls, throttled) in results.items():
+        print(f"{label:<22} {elapsed:6.2f} s  {n / elapsed:7.1f} chunks/sec  calls={calls}  429s={throttled}")
+    serial = results["serial (1 x 1)"][0]
+    batched = list(results.values())[1][0]
+    print(f"speedup: {serial / batched:.1f}x")
+
+if __name__ == "__main__":
+    main()
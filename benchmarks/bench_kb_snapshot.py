@@ -0,0 +1,110 @@
+# benchmarks/bench_kb_snapshot.py
+"""
+KB snapshot benchmark. The parsed knowledge base (x --copies, with random
+embeddings of --dim floats) is saved as raw float32 JSON and as float16 / int8
+snapshots. Reports:
+    - on-disk size and load time (JSON parse vs snapshot open + full decode)
+    - top-4 agreement of the dequantized vectors with float32
+    - the server's KB load: parsing the HTML files vs reading the snapshot
+    - re-seeding the stub Pinecone from the snapshot of the base KB (upstream calls)
+
+    python benchmarks/bench_kb_snapshot.py --copies 10
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import create_stub_app, start_in_thread
+from kb_snapshot import KBSnapshot, write_snapshot
+from page_table import PageTable
+from records import load_records
+
+def best_of(fn, runs = 5):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+def top_k_agreement(exact, approx, queries, k = 4):
+    exact = exact / np.linalg.norm(exact, axis=1, keepdims=True)
+    approx = approx / np.linalg.norm(approx, axis=1, keepdims=True)
+    overlaps = []
+    for q in queries:
+        a = set(np.argsort(-(exact @ q))[:k])
+        b = set(np.argsort(-(approx @ q))[:k])
+        overlaps.append(len(a & b) / k)
+    return statistics.mean(overlaps)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    page_table = PageTable()
+    base = load_records(os.path.join(ROOT, "phase2_data"), page_table = page_table)
+    rng = np.random.default_rng(0)
+    records = []
+    for copy in range(args.copies):
+        for r in base:
+            text = r["text"] if copy == 0 else f"{r['text']} #{copy}"
+            records.append({**r, "id": f"{r['id']}_{copy}", "text": text,
+                            "values": rng.standard_normal(args.dim, dtype=np.float32).tolist()})
+    exact = np.asarray([r["values"] for r in records], dtype=np.float32)
+    queries = exact[rng.choice(len(exact), 50, replace=False)] + rng.normal(0, 0.02, (50, args.dim))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "kb.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"records": records, "pages": page_table.pages}, f, ensure_ascii=False)
+
+        def load_json():
+            with open(json_path, encoding="utf-8") as f:
+                return json.load(f)
+
+        print(f"{len(records)} chunks x {args.dim} dims")
+        print(f"{'format':<16} {'size MB':>8} {'open ms':>8} {'full load ms':>13} {'top-4 agreement':>16}")
+        json_ms = best_of(load_json) * 1000
+        print(f"{'float32 JSON':<16} {os.path.getsize(json_path) / 1e6:8.1f} {json_ms:8.1f} {json_ms:13.1f} {1.0:16.3f}")
+        for dtype in ("float16", "int8"):
+            path = os.path.join(tmp, f"kb_{dtype}.kbs")
+            write_snapshot(path, records, page_table, dtype, "stub-embeddings")
+            open_ms = best_of(lambda: KBSnapshot.load(path)) * 1000
+            full_ms = best_of(lambda: list(KBSnapshot.load(path).records())) * 1000
+            agreement = top_k_agreement(exact, KBSnapshot.load(path).embeddings(), queries)
+            print(f"{dtype + ' snapshot':<16} {os.path.getsize(path) / 1e6:8.1f} {open_ms:8.1f} {full_ms:13.1f} {agreement:16.3f}")
+
+        # What the server needs at startup (records without vectors + page table)
+        snapshot_path = os.path.join(tmp, "kb_base.kbs")
+        n_base = len(base)
+        write_snapshot(snapshot_path, records[:n_base], page_table, "float16", "stub-embeddings")
+        parse_ms = best_of(lambda: load_records(os.path.join(ROOT, "phase2_data"), "", PageTable()), 3) * 1000
+        snap_ms = best_of(lambda: (list(KBSnapshot.load(snapshot_path).records(with_values = False)),
+                                    KBSnapshot.load(snapshot_path).page_table()), 3) * 1000
+        print(f"\nserver KB load ({n_base} chunks): parse HTML {parse_ms:.1f} ms | snapshot {snap_ms:.1f} ms")
+
+        # Re-seed the (stub) Pinecone index from the snapshot
+        stub = create_stub_app(upsert_latency=0.005)
+        base_url, stub_server = start_in_thread(stub)
+        os.environ.update({"AZURE_OPENAI_ENDPOINT": base_url, "AZURE_OPENAI_KEY1": "stub",
+                           "AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT": "stub-embeddings",
+                           "PINECONE_API_KEY": "stub", "PINECONE_HOST": base_url})
+        import upload_to_pinecone
+        stub.state.stats.reset()
+        upload_to_pinecone.seed_from_snapshot(KBSnapshot.load(snapshot_path))
+        print(f"re-seed from snapshot: upstream calls {dict(stub.state.stats.calls)}")
+        stub_server.should_exit = True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# benchmarks/bench_load.py
+"""
+Load test for /chat (QA and user-info phases, plain and streaming) and
+/extract_user_data. Each scenario runs --requests requests from --concurrency
+closed-loop workers and reports throughput and p50/p95/p99 latency.
+
+By default the server runs in-process against the local stand-ins
+(stub_services.py), with configurable upstream latency, jitter and rate limit,
+so it needs no network access or API keys. --server-url drives a running
+server over HTTP instead.
+
+    python benchmarks/bench_load.py --concurrency 16 --requests 200
+    python benchmarks/bench_load.py --scenarios qa,extract --rate-limit 50 --jitter 0.3
+    python benchmarks/bench_load.py --server-url http://localhost:8000 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at, USER_DATA
+from bench_structured_lookup import QUESTIONS
+
+FIXTURES = os.path.join(HERE, "fixtures", "user_info_conversations.json")
+SCENARIOS = ["qa", "qa_stream", "user_info", "extract"]
+ERROR_ANSWER = "Internal server error. Please try again later."
+
+def load_conversations():
+    with open(FIXTURES, encoding="utf-8") as f:
+        return [case["history"] for case in json.load(f)]
+
+def build_payloads(scenario, conversations):
+    """
+    (path, json body, streaming) per request, cycled by the workers.
+    """
+    if scenario in ("qa", "qa_stream"):
+        path = "/chat/stream" if scenario == "qa_stream" else "/chat"
+        return [(path, {"history": [{"role": "user", "content": q}], "phase": "qa", "user_data": USER_DATA},
+                 scenario == "qa_stream") for q, _ in QUESTIONS]
+    if scenario == "user_info":
+        # Mid-onboarding: the history up to (and including) a user message
+        payloads = []
+        for history in conversations:
+            last_user = max(i for i, m in enumerate(history) if m["role"] == "user")
+            payloads.append(("/chat", {"history": history[:last_user + 1], "phase": "user_info", "user_data": {}}, False))
+        return payloads
+    if scenario == "extract":
+        return [("/extract_user_data", {"history": history}, False) for history in conversations]
+    raise ValueError(f"unknown scenario: {scenario}")
+
+async def send(c, path, body, streaming):
+    """
+    Returns (ok, latency, time to first token or None).
+    """
+    t0 = time.perf_counter()
+    if not streaming:
+        r = await c.post(path, json=body)
+        ok = r.status_code == 200 and r.json().get("answer") != ERROR_ANSWER
+        return ok, time.perf_counter() - t0, None
+    ttft = None
+    ok = True
+    async with c.stream("POST", path, json=body) as r:
+        ok = r.status_code == 200
+        async for line in r.aiter_lines():
+            if line == "event: token" and ttft is None:
+                ttft = time.perf_counter() - t0
+            elif line == "event: error":
+                ok = False
+    return ok, time.perf_counter() - t0, ttft
+
+async def run_scenario(c, scenario, payloads, n_requests, concurrency):
+    latencies, ttfts = [], []
+    errors = 0
+    next_request = 0
+
+    async def worker():
+        nonlocal next_request, errors
+        while next_request < n_requests:
+            path, body, streaming = payloads[next_request % len(payloads)]
+            next_request += 1
+            try:
+                ok, latency, ttft = await send(c, path, body, streaming)
+            except Exception:
+                ok, latency, ttft = False, None, None
+            if not ok:
+                errors += 1
+            if latency is not None:
+                latencies.append(latency)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - t0
+    return {
+        "scenario": scenario,
+        "requests": n_requests,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(n_requests / wall, 2),
+        "latency_ms": percentiles(latencies),
+        "ttft_ms": percentiles(ttfts) if ttfts else None,
+    }
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return {"p50": round(pick(0.50), 1), "p95": round(pick(0.95), 1), "p99": round(pick(0.99), 1)}
+
+def start_server(args):
+    """
+    Imports the server (pointed at the stand-ins) and serves it on a local port.
+    Real HTTP, so streamed responses arrive incrementally (ASGITransport buffers them).
+    """
+    import httpx
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+    # Upstream connection pool sized by the harness
+    server.use_clients(openai_client=server.build_openai_client(httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections),
+        timeout=120
+    )))
+    return start_in_thread(server.app)
+
+async def run(args, base_url, stub):
+    import httpx
+    conversations = load_conversations()
+    results = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as c:
+        for scenario in args.scenarios.split(","):
+            payloads = build_payloads(scenario, conversations)
+            # Warm-up: connection pools and first-call overhead
+            await send(c, *payloads[0])
+            if stub is not None:
+                stub.state.stats.reset()
+            result = await run_scenario(c, scenario, payloads, args.requests, args.concurrency)
+            if stub is not None:
+                stats = stub.state.stats
+                result["upstream"] = {"calls": dict(stats.calls), "throttled": stats.throttled,
+                                      "peak_in_flight": stats.peak_in_flight}
+            results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--server-url", default="", help="drive a running server instead of an in-process one")
+    parser.add_argument("--connections", type=int, default=100, help="in-process: upstream HTTP connections")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--query-latency", type=float, default=0.03)
+    parser.add_argument("--jitter", type=float, default=0.2, help="upstream latency spread (+/- fraction)")
+    parser.add_argument("--rate-limit", type=float, default=None, help="upstream requests/s before HTTP 429")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache on")
+    parser.add_argument("--json", default="", help="also write the results to this file")
+    args = parser.parse_args()
+
+    stub = None
+    base_url = args.server_url
+    if not base_url:
+        if not args.answer_cache:
+            # Repeated questions would otherwise be answered from the cache after the first round
+            os.environ["ANSWER_CACHE_ENABLED"] = "0"
+        stub = create_stub_app(args.embed_latency, args.chat_latency, args.query_latency,
+                               rate_limit=args.rate_limit, jitter=args.jitter)
+        stub_url, stub_server = start_in_thread(stub)
+        point_env_at(stub_url)
+        base_url, app_server = start_server(args)
+
+    results = asyncio.run(run(args, base_url, stub))
+    if stub is not None:
+        app_server.should_exit = stub_server.should_exit = True
+
+    print(f"\nconcurrency {args.concurrency}, {args.requests} requests per scenario")
+    print(f"{'scenario':<10} {'req/s':>7} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttft p50':>9} {'throttled':>9}")
+    for r in results:
+        lat = r["latency_ms"]
+        ttft = f"{r['ttft_ms']['p50']:.1f}" if r["ttft_ms"] else "-"
+        throttled = r.get("upstream", {}).get("throttled", "-")
+        print(f"{r['scenario']:<10} {r['throughput_rps']:>7.1f} {r['errors']:>6} {lat.get('p50', 0):>8.1f} "
+              f"{lat.get('p95', 0):>8.1f} {lat.get('p99', 0):>8.1f} {ttft:>9} {throttled:>9}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_local_index.py
+"""
+Micro-benchmark for the local vector index (RETRIEVAL_BACKEND=local).
+Builds an index from the real phase2_data chunks with deterministic stub
+embeddings, loads it memory-mapped and times filtered top-k queries.
+
+    python benchmarks/bench_local_index.py --queries 2000
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import fake_embedding
+from parse_html import parse_services_html
+from local_index import LocalVectorIndex, save_local_index
+
+KUPA_NAMESPACE_MAP = {"מכבי": "maccabi", "מאוחדת": "meuhedet", "כללית": "clalit"}
+
+def build_records(data_dir):
+    records = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.html"))):
+        for i, chunk in enumerate(parse_services_html(path)):
+            if chunk["chunk_type"] != "service":
+                continue
+            text = f"{chunk['service']} - {chunk['benefit']}"
+            records.append({
+                "id": f"{os.path.basename(path)}_{i}",
+                "namespace": KUPA_NAMESPACE_MAP[chunk["kupa"]],
+                "values": fake_embedding(text),
+                "metadata": {"service": chunk["service"], "benefit": chunk["benefit"],
+                             "maslul": chunk["maslul"], "kupa": chunk["kupa"]},
+            })
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="Local vector index benchmark")
+    parser.add_argument("--data-dir", default=os.path.join(ROOT, "phase2_data"))
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+
+    records = build_records(args.data_dir)
+    with tempfile.TemporaryDirectory() as index_dir:
+        save_local_index(records, index_dir)
+        t0 = time.perf_counter()
+        index = LocalVectorIndex.load(index_dir)
+        load_ms = (time.perf_counter() - t0) * 1000
+
+        queries = [fake_embedding(f"query {i}") for i in range(64)]
+        namespaces = list(KUPA_NAMESPACE_MAP.values())
+        masluls = ["זהב", "כסף", "ארד"]
+        t0 = time.perf_counter()
+        for i in range(args.queries):
+            index.query(queries[i % len(queries)], top_k=args.top_k,
+                        namespace=namespaces[i % 3], maslul=masluls[(i // 3) % 3])
+        per_query_us = (time.perf_counter() - t0) / args.queries * 1e6
+
+    print(f"vectors:          {len(records)}")
+    print(f"load (mmap):      {load_ms:.2f} ms")
+    print(f"query top-{args.top_k}:      {per_query_us:.1f} us/query")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# benchmarks/bench_parse_html.py
+"""
+Benchmark for parse_html.parse_services_html on a synthetically enlarged corpus.
+Each phase2_data page is copied with its table rows repeated (renamed so
+service names stay unique), then parsed with:
+    - the previous BeautifulSoup implementation (reference, below)
+    - the single-pass parser with the stdlib and the lxml backend
+    - ParsedChunkCache, cold and warm
+    - iter_services_chunks on a process pool (--copies multiplies the files)
+Outputs are checked against the reference.
+
+    python benchmarks/bench_parse_html.py --row-factor 50
+    python benchmarks/bench_parse_html.py --row-factor 20 --copies 20 --parse-workers 4
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from parse_html import ParsedChunkCache, extract_kupa_contacts, iter_services_chunks, parse_services_html
+
+def parse_services_html_bs4(file_path):
+    """
+    The BeautifulSoup (html.parser) implementation this benchmark compares against.
+    """
+    from bs4 import BeautifulSoup
+    with open(file_path, encoding="utf-8") as f:
+        soup = BeautifulSoup(f, "html.parser")
+
+    all_chunks = []
+    intro_text = ""
+    tables = soup.find_all("table")
+    first_table = tables[0] if tables else None
+    last_table = tables[-1] if tables else None
+    if first_table:
+        intro = ""
+        for elem in first_table.find_all_previous():
+            if elem.name == 'body':
+                break
+            if elem.string and elem.string.strip():
+                intro = elem.string.strip() + "\n" + intro
+        if intro.strip():
+            intro_text = intro.strip()
+            all_chunks.append({"chunk_type": "intro", "text": intro_text})
+    intro_title = intro_text.splitlines()[0].strip() if intro_text else ""
+    for table in tables:
+        headers = [th.text.strip() for th in table.find_all("th")]
+        if not any(kupa in headers for kupa in ["מכבי", "מאוחדת", "כללית"]):
+            continue
+        for row in table.find_all("tr")[1:]:
+            cells = row.find_all("td")
+            if not cells or len(cells) != 4:
+                continue
+            base_service = cells[0].text.strip()
+            service_with_intro = base_service
+            if intro_title and intro_title not in base_service:
+                service_with_intro = f"{base_service} {intro_title}"
+            for i, kupa in enumerate(["מכבי", "מאוחדת", "כללית"]):
+                raw_txt = cells[i+1].text.strip().replace("\n", " ")
+                for maslul in ["זהב", "כסף", "ארד"]:
+                    match = re.search(rf"{maslul}:(.*?)(?:(?:זהב|כסף|ארד):|$)", raw_txt)
+                    if match:
+                        all_chunks.append({
+                            "chunk_type": "service", "kupa": kupa, "maslul": maslul,
+                            "service": service_with_intro,
+                            "benefit": match.group(1).strip().replace("•", "-"),
+                            "intro": intro_text
+                        })
+    outro = ""
+    if last_table:
+        for elem in last_table.find_all_next():
+            if elem.name == 'body':
+                break
+            if elem.name in ['p', 'div'] and elem.get_text(strip=True):
+                outro += elem.get_text(strip=True) + "\n"
+            if elem.name == 'a' and elem.get('href'):
+                outro += f"{elem.get_text(strip=True)}: {elem.get('href')}\n"
+        if outro.strip():
+            all_chunks.append({"chunk_type": "outro", "text": outro.strip()})
+    kupa_contacts = extract_kupa_contacts(outro)
+    for chunk in all_chunks:
+        if chunk.get("chunk_type") == "service":
+            chunk["kupa_contacts"] = kupa_contacts.get(chunk["kupa"], {})
+    return all_chunks
+
+ROW_RE = re.compile(r"(<tr>\s*<td>)(.*?)(</td>.*?</tr>)", re.S)
+
+def build_corpus(out_dir, row_factor, copies = 1):
+    """
+    Writes enlarged copies of phase2_data/*.html (every data row repeated row_factor
+    times), `copies` times each.
+    """
+    paths = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "phase2_data", "*.html"))) * copies:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        rows = ROW_RE.findall(html)
+        enlarged = "".join(
+            f"{head}{service} {n}{tail}\n" for n in range(row_factor) for head, service, tail in rows
+        )
+        last_row_end = html.rfind("</tr>") + len("</tr>")
+        html = html[:last_row_end] + "\n" + enlarged + html[last_row_end:]
+        out_path = os.path.join(out_dir, f"{len(paths)}_{os.path.basename(path)}")
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(html)
+        paths.append(out_path)
+    return paths
+
+def timed(fn, paths):
+    t0 = time.perf_counter()
+    results = [fn(p) for p in paths]
+    return time.perf_counter() - t0, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--row-factor", type=int, default=50, help="copies of every table row")
+    parser.add_argument("--copies", type=int, default=1, help="copies of every page")
+    parser.add_argument("--parse-workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_corpus(tmp, args.row_factor, args.copies)
+        size_kb = sum(os.path.getsize(p) for p in paths) / 1024
+
+        bs4_time, reference = timed(parse_services_html_bs4, paths)
+        n_chunks = sum(len(r) for r in reference)
+        print(f"corpus: {len(paths)} files, {size_kb:.0f} KB, {n_chunks} chunks")
+        print(f"{'BeautifulSoup (previous)':<28} {bs4_time * 1000:8.1f} ms")
+
+        backends = ["html.parser"]
+        try:
+            import lxml  # noqa: F401
+            backends.append("lxml")
+        except ImportError:
+            print("lxml not installed, skipping the lxml backend")
+        for backend in backends:
+            elapsed, results = timed(lambda p: parse_services_html(p, backend), paths)
+            same = "identical" if results == reference else "DIFFERENT"
+            print(f"{'single-pass ' + backend:<28} {elapsed * 1000:8.1f} ms  "
+                  f"{bs4_time / elapsed:5.1f}x  {same}")
+
+        cache_dir = os.path.join(tmp, "parse_cache")
+        for label in ("cache (cold)", "cache (warm)"):
+            t0 = time.perf_counter()
+            cache = ParsedChunkCache(cache_dir)
+            results = [cache.get_chunks(p) for p in paths]
+            elapsed = time.perf_counter() - t0
+            same = "identical" if results == reference else "DIFFERENT"
+            print(f"{label:<28} {elapsed * 1000:8.1f} ms  {bs4_time / elapsed:5.1f}x  {same}  "
+                  f"hits={cache.hits} misses={cache.misses}")
+
+        # A touched file (new mtime, same bytes) is still served from the cache via its hash
+        os.utime(paths[0])
+        cache = ParsedChunkCache(cache_dir)
+        timed(cache.get_chunks, paths)
+        print(f"after touching one file:      hits={cache.hits} misses={cache.misses}")
+
+        # Streaming through the process pool: the consumer only sees one file's chunks at a time
+        print()
+        for workers in sorted({1, args.parse_workers}):
+            t0 = time.perf_counter()
+            count = sum(1 for _ in iter_services_chunks(paths, workers = workers))
+            elapsed = time.perf_counter() - t0
+            tracemalloc.start()
+            sum(1 for _ in iter_services_chunks(paths, workers = workers))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{'iter_services_chunks x' + str(workers):<28} {elapsed * 1000:8.1f} ms  "
+                  f"{count / elapsed:8.0f} chunks/sec  peak {peak / 2**20:6.1f} MiB (consumer)")
+        tracemalloc.start()
+        all_chunks = [c for p in paths for c in parse_services_html(p)]
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{'list of all chunks':<28} {'':>8}     {len(all_chunks):8d} chunks      peak {peak / 2**20:6.1f} MiB")
+
+if __name__ == "__main__":
+    main()
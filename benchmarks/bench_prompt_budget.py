@@ -0,0 +1,90 @@
+# benchmarks/bench_prompt_budget.py
+"""
+Prompt size per turn over a long QA session, with the full history replayed
+(onboarding dialogue included) vs the budgeted prompt (profile line + summary
++ last HISTORY_KEEP_MESSAGES messages). Runs prepare_chat_turn against the
+local stubs; the stub chat model produces the rolling summaries. The budgeted
+total includes the summarization calls (their prompt plus the completion cap,
+SUMMARY_MAX_TOKENS), counted with the same tokenizer.
+
+    python benchmarks/bench_prompt_budget.py --turns 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at
+from bench_structured_lookup import QUESTIONS
+from token_counter import count_message_tokens, tokenizer_name
+
+FIXTURES = os.path.join(HERE, "fixtures", "user_info_conversations.json")
+CONFIRMED = {"role": "assistant", "content": "תודה! הפרטים נקלטו בהצלחה. כעת אפשר לשאול שאלות על ההטבות והכיסויים במסלול שלך."}
+ANSWER_CHARS = 400  # a bot answer quoting part of the retrieved context
+
+async def run(turns):
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+    await server.ensure_ready()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        case = next(c for c in json.load(f) if c["name"] == "en_step_by_step_summary")
+    user_data = case["expected"]
+    history = case["history"] + [CONFIRMED]
+
+    summary_calls = []      # tokens of each summarization call
+    summarize = server.history_compactor.summarize
+
+    async def counted_summarize(previous_summary, messages):
+        summary_calls.append(count_message_tokens(server.summary_prompt(previous_summary, messages))
+                             + server.SUMMARY_MAX_TOKENS)
+        return await summarize(previous_summary, messages)
+
+    server.history_compactor.summarize = counted_summarize
+
+    rows = []
+    for i in range(turns):
+        history.append({"role": "user", "content": QUESTIONS[i % len(QUESTIONS)][0]})
+        turn = await server.prepare_chat_turn(list(history), "qa", user_data)
+        context = [m for m in turn["messages"] if m["role"] == "assistant" and "(RAG)" in m["content"]]
+        full = count_message_tokens([turn["messages"][0]] + history + context)
+        rows.append((i + 1, full, turn["prompt_stats"]))
+        answer = context[0]["content"][:ANSWER_CHARS] if context else "אין לי מידע על כך."
+        history.append({"role": "assistant", "content": answer})
+        # Users take longer to type than the summary takes to produce
+        await server.history_compactor.wait_for_summaries()
+    await server.client.close()
+    return rows, summary_calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["ANSWER_CACHE_ENABLED"] = "0"
+    stub = create_stub_app(0.0, 0.0, 0.0)
+    base_url, stub_server = start_in_thread(stub)
+    point_env_at(base_url)
+    rows, summary_calls = asyncio.run(run(args.turns))
+    stub_server.should_exit = True
+
+    print(f"tokenizer: {tokenizer_name()}")
+    print(f"{'turn':>4} {'full history':>13} {'budgeted':>9} {'context':>8} {'summary':>8} {'kept':>5} {'summarized':>10}")
+    for n, full, s in rows:
+        print(f"{n:>4} {full:>13} {s['prompt_tokens']:>9} {s['context_tokens']:>8} {s['summary_tokens']:>8} "
+              f"{s['kept_messages']:>5} {s['summarized_messages']:>10}")
+    total_full = sum(r[1] for r in rows)
+    total_prompts = sum(r[2]["prompt_tokens"] for r in rows)
+    total_budgeted = total_prompts + sum(summary_calls)
+    print(f"\nsummarization calls: {len(summary_calls)} ({sum(summary_calls):,} tokens incl. the completion cap)")
+    print(f"tokens over {len(rows)} turns: {total_full:,} -> {total_budgeted:,} "
+          f"({total_prompts:,} prompts + {sum(summary_calls):,} summaries, {1 - total_budgeted / total_full:.0%} fewer)")
+
+if __name__ == "__main__":
+    main()
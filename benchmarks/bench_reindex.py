@@ -0,0 +1,76 @@
+# benchmarks/bench_reindex.py
+"""
+Incremental reindexing benchmark: a full index build, then a diff run after
+editing one HTML file and one after switching the embeddings deployment (which
+re-embeds and re-upserts everything). Reports upstream embedding/upsert/delete
+calls per run.
+
+    python benchmarks/bench_reindex.py
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import create_stub_app, start_in_thread
+
+def parse_dir(data_dir):
+    from parse_html import parse_services_html
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.html"))):
+        chunks.extend(parse_services_html(path))
+    return chunks
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental reindex benchmark")
+    parser.add_argument("--data-dir", default=os.path.join(ROOT, "phase2_data"))
+    parser.add_argument("--edit-file", default="dentel_services.html")
+    args = parser.parse_args()
+
+    stub = create_stub_app(embed_latency=0.01, upsert_latency=0.005)
+    base_url, stub_server = start_in_thread(stub)
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": base_url,
+        "AZURE_OPENAI_KEY1": "stub",
+        "AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT": "stub-embeddings",
+        "PINECONE_API_KEY": "stub",
+        "PINECONE_HOST": base_url,
+    })
+    import upload_to_pinecone
+    from index_manifest import IndexManifest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "data")
+        shutil.copytree(args.data_dir, data_dir)
+        manifest_path = os.path.join(tmp, "index_manifest.json")
+
+        runs = []
+        deployment = "stub-embeddings"
+        for label in ["full build", "no changes", f"edited {args.edit_file}", "new embeddings deployment"]:
+            if label.startswith("edited"):
+                path = os.path.join(data_dir, args.edit_file)
+                with open(path, encoding="utf-8") as f:
+                    html = f.read()
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(html.replace("הנחה", "הנחה מיוחדת", 1))
+            if label == "new embeddings deployment":
+                # Every vector must be re-embedded and upserted again
+                deployment = "stub-embeddings-v2"
+            stub.state.stats.reset()
+            manifest = IndexManifest.load(manifest_path, deployment)
+            records = upload_to_pinecone.upload_chunks_to_pinecone(parse_dir(data_dir), manifest=manifest)
+            manifest.save(manifest_path)
+            runs.append((label, len(records), dict(stub.state.stats.calls), manifest.index_version))
+
+    stub_server.should_exit = True
+    print()
+    for label, n, calls, version in runs:
+        print(f"{label:<32} chunks={n:<4} version={version} upstream calls={calls}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# benchmarks/bench_retrieval_eval.py
+"""
+Offline retrieval evaluation, to choose top_k and the retrieval setting from data.
+Golden questions are generated from the parsed knowledge base (parse_services_html
+via records.load_records): one Hebrew and one English question per
+(service, kupa, maslul) row, asked with that kupa and tier as filters. The row
+itself is the relevant document. For every setting and k the report gives
+recall@k, MRR@k, search latency (p50 / p95, without the query embedding) and the
+tokens of the context that build_context_text makes from the retrieved rows.
+
+Settings:
+    vector   vector search (LocalVectorIndex, as with RETRIEVAL_BACKEND=local)
+    bm25     BM25 over the same (namespace, maslul) partition
+    hybrid   both fused by RRF, --candidates per side (the server's RAG path)
+    lookup   structured lookup, falling back to hybrid (the server's QA path)
+
+English service names come from fixtures/service_names_en.json (services
+missing there are asked in Hebrew words and counted in the report).
+Record vectors are read from --snapshot (kb_snapshot.kbs) or embedded with
+AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT, like the questions. --fake-embeddings uses
+the stubs' hash vectors instead: no network, but the vector and hybrid numbers
+are then meaningless (bm25 and lookup hits are not).
+
+    python benchmarks/bench_retrieval_eval.py --snapshot kb_snapshot.kbs --k 1 2 3 4 5 8 --report retrieval_eval.json
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import fake_embedding
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from local_index import LocalVectorIndex, save_local_index
+from page_table import PageTable
+from records import load_records
+from structured_lookup import ServiceLookup
+from token_counter import count_tokens, tokenizer_name
+
+NAMES_EN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "service_names_en.json")
+SETTINGS = ("vector", "bm25", "hybrid", "lookup")
+# Rotated over the services, so each language is asked in a few phrasings
+QUESTION_TEMPLATES = {
+    "he": ("כמה עולה {name}?", "מה מגיע לי על {name}?", "יש הנחה על {name}?"),
+    "en": ("How much does {name} cost?", "What do I get for {name}?", "Is there a discount on {name}?"),
+}
+
+def golden_questions(records, lookup, names_en):
+    """
+    [{"lang", "question", "translated", "namespace", "maslul", "kupa", "service"}], two per service row.
+    """
+    services = sorted(lookup.entries)
+    questions = []
+    for r in records:
+        meta = r["metadata"]
+        if not meta.get("service"):
+            continue
+        entry = lookup.entries[meta["service"]]
+        # parse_html appends the page title to the service name; users do not say it
+        name_he = entry.service[:-len(entry.category)].strip() if entry.category else entry.service
+        template = services.index(entry.service) % len(QUESTION_TEMPLATES["he"])
+        for lang, name in (("he", name_he), ("en", names_en.get(name_he))):
+            questions.append({
+                "lang": lang,
+                "question": QUESTION_TEMPLATES[lang][template].format(name=name or name_he),
+                "translated": lang == "he" or name is not None,
+                "namespace": r["namespace"],
+                "maslul": meta["maslul"],
+                "kupa": meta["kupa"],
+                "service": meta["service"],
+            })
+    return questions
+
+def embed_all(texts, fake):
+    if fake:
+        return [fake_embedding(t) for t in texts]
+    import upload_to_pinecone
+    vectors = []
+    for start in range(0, len(texts), upload_to_pinecone.EMBED_BATCH_SIZE):
+        vectors.extend(upload_to_pinecone.get_embeddings(texts[start:start + upload_to_pinecone.EMBED_BATCH_SIZE])[0])
+    return vectors
+
+def load_kb(args):
+    """
+    (records with "values", page table, where the vectors came from).
+    """
+    if args.snapshot:
+        from kb_snapshot import KBSnapshot
+        snapshot = KBSnapshot.load(args.snapshot)
+        deployment = os.getenv("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT", "")
+        if not args.fake_embeddings and snapshot.header["deployment"] != deployment:
+            raise SystemExit(f"{args.snapshot} was embedded with {snapshot.header['deployment']!r}, "
+                             f"questions would be embedded with {deployment!r}")
+        return list(snapshot.records()), snapshot.page_table(), f"snapshot {args.snapshot} ({snapshot.header['dtype']})"
+    page_table = PageTable()
+    records = load_records(os.path.join(ROOT, args.data_dir), page_table = page_table)
+    for r, vector in zip(records, embed_all([r["text"] for r in records], args.fake_embeddings)):
+        r["values"] = vector
+    return records, page_table, "fake (hash) embeddings" if args.fake_embeddings else "embedded from the HTML files"
+
+def is_relevant(doc, q):
+    return doc.get("service") == q["service"] and doc.get("kupa") == q["kupa"] and doc.get("maslul") == q["maslul"]
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 3, 4, 5, 8])
+    parser.add_argument("--settings", nargs="+", choices=SETTINGS, default=list(SETTINGS))
+    parser.add_argument("--candidates", type=int, default=10, help="per retriever before fusion (HYBRID_CANDIDATES)")
+    parser.add_argument("--rrf-k", type=int, default=60, help="RRF_K")
+    parser.add_argument("--min-coverage", type=float, default=0.5, help="LOOKUP_MIN_COVERAGE")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--data-dir", default="phase2_data")
+    parser.add_argument("--snapshot", default="", help="KB snapshot holding the record vectors")
+    parser.add_argument("--fake-embeddings", action="store_true", help="hash vectors, no Azure OpenAI calls")
+    parser.add_argument("--report", default="", help="write the full report as JSON here")
+    parser.add_argument("--write-golden", default="", help="write the generated questions as JSON here")
+    args = parser.parse_args()
+
+    import server   # build_context_text, exactly as the prompt gets it (and loads .env)
+    logging.getLogger().setLevel(logging.WARNING)
+    if not args.fake_embeddings and not (os.getenv("AZURE_OPENAI_ENDPOINT") and os.getenv("AZURE_OPENAI_KEY1")):
+        parser.error("the questions are embedded with Azure OpenAI: set AZURE_OPENAI_ENDPOINT / "
+                     "AZURE_OPENAI_KEY1 (e.g. in .env) or pass --fake-embeddings")
+
+    records, page_table, vectors_from = load_kb(args)
+    server.page_table = page_table
+    lookup = ServiceLookup.from_records(records, page_table, min_coverage = args.min_coverage)
+    with open(NAMES_EN, encoding="utf-8") as f:
+        names_en = json.load(f)
+    questions = golden_questions(records, lookup, names_en)
+    if args.write_golden:
+        with open(args.write_golden, "w", encoding="utf-8") as f:
+            json.dump(questions, f, ensure_ascii=False, indent=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        save_local_index(records, tmp)
+        vector_index = LocalVectorIndex.load(tmp, mmap = False)
+    bm25 = BM25Index.from_records(records)
+    t0 = time.perf_counter()
+    query_vectors = embed_all([q["question"] for q in questions], args.fake_embeddings)
+    embed_seconds = time.perf_counter() - t0
+
+    def search(setting, q, vector, k):
+        ns, maslul = q["namespace"], q["maslul"]
+        if setting == "lookup":
+            row = lookup.lookup(q["question"], ns, maslul)
+            if row is not None:
+                return [row]
+            setting = "hybrid"
+        if setting == "vector":
+            return [m["metadata"] for m in vector_index.query(vector, k, ns, maslul)]
+        if setting == "bm25":
+            return [m["metadata"] for m in bm25.search(q["question"], ns, maslul, top_k=k)]
+        candidates = max(k, args.candidates)
+        matches = reciprocal_rank_fusion([vector_index.query(vector, candidates, ns, maslul),
+                                          bm25.search(q["question"], ns, maslul, top_k=candidates)], k=args.rrf_k)
+        return [m["metadata"] for m in matches[:k]]
+
+    results = []
+    for setting in args.settings:
+        for k in args.k:
+            per_lang = {}
+            for q, vector in zip(questions, query_vectors):
+                t0 = time.perf_counter()
+                docs = search(setting, q, vector, k)
+                seconds = time.perf_counter() - t0
+                rank = next((i for i, d in enumerate(docs, start=1) if is_relevant(d, q)), None)
+                tokens = count_tokens(server.build_context_text(docs)) if docs else 0
+                for lang in (q["lang"], "all"):
+                    per_lang.setdefault(lang, []).append((rank, seconds, tokens, len(docs)))
+            for lang in ("he", "en", "all"):
+                rows = per_lang[lang]
+                latencies = [s for _, s, _, _ in rows]
+                results.append({
+                    "setting": setting,
+                    "k": k,
+                    "lang": lang,
+                    "questions": len(rows),
+                    "recall": sum(r is not None for r, _, _, _ in rows) / len(rows),
+                    "mrr": sum(1 / r for r, _, _, _ in rows if r is not None) / len(rows),
+                    "latency_p50_us": percentile(latencies, 0.5) * 1e6,
+                    "latency_p95_us": percentile(latencies, 0.95) * 1e6,
+                    "context_tokens": statistics.mean(t for _, _, t, _ in rows),
+                    "docs": statistics.mean(n for _, _, _, n in rows),
+                })
+
+    # Smallest k reaching the target recall over both languages, per setting
+    recommendation = {}
+    for setting in args.settings:
+        rows = [r for r in results if r["setting"] == setting and r["lang"] == "all"]
+        reached = [r for r in rows if r["recall"] >= args.target_recall]
+        best = min(reached, key=lambda r: r["k"]) if reached else max(rows, key=lambda r: (r["recall"], -r["k"]))
+        recommendation[setting] = {"k": best["k"], "recall": best["recall"], "context_tokens": best["context_tokens"],
+                                   "reaches_target": bool(reached)}
+
+    untranslated = sum(not q["translated"] for q in questions)
+    print(f"{len(questions)} golden questions ({len(questions) // 2} rows x he/en, {untranslated} without an English name) | "
+          f"vectors: {vectors_from} | query embeddings {embed_seconds:.2f} s | tokenizer: {tokenizer_name()}")
+    print(f"{'setting':<8} {'k':>2} {'lang':<4} {'recall':>7} {'MRR':>6} {'p50 us':>8} {'p95 us':>8} {'docs':>5} {'ctx tokens':>11}")
+    for r in results:
+        print(f"{r['setting']:<8} {r['k']:>2} {r['lang']:<4} {r['recall']:7.3f} {r['mrr']:6.3f} {r['latency_p50_us']:8.0f} "
+              f"{r['latency_p95_us']:8.0f} {r['docs']:5.2f} {r['context_tokens']:11.1f}")
+    print(f"\nsmallest k with recall >= {args.target_recall} (he + en):")
+    for setting, rec in recommendation.items():
+        note = "" if rec["reaches_target"] else " (target not reached, best k shown)"
+        print(f"  {setting:<8} k={rec['k']} recall {rec['recall']:.3f} | {rec['context_tokens']:.0f} context tokens{note}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({
+                "questions": len(questions),
+                "untranslated_questions": untranslated,
+                "vectors": vectors_from,
+                "tokenizer": tokenizer_name(),
+                "target_recall": args.target_recall,
+                "candidates": args.candidates,
+                "rrf_k": args.rrf_k,
+                "results": results,
+                "recommendation": recommendation,
+            }, f, ensure_ascii=False, indent=1)
+        print(f"report written to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_retrieval_router.py
+"""
+Replays the recorded QA conversations (fixtures/qa_conversations.json) through
+/chat against local stubs, with RETRIEVAL_ROUTER off and on. The client sends
+back each turn's retrieved_docs like app.py does. Reports the embedding and
+vector-query calls reaching the stubs, the fraction the router avoided, how
+often its outcome (and, where labeled, the kupa / tier) matched the recorded
+label, and its CPU time per turn.
+
+    python benchmarks/bench_retrieval_router.py
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at, USER_DATA
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "qa_conversations.json")
+
+async def replay(stub, conversations, enabled):
+    import httpx
+    os.environ["RETRIEVAL_ROUTER"] = "1" if enabled else "0"
+    import server
+    server = importlib.reload(server)
+    logging.getLogger().setLevel(logging.WARNING)
+    await server.ensure_ready()
+    stub.state.stats.reset()
+    outcomes = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://server", timeout=120) as c:
+        for conversation in conversations:
+            history, previous_docs = [], []
+            for turn in conversation["turns"]:
+                history.append({"role": "user", "content": turn["user"]})
+                result = (await c.post("/chat", json={
+                    "history": history,
+                    "phase": "qa",
+                    "user_data": USER_DATA,
+                    "previous_retrieved_docs": previous_docs,
+                })).json()
+                if result["retrieval"] != "none":
+                    previous_docs = result["retrieved_docs"]
+                expected = (turn.get("namespace"), turn.get("maslul")) if "namespace" in turn else None
+                outcomes.append((turn["route"], result["retrieval"], expected, (result["namespace"], result["maslul"])))
+                history.append({"role": "assistant", "content": result["answer"]})
+    await server.client.close()
+    return dict(stub.state.stats.calls), outcomes, server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200, help="router-only passes for the CPU timing")
+    args = parser.parse_args()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        conversations = json.load(f)
+    n_turns = sum(len(c["turns"]) for c in conversations)
+
+    # Absolute, so the server finds the KB from any working directory
+    os.environ.update({"ANSWER_CACHE_ENABLED": "0", "KB_DATA_DIR": os.path.join(ROOT, "phase2_data"),
+                       "PAGE_TABLE_PATH": os.path.join(ROOT, "page_table.json")})
+    stub = create_stub_app(embed_latency=0.01, chat_latency=0.01, query_latency=0.01)
+    base_url, stub_server = start_in_thread(stub)
+    point_env_at(base_url)
+
+    off_calls, _, _ = asyncio.run(replay(stub, conversations, False))
+    on_calls, outcomes, server = asyncio.run(replay(stub, conversations, True))
+    stub_server.should_exit = True
+
+    print(f"{len(conversations)} conversations, {n_turns} QA turns")
+    for kind in ("embeddings", "query"):
+        off, on = off_calls.get(kind, 0), on_calls.get(kind, 0)
+        print(f"{kind:<10} router off {off:3d} | on {on:3d} | avoided {1 - on / off if off else 0:.0%}")
+    served = {}
+    for _, retrieval, _, _ in outcomes:
+        served[retrieval] = served.get(retrieval, 0) + 1
+    print("turns by retrieval path (router on):", served)
+    expected_action = {"none": "none", "reuse": "reuse"}
+    matched = sum(expected_action.get(actual, "retrieve") == label for label, actual, _, _ in outcomes)
+    print(f"router outcome matches the recorded label: {matched}/{len(outcomes)}")
+    # Turns labeled with the kupa / tier the answer must be retrieved for
+    filtered = [(expected, actual) for _, _, expected, actual in outcomes if expected is not None]
+    print(f"retrieved for the labeled kupa / tier: {sum(e == a for e, a in filtered)}/{len(filtered)}")
+
+    # Router CPU time alone (no retrieval), over the same turns
+    router = server.retrieval_router
+    previous_docs = list(server.service_lookup.rows.values())[:4]
+    turns = [(t["user"], [{"role": "user", "content": t["user"]}]) for c in conversations for t in c["turns"]]
+    t0 = time.process_time()
+    for _ in range(args.repeat):
+        for query, history in turns:
+            router.route(query, history, "maccabi", USER_DATA["membership_tier"], previous_docs)
+    print(f"router CPU: {(time.process_time() - t0) / (args.repeat * len(turns)) * 1e6:.0f} us / turn")
+
+if __name__ == "__main__":
+    main()
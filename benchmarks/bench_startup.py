@@ -0,0 +1,96 @@
+# benchmarks/bench_startup.py
+"""
+Startup benchmark against the local stubs, each measurement in a fresh process:
+    - import time of server.py, and import + full startup (what importing used to cost)
+    - cold start of `uvicorn server:app`: time until the port accepts connections,
+      until /healthz reports ready, and until the first /chat answer
+      (sent as soon as the port accepts)
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import create_stub_app, free_port, start_in_thread
+from bench_chat_concurrency import point_env_at, QUESTION, USER_DATA
+
+IMPORT_PROBE = """
+import asyncio, json, time
+t0 = time.perf_counter()
+import server
+imported = time.perf_counter() - t0
+asyncio.run(server.startup())
+print(json.dumps({"import": imported, "import_and_startup": time.perf_counter() - t0}))
+"""
+
+def measure_import():
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def measure_cold_start(first_request):
+    """
+    Launches uvicorn and times (from launch) when the port accepts and when either
+    /healthz first reports ready or the first /chat answer arrives.
+    """
+    port = free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as c:
+            while True:
+                try:
+                    ready = c.get("/healthz").status_code == 200
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.005)
+            accepting = time.perf_counter() - t0
+            if first_request == "chat":
+                c.post("/chat", json={"history": [{"role": "user", "content": QUESTION}],
+                                      "phase": "qa", "user_data": USER_DATA}).raise_for_status()
+            else:
+                while not ready:
+                    time.sleep(0.005)
+                    ready = c.get("/healthz").status_code == 200
+            return accepting, time.perf_counter() - t0
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def summary(label, values):
+    return f"{label:<28} median {statistics.median(values) * 1000:7.0f} ms   (min {min(values) * 1000:.0f} / max {max(values) * 1000:.0f})"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    stub = create_stub_app(0.05, 0.3, 0.03)
+    base_url, stub_server = start_in_thread(stub)
+    point_env_at(base_url)
+
+    imports = [measure_import() for _ in range(args.runs)]
+    ready = [measure_cold_start("healthz") for _ in range(args.runs)]
+    first_answer = [measure_cold_start("chat") for _ in range(args.runs)]
+    stub_server.should_exit = True
+
+    print(summary("import server", [r["import"] for r in imports]))
+    print(summary("import + startup", [r["import_and_startup"] for r in imports]))
+    print(summary("uvicorn: port accepting", [accepting for accepting, _ in ready + first_answer]))
+    print(summary("uvicorn: /healthz ready", [t for _, t in ready]))
+    print(summary("uvicorn: first /chat answer", [t for _, t in first_answer]))
+
+if __name__ == "__main__":
+    main()
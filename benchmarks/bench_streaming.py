@@ -0,0 +1,54 @@
+# benchmarks/bench_streaming.py
+"""
+Time-to-first-token benchmark: /chat (full JSON answer) vs /chat/stream (SSE),
+with the server running under uvicorn against the local stubs.
+
+    python benchmarks/bench_streaming.py --chat-latency 2.0
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import requests
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at, QUESTION, USER_DATA
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming time-to-first-token benchmark")
+    parser.add_argument("--chat-latency", type=float, default=2.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    base_url, stub_server = start_in_thread(create_stub_app(chat_latency=args.chat_latency))
+    point_env_at(base_url)
+    os.environ["ANSWER_CACHE_ENABLED"] = "0"
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+    url, app_server = start_in_thread(server.app)
+
+    payload = {"history": [{"role": "user", "content": QUESTION}], "phase": "qa", "user_data": USER_DATA}
+    session = requests.Session()
+    for i in range(args.rounds):
+        t0 = time.perf_counter()
+        session.post(f"{url}/chat", json=payload).raise_for_status()
+        full = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        first_token = None
+        with session.post(f"{url}/chat/stream", json=payload, stream=True) as r:
+            for raw in r.iter_lines():
+                if first_token is None and raw.startswith(b"event: token"):
+                    first_token = time.perf_counter() - t0
+        total = time.perf_counter() - t0
+        print(f"round {i + 1}: /chat answer {full * 1000:7.1f} ms | "
+              f"/chat/stream first token {first_token * 1000:7.1f} ms, done {total * 1000:7.1f} ms")
+
+    app_server.should_exit = True
+    stub_server.should_exit = True
+
+if __name__ == "__main__":
+    main()
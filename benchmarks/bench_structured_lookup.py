@@ -0,0 +1,107 @@
+# benchmarks/bench_structured_lookup.py
+"""
+Benchmark for the exact (kupa, maslul, service) lookup.
+Times ServiceLookup.lookup over a set of questions, then sends the same
+questions to /chat (against local stubs) with the lookup on and off and
+counts the embedding / vector-query calls each run needed.
+
+    python benchmarks/bench_structured_lookup.py --repeat 1000
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at, USER_DATA
+
+# (question, expected service prefix or None when RAG should handle it)
+QUESTIONS = [
+    ("כמה עולה טיפול שורש?", "טיפולי שורש"),
+    ("מה מגיע לי על סתימות?", "סתימות"),
+    ("כמה עולים שתלים?", "כתרים ושתלים"),
+    ("יש הנחה על אקופונקטורה?", "דיקור סיני"),
+    ("כמה עולים משקפיים?", "משקפי ראייה"),
+    ("מה לגבי עדשות מגע?", "עדשות מגע"),
+    ("יש קורס הכנה ללידה?", "קורס הכנה ללידה"),
+    ("טיפול בגמגום לילד", "טיפול בגמגום"),
+    ("סדנה להפסקת עישון", "הפסקת עישון"),
+    ("כמה עולה טיפול שיניים?", None),
+    ("מה מגיע לי על טיפולים?", None),
+    ("What discounts do I get for dental care?", None),
+    ("סתימות וטיפולי שורש", None),
+]
+
+def time_lookups(lookup, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for question, _ in QUESTIONS:
+            t0 = time.perf_counter()
+            lookup.lookup(question, "maccabi", USER_DATA["membership_tier"])
+            latencies.append(time.perf_counter() - t0)
+    return latencies
+
+async def chat_calls(stub, enabled):
+    import httpx
+    os.environ["STRUCTURED_LOOKUP"] = "1" if enabled else "0"
+    import server
+    server = importlib.reload(server)
+    logging.getLogger().setLevel(logging.WARNING)
+    await server.ensure_ready()
+    stub.state.stats.reset()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://server", timeout=120) as c:
+        for question, _ in QUESTIONS:
+            await c.post("/chat", json={
+                "history": [{"role": "user", "content": question}],
+                "phase": "qa",
+                "user_data": USER_DATA,
+            })
+    await server.client.close()
+    return dict(stub.state.stats.calls)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    from page_table import PageTable
+    from records import load_records
+    from structured_lookup import ServiceLookup
+    page_table = PageTable()
+    records = load_records(os.path.join(ROOT, "phase2_data"), page_table = page_table)
+    lookup = ServiceLookup.from_records(records, page_table)
+
+    correct = 0
+    for question, expected in QUESTIONS:
+        service = lookup.match_service(question)
+        ok = (service is None) if expected is None else bool(service and service.startswith(expected))
+        correct += ok
+        print(f"{'ok ' if ok else 'BAD'} {question} -> {service or 'RAG fallback'}")
+    print(f"\nmatch accuracy: {correct}/{len(QUESTIONS)}")
+
+    latencies = sorted(time_lookups(lookup, args.repeat))
+    print(f"lookup latency: p50 {statistics.median(latencies) * 1e6:.0f} us | "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f} us")
+
+    # Absolute, so the server finds the KB from any working directory
+    os.environ.update({"ANSWER_CACHE_ENABLED": "0", "KB_DATA_DIR": os.path.join(ROOT, "phase2_data"),
+                       "PAGE_TABLE_PATH": os.path.join(ROOT, "page_table.json")})
+    stub = create_stub_app(0.0, 0.0, 0.0)
+    base_url, stub_server = start_in_thread(stub)
+    point_env_at(base_url)
+    for enabled in (False, True):
+        calls = asyncio.run(chat_calls(stub, enabled))
+        print(f"/chat x{len(QUESTIONS)} lookup {'on ' if enabled else 'off'}: "
+              f"embeddings={calls.get('embeddings', 0)} query={calls.get('query', 0)} chat={calls.get('chat', 0)}")
+    stub_server.should_exit = True
+
+if __name__ == "__main__":
+    main()
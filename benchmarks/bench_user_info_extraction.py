@@ -0,0 +1,84 @@
+# benchmarks/bench_user_info_extraction.py
+"""
+Validates the rule-based user-info extractor against the labeled conversations in
+fixtures/user_info_conversations.json, and compares /extract_user_data latency
+and LLM calls with the LLM-only extraction (against the local stub).
+
+    python benchmarks/bench_user_info_extraction.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from stub_services import create_stub_app, start_in_thread
+from bench_chat_concurrency import point_env_at
+from user_info_extractor import extract_user_info, missing_fields, USER_INFO_FIELDS
+
+FIXTURES = os.path.join(HERE, "fixtures", "user_info_conversations.json")
+
+def validate(cases, rounds):
+    failures = 0
+    field_total = field_ok = 0
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for case in cases:
+            extract_user_info(case["history"])
+    per_conv_us = (time.perf_counter() - t0) / (rounds * len(cases)) * 1e6
+
+    for case in cases:
+        got = extract_user_info(case["history"])
+        wrong = {f: (got[f], v) for f, v in case["expected"].items() if got[f] != v}
+        field_total += len(USER_INFO_FIELDS)
+        field_ok += len(USER_INFO_FIELDS) - len(wrong)
+        if wrong:
+            failures += 1
+            print(f"  MISMATCH {case['name']}: {wrong}")
+    return failures, field_ok / field_total, per_conv_us
+
+async def compare_endpoint(cases):
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+    await server.ensure_ready()
+    results = {}
+    for label, fn in [("LLM only", lambda h: server.llm_extract_user_data(h, USER_INFO_FIELDS)),
+                      ("rules + LLM fallback", server.get_user_data)]:
+        server.user_info_stats["llm_calls"] = 0
+        t0 = time.perf_counter()
+        for case in cases:
+            await fn(case["history"])
+        results[label] = ((time.perf_counter() - t0) / len(cases) * 1000, server.user_info_stats["llm_calls"])
+    await server.client.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="User-info extraction benchmark")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--chat-latency", type=float, default=0.8)
+    args = parser.parse_args()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        cases = json.load(f)
+
+    failures, field_accuracy, per_conv_us = validate(cases, args.rounds)
+    resolved = sum(not missing_fields(extract_user_info(c["history"])) for c in cases)
+    print(f"fixtures:                {len(cases)} conversations, {failures} with mismatches")
+    print(f"field accuracy:          {field_accuracy:.1%}")
+    print(f"rule extraction:         {per_conv_us:.0f} us/conversation")
+    print(f"fully resolved by rules: {resolved}/{len(cases)} (LLM call avoided)")
+
+    base_url, stub_server = start_in_thread(create_stub_app(chat_latency=args.chat_latency))
+    point_env_at(base_url)
+    for label, (ms, llm_calls) in asyncio.run(compare_endpoint(cases)).items():
+        print(f"{label:<22} {ms:8.1f} ms/extraction, {llm_calls} LLM calls")
+    stub_server.should_exit = True
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# benchmarks/stub_services.py
+"""
+Local stand-ins for the Azure OpenAI and Pinecone data-plane REST APIs.
+Used by the benchmark scripts so they run without network access or API keys.
+
+Run standalone:
+    python benchmarks/stub_services.py --port 8100 --embed-latency 0.05 --chat-latency 0.3
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_DIM = 1536
+STUB_ANSWER = "תשובת בדיקה מהשרת המדומה."
+
+SAMPLE_METADATA = {
+    "service": "בדיקות וניקוי שיניים מרפאות שיניים",
+    "benefit": "חינם פעמיים בשנה, תור תוך 48 שעות",
+    "maslul": "זהב",
+    "kupa": "מכבי",
+    "phones": "*3555",
+    "links": "https://www.maccabi4u.co.il/",
+    "intro": "מרפאות שיניים",
+}
+
+def fake_embedding(text, dim = EMBEDDING_DIM):
+    """
+    Deterministic pseudo-embedding: same text -> same vector.
+    """
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    return [((seed[i % len(seed)] + i) % 251) / 251.0 - 0.5 for i in range(dim)]
+
+class StubStats:
+    """
+    Counts calls per route and tracks peak concurrency, so benchmarks can show
+    that requests actually overlapped.
+    """
+    def __init__(self):
+        self.calls = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.throttled = 0
+
+    def reset(self):
+        self.calls = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.throttled = 0
+
+class Throttled(Exception):
+    pass
+
+class RateLimiter:
+    """
+    Token bucket: `rate` requests per second with bursts up to `burst`
+    (like an Azure OpenAI requests-per-minute quota).
+    """
+    def __init__(self, rate, burst = None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+def create_stub_app(embed_latency = 0.05, chat_latency = 0.3, query_latency = 0.03,
+                    upsert_latency = 0.02, embed_per_input_latency = 0.0, max_in_flight = None,
+                    rate_limit = None, jitter = 0.0):
+    """
+    Builds the stub FastAPI app. Latencies are in seconds.
+    When max_in_flight is set, requests beyond that concurrency get HTTP 429;
+    when rate_limit is set, so do requests beyond that many per second.
+    jitter spreads each latency uniformly by +/- that fraction.
+    """
+    app = FastAPI()
+    stats = StubStats()
+    app.state.stats = stats
+    limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    @app.exception_handler(Throttled)
+    async def throttled_handler(request, exc):
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": "0"},
+            content={"error": {"code": "429", "message": "Rate limit exceeded (stub)"}},
+        )
+
+    async def simulate(route, latency):
+        if (max_in_flight is not None and stats.in_flight >= max_in_flight) or (
+                limiter is not None and not limiter.try_acquire()):
+            stats.throttled += 1
+            raise Throttled()
+        if jitter:
+            latency *= 1 + random.uniform(-jitter, jitter)
+        stats.calls[route] = stats.calls.get(route, 0) + 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            stats.in_flight -= 1
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def embeddings(deployment: str, request: Request):
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await simulate("embeddings", embed_latency + embed_per_input_latency * len(inputs))
+        tokens = sum(len(t.split()) for t in inputs)
+        return {
+            "object": "list",
+            "model": deployment,
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(t)}
+                for i, t in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        if body.get("stream"):
+            # Time-to-first-token is a fraction of the full latency; the rest is spread over tokens
+            await simulate("chat", chat_latency * 0.2)
+            return StreamingResponse(stream_completion(deployment), media_type="text/event-stream")
+        await simulate("chat", chat_latency)
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": STUB_ANSWER},
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 8,
+                      "total_tokens": prompt_tokens + 8},
+        }
+
+    async def stream_completion(deployment):
+        words = STUB_ANSWER.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": deployment,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if i == 0 else " " + word},
+                    "finish_reason": None,
+                }],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(chat_latency * 0.8 / len(words))
+        yield "data: [DONE]\n\n"
+
+    @app.post("/query")
+    async def pinecone_query(request: Request):
+        body = await request.json()
+        await simulate("query", query_latency)
+        top_k = body.get("topK", 5)
+        return {
+            "namespace": body.get("namespace", ""),
+            "matches": [
+                {"id": f"stub_{i}", "score": 1.0 - i * 0.01, "values": [], "metadata": SAMPLE_METADATA}
+                for i in range(top_k)
+            ],
+            "usage": {"readUnits": 1},
+        }
+
+    @app.api_route("/describe_index_stats", methods=["GET", "POST"])
+    async def pinecone_describe_index_stats():
+        await simulate("describe_index_stats", query_latency)
+        return {"namespaces": {}, "dimension": EMBEDDING_DIM, "indexFullness": 0.0, "totalVectorCount": 0}
+
+    @app.post("/vectors/upsert")
+    async def pinecone_upsert(request: Request):
+        body = await request.json()
+        await simulate("upsert", upsert_latency)
+        return {"upsertedCount": len(body.get("vectors", []))}
+
+    @app.post("/vectors/delete")
+    async def pinecone_delete(request: Request):
+        await simulate("delete", upsert_latency)
+        return {}
+
+    return app
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_in_thread(app, port = None):
+    """
+    Starts uvicorn for app on a daemon thread. Returns (base_url, server).
+    """
+    port = port or free_port()
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}", server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Azure OpenAI / Pinecone stub server")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--query-latency", type=float, default=0.03)
+    parser.add_argument("--upsert-latency", type=float, default=0.02)
+    parser.add_argument("--max-in-flight", type=int, default=None, help="return 429 above this concurrency")
+    parser.add_argument("--rate-limit", type=float, default=None, help="return 429 above this many requests/s")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency spread, e.g. 0.3 for +/-30%%")
+    args = parser.parse_args()
+    uvicorn.run(
+        create_stub_app(args.embed_latency, args.chat_latency, args.query_latency,
+                        args.upsert_latency, max_in_flight=args.max_in_flight,
+                        rate_limit=args.rate_limit, jitter=args.jitter),
+        host="127.0.0.1", port=args.port
+    )
@@ -0,0 +1,116 @@
+# bm25_index.py
+"""
+In-process BM25 index over the parsed service chunks, partitioned by
+(namespace, maslul), plus reciprocal rank fusion with vector results.
+
+Hebrew tokens are indexed both as written and with their one-letter prefix
+(ו ה ב ל מ ש כ) stripped, so "לשיניים" and "השיניים" both match "שיניים".
+A second prefix is stripped only after ו / ש ("ובשיניים", "שבהריון").
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"[\w֐-׿]+", re.UNICODE)
+HEBREW_PREFIXES = set("והבלמשכ")
+CHAINING_PREFIXES = set("וש")
+HEBREW_RE = re.compile(r"[֐-׿]")
+STOPWORDS = {
+    "של", "את", "על", "עם", "או", "גם", "כל", "זה", "זו", "אני", "מה", "כמה", "יש", "אין", "לי", "אם",
+    "the", "a", "an", "of", "for", "and", "or", "is", "to", "in", "my", "what", "how", "much", "does", "do",
+}
+
+def tokenize(text):
+    """
+    Lowercased word tokens with Hebrew prefix variants, stopwords removed.
+    """
+    tokens = []
+    for word in TOKEN_RE.findall((text or "").lower()):
+        if word in STOPWORDS:
+            continue
+        tokens.append(word)
+        if HEBREW_RE.match(word):
+            stem = word
+            while len(stem) > 3 and stem[0] in HEBREW_PREFIXES:
+                prefix, stem = stem[0], stem[1:]
+                if stem not in STOPWORDS:
+                    tokens.append(stem)
+                if prefix not in CHAINING_PREFIXES or len(stem) == len(word) - 2:
+                    break
+    return tokens
+
+class BM25Partition:
+    def __init__(self, docs, k1 = 1.5, b = 0.75):
+        """
+        docs: list of (doc_id, text, metadata)
+        """
+        self.k1 = k1
+        self.b = b
+        self.ids = [d[0] for d in docs]
+        self.metadata = [d[2] for d in docs]
+        self.doc_len = []
+        self.postings = defaultdict(list)   # term -> [(doc_index, term_frequency)]
+        for i, (_, text, _) in enumerate(docs):
+            counts = Counter(tokenize(text))
+            self.doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+        n = len(docs)
+        self.avg_len = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def search(self, query, top_k):
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for i, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[i] / self.avg_len)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda x: -x[1])[:top_k]
+        return [{"id": self.ids[i], "score": s, "metadata": self.metadata[i]} for i, s in best]
+
+class BM25Index:
+    """
+    One BM25Partition per (namespace, maslul); "" maslul holds every doc of the namespace.
+    """
+    def __init__(self, partitions):
+        self.partitions = partitions
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Builds the index from records.chunk_to_record output (service chunks only).
+        """
+        grouped = defaultdict(list)
+        for r in records:
+            meta = r["metadata"]
+            if not meta.get("service"):
+                continue
+            doc = (r["id"], f"{meta['service']} {meta.get('benefit', '')}", meta)
+            grouped[(r["namespace"], meta.get("maslul", ""))].append(doc)
+            grouped[(r["namespace"], "")].append(doc)
+        return cls({key: BM25Partition(docs) for key, docs in grouped.items()})
+
+    def search(self, query, namespace, maslul = "", top_k = 10):
+        partition = self.partitions.get((namespace, maslul or ""))
+        return partition.search(query, top_k) if partition else []
+
+    def __len__(self):
+        return sum(len(p.ids) for (_, maslul), p in self.partitions.items() if maslul == "")
+
+def reciprocal_rank_fusion(result_lists, k = 60):
+    """
+    Fuses ranked match lists ({"id", "metadata", ...}) by sum of 1 / (k + rank).
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, match in enumerate(results, start=1):
+            entry = fused.setdefault(match["id"], {"id": match["id"], "score": 0.0, "metadata": match["metadata"]})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda m: -m["score"])
@@ -0,0 +1,52 @@
+# context_snippets.py
+"""
+Prompt-ready text blocks of the RAG context. Service snippets are rendered once
+per row and kept in memory (not stored in the vectors, which already carry the
+service and benefit), page intros and contact blocks once per page
+(PageTable.context_blocks), so assembling the context for a request is a join
+of ready strings:
+
+    RAG_CONTEXT_HEADER
+    per page: intro block, the rows' snippets, contact block
+    RAG_CONTEXT_FOOTER
+"""
+from functools import lru_cache
+
+# Upper bound on one service snippet; longer rows are cut and end with "…"
+SNIPPET_MAX_CHARS = 400
+# Rendered snippets kept (a few per service x kupa x tier row)
+SNIPPET_CACHE_SIZE = 8192
+
+RAG_CONTEXT_HEADER = "\nמידע רלוונטי מהידע שנשאב (RAG):\n"
+RAG_CONTEXT_FOOTER = "\n"
+
+def render_snippet(service, benefit, max_chars = SNIPPET_MAX_CHARS):
+    """
+    The context line of one service row, newline included.
+    """
+    line = f"● {service} - {benefit}"
+    if len(line) > max_chars:
+        line = line[:max_chars - 1].rstrip() + "…"
+    return line + "\n"
+
+def render_intro_block(intro):
+    intro = intro.strip()
+    return f"\nרקע: {intro}\n" if intro else ""
+
+def render_contact_block(phones, links):
+    block = ""
+    if phones:
+        block += f"טלפון: {phones}\n"
+    if links:
+        block += f"[לקישור לחץ כאן>>]({links})\n"
+    return block
+
+@lru_cache(maxsize = SNIPPET_CACHE_SIZE)
+def _cached_snippet(service, benefit):
+    return render_snippet(service, benefit)
+
+def row_snippet(metadata):
+    """
+    The snippet of a retrieved row, rendered on its first retrieval.
+    """
+    return _cached_snippet(metadata.get("service", ""), metadata.get("benefit", ""))
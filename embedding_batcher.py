@@ -0,0 +1,69 @@
+# embedding_batcher.py
+"""
+Micro-batching for query embeddings. Requests arriving within `window` seconds
+of the first one (or until `max_batch` have arrived) are sent as one batched
+embeddings call, and each waiter gets its own vector back.
+"""
+import asyncio
+
+class EmbeddingBatcher:
+    def __init__(self, embed_many, window = 0.005, max_batch = 16):
+        """
+        embed_many: async fn(list of texts) -> list of vectors, in input order.
+        """
+        self.embed_many = embed_many
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []      # (text, future)
+        self._timer = None
+        self._tasks = set()     # batches in flight (keeps the tasks referenced)
+        self.batches = 0
+        self.inputs = 0
+        self.largest_batch = 0
+
+    async def embed(self, text):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.inputs += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        try:
+            vectors = await self.embed_many([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            # A waiter may have been cancelled (client went away)
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "inputs": self.inputs,
+            "avg_batch": self.inputs / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
@@ -0,0 +1,135 @@
+# embedding_cache.py
+"""
+Bounded cache for query embeddings (LRU + TTL), with an optional SQLite backend
+shared between uvicorn workers on the same host.
+"""
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+def normalize_query(text):
+    """
+    Normalizes a query so trivially different spellings share one cache entry:
+    unicode NFC, lowercase, collapsed whitespace.
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.lower().split())
+
+class SQLiteEmbeddingBackend:
+    """
+    Shared second-level store. Every worker opens the same file, so an embedding
+    computed by one worker is reused by the others.
+    """
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        vector, created_at = row
+        if time.time() - created_at > self.ttl:
+            return None
+        return array("f", vector).tolist()
+
+    def set(self, key, embedding):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                (key, array("f", embedding).tobytes(), now)
+            )
+            self._conn.execute("DELETE FROM embeddings WHERE created_at < ?", (now - self.ttl,))
+
+    def close(self):
+        self._conn.close()
+
+class EmbeddingCache:
+    """
+    In-process LRU cache with per-entry TTL, keyed on (deployment, normalized query).
+    Misses fall through to the optional shared backend before the caller pays
+    for an embeddings round-trip.
+    """
+    def __init__(self, max_size = 1024, ttl = 3600, backend = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(query, deployment):
+        return f"{deployment}|{normalize_query(query)}"
+
+    def get(self, query, deployment):
+        key = self.make_key(query, deployment)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                embedding, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return embedding
+                del self._entries[key]
+        if self.backend is not None:
+            embedding = self.backend.get(key)
+            if embedding is not None:
+                self._store(key, embedding)
+                with self._lock:
+                    self.backend_hits += 1
+                return embedding
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, query, deployment, embedding):
+        key = self.make_key(query, deployment)
+        self._store(key, embedding)
+        if self.backend is not None:
+            self.backend.set(key, embedding)
+
+    def _store(self, key, embedding):
+        with self._lock:
+            self._entries[key] = (embedding, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.backend_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "backend_hits": self.backend_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.backend_hits) / lookups if lookups else 0.0,
+                "shared_backend": self.backend is not None,
+            }
@@ -0,0 +1,216 @@
+# index_manifest.py
+"""
+Local record of what is currently in the vector index, used for incremental reindexing.
+
+    {
+      "deployment": "<embeddings deployment>",
+      "index_version": "<hash of all chunk ids>",
+      "chunks": {chunk_id: namespace, ...},
+      "retired_chunks": {chunk_id: namespace, ...}
+    }
+
+The stored embeddings (text_hash -> float32 vector) are kept out of memory in
+an EmbeddingStore, a SQLite file next to the manifest ("<manifest>.embeddings.sqlite"),
+which records the deployment they were made with.
+
+"retired_chunks" are chunks still in the index with vectors of an earlier
+deployment: the next run re-upserts the ones still in the corpus and deletes
+the others.
+
+Chunk IDs are derived from chunk content, so an unchanged chunk keeps its ID
+no matter where it appears in the corpus, and an edited chunk gets a new one.
+"""
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def make_chunk_id(namespace, chunk_type, text, metadata):
+    """
+    Stable, content-derived vector ID.
+    """
+    payload = json.dumps([chunk_type, text, metadata], ensure_ascii=False, sort_keys=True)
+    return f"{namespace}_{text_hash(payload)[:24]}"
+
+def _decode_vector(data):
+    return array("f", base64.b64decode(data)).tolist()
+
+class EmbeddingStore:
+    """
+    text_hash -> embedding, in a SQLite file (":memory:" without a path).
+    Entries made with another deployment are dropped when the store is opened.
+    """
+    def __init__(self, path = ":memory:", deployment = ""):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'deployment'").fetchone()
+        if row is None or row[0] != deployment:
+            with self._conn:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('deployment', ?)", (deployment,))
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE hash = ?", (key,)).fetchone()
+        return array("f", row[0]).tolist() if row else None
+
+    def set_many(self, items):
+        """
+        Stores (text_hash, embedding) pairs in one transaction.
+        """
+        rows = [(key, array("f", values).tobytes()) for key, values in items]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)", rows)
+
+    def retain(self, keys):
+        """
+        Deletes every entry whose hash is not in keys.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (hash TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM keep")
+            self._conn.executemany("INSERT OR IGNORE INTO keep (hash) VALUES (?)", ((k,) for k in keys))
+            self._conn.execute("DELETE FROM embeddings WHERE hash NOT IN (SELECT hash FROM keep)")
+            self._conn.execute("DELETE FROM keep")
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM embeddings")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+def embeddings_path(manifest_path):
+    return f"{manifest_path}.embeddings.sqlite"
+
+class IndexManifest:
+    def __init__(self, deployment = "", chunks = None, embeddings = None, index_version = "", retired_chunks = None):
+        """
+        embeddings: EmbeddingStore of the stored embeddings (default: an in-memory one).
+        """
+        self.deployment = deployment
+        self.chunks = chunks or {}
+        self.embeddings = embeddings if embeddings is not None else EmbeddingStore(deployment = deployment)
+        self.index_version = index_version
+        self.retired_chunks = retired_chunks or {}
+
+    @classmethod
+    def load(cls, path, deployment = ""):
+        """
+        Loads the manifest at path and opens its embedding store. With a different
+        deployment the embeddings are dropped and the chunks retired, so that every
+        chunk is upserted again. Embeddings of older manifests (inline base64)
+        are moved into the store.
+        """
+        if not path:
+            return cls(deployment)
+        store = EmbeddingStore(embeddings_path(path), deployment)
+        if not os.path.exists(path):
+            return cls(deployment, embeddings = store)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        chunks, retired = data.get("chunks", {}), data.get("retired_chunks", {})
+        if data.get("deployment") != deployment:
+            retired = {**retired, **chunks}
+            chunks = {}
+            store.clear()
+        elif data.get("embeddings"):
+            store.set_many((h, _decode_vector(v)) for h, v in data["embeddings"].items())
+        return cls(deployment, chunks, store, data.get("index_version", ""), retired)
+
+    def indexed_chunks(self):
+        """
+        Every chunk in the index, current or retired: {chunk_id: namespace}.
+        """
+        return {**self.retired_chunks, **self.chunks}
+
+    def set_chunks(self, chunks):
+        """
+        Records what the index holds after a run that upserted `chunks` and deleted the rest.
+        """
+        self.chunks = chunks
+        self.retired_chunks = {}
+
+    def save(self, path):
+        self.index_version = compute_index_version(self.chunks)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "deployment": self.deployment,
+                "index_version": self.index_version,
+                "chunks": self.chunks,
+                "retired_chunks": self.retired_chunks,
+            }, f)
+        os.replace(tmp_path, path)
+
+    def get_embedding(self, text):
+        return self.embeddings.get(text_hash(text))
+
+    def set_embeddings(self, embedded):
+        """
+        Stores {text: embedding}.
+        """
+        self.embeddings.set_many((text_hash(t), values) for t, values in embedded.items())
+
+    def set_embedding(self, text, values):
+        self.set_embeddings({text: values})
+
+    def prune_embeddings(self, texts):
+        self.retain_embeddings({text_hash(t) for t in texts})
+
+    def retain_embeddings(self, hashes):
+        self.embeddings.retain(hashes)
+
+def compute_index_version(chunk_ids):
+    """
+    Hash over the set of chunk IDs; changes whenever any chunk is added, edited or removed.
+    """
+    digest = hashlib.sha1()
+    for chunk_id in sorted(chunk_ids):
+        digest.update(chunk_id.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+class IndexVersionWatcher:
+    """
+    Tracks the "index_version" stored in a manifest (or local index) file.
+    The file is re-read only when its mtime changes, checked at most every `interval` seconds.
+    """
+    def __init__(self, path, interval = 5.0):
+        self.path = path
+        self.interval = interval
+        self.version = ""
+        self._mtime = None
+        self._checked_at = None
+
+    def current(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.interval:
+            return self.version
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return self.version
+        if mtime != self._mtime:
+            self._mtime = mtime
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.version = json.load(f).get("index_version", "")
+            except (OSError, ValueError):
+                pass
+        return self.version
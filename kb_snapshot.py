@@ -0,0 +1,214 @@
+# kb_snapshot.py
+"""
+Versioned binary snapshot of the embedded knowledge base, written by
+upload_to_pinecone.py. It re-seeds Pinecone, a local index or the server's
+in-process indexes without parsing HTML or calling the embeddings API.
+
+File layout (little-endian, every section 64-byte aligned, memory-mappable):
+
+    b"KBSNAP\\0\\0"  magic
+    uint32          header length
+    header          JSON: format version, dtype, dim, count, corpus hash (hash of
+                    the chunk IDs, as the manifest's index_version), embeddings
+                    deployment, page table, columns and sections
+    sections        raw arrays, located by header["sections"][name] = [offset, dtype, shape]
+
+    vectors         (count, dim) float16, or int8 with per-row float32 "scales"
+    columns         one per record field (id, namespace, text) and metadata key:
+                    low-cardinality ones as uint16 codes into a value list in the
+                    header, others as uint32 offsets + a UTF-8 blob
+    schema          uint16 code per row into header["schemas"], the metadata keys
+                    the row has (service rows and intro rows differ)
+"""
+import json
+import os
+
+import numpy as np
+
+from index_manifest import compute_index_version
+from page_table import PageTable
+
+MAGIC = b"KBSNAP\0\0"
+SNAPSHOT_VERSION = 1
+ALIGN = 64
+DTYPES = ("float16", "int8")
+RECORD_FIELDS = ("id", "namespace", "text")
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def quantize(matrix, dtype):
+    """
+    (stored array, per-row scales or None) of a float32 matrix.
+    int8 is symmetric per row: q = round(v / max|v| * 127).
+    """
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=1)
+    scales[scales == 0] = 1.0
+    q = np.round(matrix / scales[:, None] * 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+def write_snapshot(path, records, page_table = None, dtype = "float16", deployment = ""):
+    """
+    Writes records ({"id", "namespace", "text", "values", "metadata"}) and the
+    page table to path. Metadata values must be strings.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported snapshot dtype {dtype!r} (use one of {DTYPES})")
+    records = list(records)
+    if not records:
+        raise ValueError("No records to write into the snapshot")
+    matrix = np.asarray([r["values"] for r in records], dtype=np.float32).reshape(len(records), -1)
+    vectors, scales = quantize(matrix, dtype)
+
+    schemas, schema_codes = [], []
+    keys = []
+    for r in records:
+        schema = sorted(r["metadata"])
+        if schema not in schemas:
+            schemas.append(schema)
+        schema_codes.append(schemas.index(schema))
+        keys.extend(k for k in schema if k not in keys)
+
+    arrays = {"vectors": vectors, "schema": np.asarray(schema_codes, dtype=np.uint16)}
+    if scales is not None:
+        arrays["scales"] = scales
+    columns = {}
+    for name in list(RECORD_FIELDS) + [f"metadata.{k}" for k in keys]:
+        if name.startswith("metadata."):
+            values = [r["metadata"].get(name[len("metadata."):], "") for r in records]
+        else:
+            values = [r[name] for r in records]
+        if any(not isinstance(v, str) for v in values):
+            raise ValueError(f"Snapshot column {name!r} has non-string values")
+        distinct = sorted(set(values))
+        if len(distinct) <= min(len(values) // 2, 65535):
+            codes = {v: i for i, v in enumerate(distinct)}
+            columns[name] = {"encoding": "dict", "values": distinct}
+            arrays[f"{name}.codes"] = np.asarray([codes[v] for v in values], dtype=np.uint16)
+        else:
+            blobs = [v.encode("utf-8") for v in values]
+            columns[name] = {"encoding": "blob"}
+            arrays[f"{name}.offsets"] = np.cumsum([0] + [len(b) for b in blobs], dtype=np.uint32)
+            arrays[f"{name}.data"] = np.frombuffer(b"".join(blobs), dtype=np.uint8)
+
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "dtype": dtype,
+        "dim": int(matrix.shape[1]),
+        "count": len(records),
+        "corpus_hash": compute_index_version(r["id"] for r in records),
+        "deployment": deployment,
+        "page_table": page_table.pages if page_table is not None else {},
+        "schemas": schemas,
+        "columns": columns,
+        "sections": {},
+    }
+    # Section offsets depend on the header length, which depends on the offsets:
+    # lay out with a provisional header, then pad the header to the reserved size
+    reserved = 0
+    while True:
+        offset = _align(len(MAGIC) + 4 + reserved)
+        for name, array in arrays.items():
+            header["sections"][name] = [offset, array.dtype.str, list(array.shape)]
+            offset = _align(offset + array.nbytes)
+        encoded = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        if len(encoded) <= reserved:
+            break
+        reserved = _align(len(encoded) + ALIGN)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint32(reserved).tobytes())
+        f.write(encoded.ljust(reserved, b" "))
+        for name, array in arrays.items():
+            f.seek(header["sections"][name][0])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+    return header
+
+class KBSnapshot:
+    def __init__(self, header, sections):
+        self.header = header
+        self._sections = sections
+        self._columns = {}
+
+    @classmethod
+    def load(cls, path, mmap = True):
+        """
+        Opens a snapshot; with mmap, sections are views of the memory-mapped file.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a knowledge-base snapshot")
+            size = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+            header = json.loads(f.read(size))
+        if header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"{path}: snapshot version {header.get('version')}, expected {SNAPSHOT_VERSION}")
+        if mmap:
+            data = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            data = np.fromfile(path, dtype=np.uint8)
+        sections = {}
+        for name, (offset, dtype, shape) in header["sections"].items():
+            dtype = np.dtype(dtype)
+            nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            sections[name] = data[offset:offset + nbytes].view(dtype).reshape(shape)
+        return cls(header, sections)
+
+    @property
+    def corpus_hash(self):
+        return self.header["corpus_hash"]
+
+    def page_table(self):
+        return PageTable(dict(self.header["page_table"]))
+
+    def column(self, name):
+        """
+        The values of a column as a list of strings ("id", "text", "metadata.service", ...).
+        """
+        if name not in self._columns:
+            spec = self.header["columns"][name]
+            if spec["encoding"] == "dict":
+                values = spec["values"]
+                self._columns[name] = [values[c] for c in self._sections[f"{name}.codes"].tolist()]
+            else:
+                offsets = self._sections[f"{name}.offsets"].tolist()
+                blob = self._sections[f"{name}.data"].tobytes()
+                self._columns[name] = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+        return self._columns[name]
+
+    def embeddings(self, start = 0, end = None):
+        """
+        float32 matrix of rows [start, end), dequantized.
+        """
+        vectors = self._sections["vectors"][start:end]
+        if self.header["dtype"] == "int8":
+            return vectors.astype(np.float32) * (self._sections["scales"][start:end, None] / 127)
+        return vectors.astype(np.float32)
+
+    def records(self, with_values = True):
+        """
+        Yields {"id", "namespace", "text", "metadata"} (+ "values") in the snapshot's order.
+        """
+        fields = {name: self.column(name) for name in RECORD_FIELDS}
+        schemas = self.header["schemas"]
+        metadata_columns = {}
+        schema_codes = self._sections["schema"].tolist()
+        vectors = self.embeddings() if with_values else None
+        for i in range(len(self)):
+            metadata = {}
+            for key in schemas[schema_codes[i]]:
+                if key not in metadata_columns:
+                    metadata_columns[key] = self.column(f"metadata.{key}")
+                metadata[key] = metadata_columns[key][i]
+            record = {name: fields[name][i] for name in RECORD_FIELDS}
+            record["metadata"] = metadata
+            if with_values:
+                record["values"] = vectors[i].tolist()
+            yield record
+
+    def __len__(self):
+        return self.header["count"]
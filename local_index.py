@@ -0,0 +1,113 @@
+# local_index.py
+"""
+In-memory vector index used as a local alternative to Pinecone.
+
+On-disk layout (one pair of files per namespace, written by upload_to_pinecone.py):
+    <dir>/<namespace>.npy   float32 matrix, rows L2-normalized and grouped by maslul
+    <dir>/<namespace>.json  {"ids": [...], "metadata": [...], "partitions": {maslul: [start, end]}}
+    <dir>/index.json        {"index_version": ...}
+
+The .npy files are memory-mapped, so startup cost does not grow with the index.
+"""
+import json
+import os
+
+import numpy as np
+
+from index_manifest import compute_index_version
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def save_local_index(records, index_dir):
+    """
+    Writes records ({"id", "namespace", "values", "metadata"}) to index_dir.
+    Rows are sorted by maslul so each tier is one contiguous slice.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    by_namespace = {}
+    for r in records:
+        by_namespace.setdefault(r["namespace"], []).append(r)
+
+    for namespace, rows in by_namespace.items():
+        rows = sorted(rows, key=lambda r: r["metadata"].get("maslul", ""))
+        matrix = _normalize_rows(np.asarray([r["values"] for r in rows], dtype=np.float32))
+        partitions = {}
+        for i, r in enumerate(rows):
+            maslul = r["metadata"].get("maslul", "")
+            start, _ = partitions.get(maslul, (i, i))
+            partitions[maslul] = (start, i + 1)
+        np.save(os.path.join(index_dir, f"{namespace}.npy"), np.ascontiguousarray(matrix))
+        with open(os.path.join(index_dir, f"{namespace}.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": [r["id"] for r in rows],
+                "metadata": [r["metadata"] for r in rows],
+                "partitions": partitions,
+            }, f, ensure_ascii=False)
+    with open(os.path.join(index_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({"index_version": compute_index_version(r["id"] for r in records)}, f)
+
+class NamespaceIndex:
+    def __init__(self, vectors, ids, metadata, partitions):
+        self.vectors = vectors
+        self.ids = ids
+        self.metadata = metadata
+        self.partitions = {k: tuple(v) for k, v in partitions.items()}
+
+    def query(self, vector, top_k, maslul = ""):
+        if maslul:
+            if maslul not in self.partitions:
+                return []
+            start, end = self.partitions[maslul]
+        else:
+            start, end = 0, len(self.ids)
+        block = self.vectors[start:end]
+        if not len(block):
+            return []
+        scores = block @ vector
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"id": self.ids[start + i], "score": float(scores[i]), "metadata": self.metadata[start + i]}
+            for i in top
+        ]
+
+class LocalVectorIndex:
+    """
+    Exact cosine top-k over per-namespace float32 matrices.
+    The maslul filter is a precomputed row slice rather than a per-row check.
+    """
+    def __init__(self, namespaces):
+        self.namespaces = namespaces
+
+    @classmethod
+    def load(cls, index_dir, mmap = True):
+        namespaces = {}
+        for name in sorted(os.listdir(index_dir)):
+            if not name.endswith(".npy"):
+                continue
+            namespace = name[:-4]
+            vectors = np.load(os.path.join(index_dir, name), mmap_mode="r" if mmap else None)
+            with open(os.path.join(index_dir, f"{namespace}.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            namespaces[namespace] = NamespaceIndex(vectors, meta["ids"], meta["metadata"], meta["partitions"])
+        return cls(namespaces)
+
+    def query(self, vector, top_k = 5, namespace = "", maslul = ""):
+        """
+        Returns Pinecone-style matches: [{"id", "score", "metadata"}, ...].
+        """
+        ns = self.namespaces.get(namespace)
+        if ns is None:
+            return []
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+        return ns.query(q, top_k, maslul)
+
+    def __len__(self):
+        return sum(len(ns.ids) for ns in self.namespaces.values())
@@ -0,0 +1,135 @@
+# metrics.py
+"""
+Prometheus metrics for the chat pipeline (served by the server's /metrics).
+
+    chat_stage_seconds{endpoint, stage}  - duration of each pipeline stage
+                                           (lookup, embedding, vector, bm25, context, completion, total, ...)
+    openai_tokens{call, kind}            - prompt / completion tokens from the OpenAI usage fields
+                                           (counted locally for streamed chat completions)
+    chat_prompt_tokens{phase}            - locally counted tokens of the budgeted prompt
+    chat_retrievals_total{retrieval}     - QA turns by retrieval path (none / reuse / lookup / answer_cache / rag)
+    embedding_batch_size                 - inputs per query-embeddings call (micro-batching)
+    cache_hits_total, cache_misses_total, cache_hit_ratio {cache}
+                                         - read from the caches' stats() at scrape time
+    upstream_calls_total, coalesced_requests_total {kind}
+                                         - single-flight embedding / retrieval calls vs joiners
+
+A Timings object collects the stage durations of one request; they are also
+returned to the client in the optional "timings" block of /chat.
+"""
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# Own registry, so re-importing the server (benchmarks) does not register metrics twice
+registry = CollectorRegistry()
+
+stage_seconds = Histogram(
+    "chat_stage_seconds", "Duration of each chat pipeline stage",
+    ["endpoint", "stage"], buckets=STAGE_BUCKETS, registry=registry
+)
+openai_tokens = Histogram(
+    "openai_tokens", "Tokens per OpenAI call, from the usage fields",
+    ["call", "kind"], buckets=TOKEN_BUCKETS, registry=registry
+)
+prompt_tokens = Histogram(
+    "chat_prompt_tokens", "Locally counted tokens of the budgeted chat prompt",
+    ["phase"], buckets=TOKEN_BUCKETS, registry=registry
+)
+embedding_batch_size = Histogram(
+    "embedding_batch_size", "Inputs per query-embeddings call",
+    buckets=(1, 2, 4, 8, 16, 32, 64), registry=registry
+)
+retrievals = Counter(
+    "chat_retrievals", "QA turns by retrieval path", ["retrieval"], registry=registry
+)
+
+# name -> fn returning a stats() dict with "hits", "misses" and "hit_rate" (or None when disabled)
+cache_sources = {}
+# name -> fn returning a SingleFlight.stats() dict
+coalescing_sources = {}
+
+class StatsCollector:
+    """
+    Cache and single-flight counters, read from the registered sources at scrape time.
+    """
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Cache hit rate since start", labels=["cache"])
+        for name, stats_fn in cache_sources.items():
+            stats = stats_fn()
+            if stats is None:
+                continue
+            hits.add_metric([name], stats["hits"] + stats.get("backend_hits", 0))
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], stats["hit_rate"])
+        yield from (hits, misses, ratio)
+
+        calls = CounterMetricFamily("upstream_calls", "Single-flight calls that went upstream", labels=["kind"])
+        coalesced = CounterMetricFamily("coalesced_requests", "Requests that joined an identical call in flight", labels=["kind"])
+        for name, stats_fn in coalescing_sources.items():
+            stats = stats_fn()
+            calls.add_metric([name], stats["calls"])
+            coalesced.add_metric([name], stats["coalesced"])
+        yield from (calls, coalesced)
+
+registry.register(StatsCollector())
+
+def record_usage(call, usage, timings = None):
+    """
+    Observes the token counts of an OpenAI response's usage (ignored when missing).
+    """
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        count = getattr(usage, kind, None)
+        if count is None:
+            continue
+        openai_tokens.labels(call, kind.split("_")[0]).observe(count)
+        if timings is not None:
+            key = f"{call}_{kind}"
+            timings.tokens[key] = timings.tokens.get(key, 0) + count
+
+def render():
+    """
+    (body, content type) of the Prometheus text exposition.
+    """
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+class Timings:
+    """
+    Stage durations of one request; each stage is observed into chat_stage_seconds as it ends.
+    """
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.stages = {}
+        self.tokens = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def record(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        stage_seconds.labels(self.endpoint, name).observe(seconds)
+
+    def finish(self):
+        self.record("total", time.perf_counter() - self._start)
+        return self
+
+    def as_dict(self):
+        return {
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            "tokens": dict(self.tokens),
+        }
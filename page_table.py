@@ -0,0 +1,111 @@
+# page_table.py
+"""
+Side table of per-page data shared by every service chunk of a page.
+
+Service vectors only carry a "page_id"; the page intro and the kupa contacts
+(phones / links) are stored once here:
+
+    {page_id: {"intro": "...", "contacts": {kupa: {"phones": "...", "links": "..."}}}}
+
+Written next to the index by upload_to_pinecone.py and loaded by the server
+(or rebuilt from the HTML files, which yields the same IDs).
+"""
+import json
+import logging
+import os
+
+from context_snippets import render_contact_block, render_intro_block
+from index_manifest import text_hash
+
+def make_page_id(intro):
+    return f"page_{text_hash(intro)[:16]}"
+
+class PageTable:
+    def __init__(self, pages = None):
+        self.pages = pages or {}
+        self._blocks = {}       # (page_id, kupa) -> rendered (intro block, contact block)
+        self._unresolved = set()  # page_ids already warned about
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.pages, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def add_chunk(self, chunk):
+        """
+        Records the intro and kupa contacts of a parsed service chunk.
+        """
+        if chunk.get("chunk_type") != "service":
+            return
+        intro = chunk.get("intro", "")
+        page_id = make_page_id(intro)
+        page = self.pages.setdefault(page_id, {"intro": intro, "contacts": {}})
+        contacts = chunk.get("kupa_contacts", {})
+        self._blocks.pop((page_id, chunk.get("kupa", "")), None)
+        page["contacts"][chunk.get("kupa", "")] = {
+            "phones": ", ".join(contacts.get("phones", [])),
+            "links": ", ".join(contacts.get("links", [])),
+        }
+
+    def collect(self, chunks):
+        """
+        Passes chunks through (e.g. into the upload) while recording their pages.
+        """
+        for chunk in chunks:
+            self.add_chunk(chunk)
+            yield chunk
+
+    def intro(self, page_id):
+        return self.pages.get(page_id, {}).get("intro", "")
+
+    def contacts(self, page_id, kupa):
+        return self.pages.get(page_id, {}).get("contacts", {}).get(kupa, {})
+
+    def resolve(self, metadata):
+        """
+        Returns the metadata with "intro", "phones" and "links" filled in from the table.
+        Older vectors that still carry them inline are returned unchanged.
+        """
+        page_id = metadata.get("page_id")
+        if not page_id:
+            return metadata
+        contacts = self.contacts(page_id, metadata.get("kupa", ""))
+        return {
+            **metadata,
+            "intro": self.intro(page_id),
+            "phones": contacts.get("phones", ""),
+            "links": contacts.get("links", ""),
+        }
+
+    def context_blocks(self, metadata):
+        """
+        (intro block, contact block) of a row's page for the RAG context, rendered
+        once per page and kupa. Older vectors are rendered from their inline fields.
+        """
+        page_id = metadata.get("page_id")
+        if not page_id:
+            return (
+                render_intro_block(metadata.get("intro", "")),
+                render_contact_block(metadata.get("phones", ""), metadata.get("links", "")),
+            )
+        key = (page_id, metadata.get("kupa", ""))
+        blocks = self._blocks.get(key)
+        if blocks is None:
+            if page_id not in self.pages and page_id not in self._unresolved:
+                self._unresolved.add(page_id)
+                logging.warning(f"Page {page_id} is not in the page table: its intro and contacts are left out")
+            contacts = self.contacts(*key)
+            blocks = self._blocks[key] = (
+                render_intro_block(self.intro(page_id)),
+                render_contact_block(contacts.get("phones", ""), contacts.get("links", "")),
+            )
+        return blocks
+
+    def __len__(self):
+        return len(self.pages)
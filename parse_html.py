@@ -1,5 +1,24 @@
-from bs4 import BeautifulSoup
+import hashlib
+import json
+import os
 import re
+from html.parser import HTMLParser
+
+KUPOT = ["מכבי", "מאוחדת", "כללית"]
+MASLULIM = ["זהב", "כסף", "ארד"]
+
+URL_RE = re.compile(r'(https?://[^\s:]+)')
+MASLUL_PATTERNS = {
+    maslul: re.compile(rf"{maslul}:(.*?)(?:(?:זהב|כסף|ארד):|$)")
+    for maslul in MASLULIM
+}
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr"
+}
+
+# Bump when the chunk format changes, so ParsedChunkCache drops old entries
+PARSER_VERSION = "2"
 
 def extract_kupa_contacts(outro_text):
     kupa_contacts = {
@@ -10,7 +29,7 @@ def extract_kupa_contacts(outro_text):
     for line in outro_text.split("\n"):
         line_lower = line.lower().strip()
         if "http" in line_lower:
-            url_match = re.search(r'(https?://[^\s:]+)', line)
+            url_match = URL_RE.search(line)
             if url_match:
                 url = url_match.group(1)
                 if "maccabi" in url and not kupa_contacts["מכבי"]["links"]:
@@ -26,92 +45,321 @@ def extract_kupa_contacts(outro_text):
         kupa_contacts[k]["phones"] = sorted(list(kupa_contacts[k]["phones"]))
     return kupa_contacts
 
-def parse_services_html(file_path):
+class _Element:
+    __slots__ = ("name", "attrs", "order", "text_start", "children", "string", "last_was_text")
+
+    def __init__(self, name, attrs, order, text_start):
+        self.name = name
+        self.attrs = attrs
+        self.order = order
+        self.text_start = text_start
+        self.children = 0
+        self.string = None          # same as BeautifulSoup's Tag.string
+        self.last_was_text = False
+
+class _ServicesPageBuilder:
     """
-    Parse an Israeli HMO services HTML file.
-    Each service will include also the intro text of the page under the key 'intro'.
-    The first line of the intro will also be appended to the 'service' field (in order to improve retrieval)
+    Builds the intro, service and outro chunks of one page from start / data / end
+    events, in a single pass:
+        intro    - the single-string elements before the first table
+        services - one chunk per table row x kupa x maslul
+        outro    - <p>/<div> text and <a> links from the last table onwards
     """
-    with open(file_path, encoding="utf-8") as f:
-        soup = BeautifulSoup(f, "html.parser")
+    def __init__(self):
+        self.texts = []
+        self.stack = [_Element("", {}, -1, 0)]
+        self.order = 0
+        self.intro_items = []
+        self.intro_text = None      # fixed when the first table starts
+        self.outro_items = []
+        self.last_table_order = None
+        self.tables = []            # open tables: {"headers", "rows"}
+        self.row = None
+        self.service_chunks = []
 
-    all_chunks = []
-    intro_text = ""
+    def _text_of(self, element, strip = False):
+        texts = self.texts[element.text_start:]
+        if strip:
+            return "".join(t.strip() for t in texts)
+        return "".join(texts)
 
-    tables = soup.find_all("table")
-    first_table = tables[0] if tables else None
-    last_table = tables[-1] if tables else None
+    def start(self, name, attrs):
+        element = _Element(name, dict(attrs), self.order, len(self.texts))
+        self.order += 1
+        if name == "body":
+            self.intro_items = []
+        elif name == "table":
+            if self.intro_text is None:
+                self._finish_intro()
+            self.last_table_order = element.order
+            self.outro_items = []
+            self.tables.append({"headers": [], "rows": []})
+        elif name == "tr" and self.tables:
+            self.row = []
+            self.tables[-1]["rows"].append(self.row)
+        self.stack.append(element)
+        if name in VOID_ELEMENTS:
+            self.end(name)
 
-    # Extract intro text (before first table)
-    if first_table:
-        intro = ""
-        for elem in first_table.find_all_previous():
-            if elem.name == 'body':
-                break
-            if elem.string and elem.string.strip():
-                intro = elem.string.strip() + "\n" + intro
-        if intro.strip():
-            intro_text = intro.strip()
-            all_chunks.append({
-                "chunk_type": "intro",
-                "text": intro_text
-            })
-
-    # Extract first line/title from intro
-    intro_title = intro_text.splitlines()[0].strip() if intro_text else ""
-
-    # Parse all tables (service chunks)
-    for table in tables:
-        headers = [th.text.strip() for th in table.find_all("th")]
-        if not any(kupa in headers for kupa in ["מכבי", "מאוחדת", "כללית"]):
-            continue
-        rows = table.find_all("tr")[1:]
-        for row in rows:
-            cells = row.find_all("td")
-            if not cells or len(cells) != 4:
+    @staticmethod
+    def _add_child(parent, string, is_text = False):
+        parent.children += 1
+        parent.string = string if parent.children == 1 else None
+        parent.last_was_text = is_text
+
+    def data(self, text):
+        parent = self.stack[-1]
+        self.texts.append(text)
+        if parent.last_was_text:
+            # Adjacent text is one string, as in BeautifulSoup
+            if parent.children == 1:
+                parent.string += text
+        else:
+            self._add_child(parent, text, is_text=True)
+
+    def comment(self, text):
+        self._add_child(self.stack[-1], text)
+
+    def end(self, name):
+        if not any(e.name == name for e in self.stack[1:]):
+            return
+        while True:
+            element = self.stack.pop()
+            self._close(element)
+            if element.name == name:
+                return
+
+    def _close(self, element):
+        if element.children != 1:
+            element.string = None
+        self._add_child(self.stack[-1], element.string)
+
+        if self.intro_text is None:
+            if element.string and element.string.strip():
+                self.intro_items.append((element.order, element.string.strip()))
+        elif self.last_table_order is not None and element.order > self.last_table_order:
+            if element.name in ("p", "div"):
+                text = self._text_of(element, strip=True)
+                if text:
+                    self.outro_items.append((element.order, text))
+            if element.name == "a" and element.attrs.get("href"):
+                self.outro_items.append((element.order, f"{self._text_of(element, strip=True)}: {element.attrs['href']}"))
+
+        if self.tables:
+            if element.name == "th":
+                self.tables[-1]["headers"].append(self._text_of(element).strip())
+            elif element.name == "td" and self.row is not None:
+                self.row.append(self._text_of(element))
+            elif element.name == "table":
+                self._finish_table(self.tables.pop())
+
+    def _finish_intro(self):
+        lines = [text for _, text in sorted(self.intro_items)]
+        self.intro_text = "\n".join(lines).strip() if lines else ""
+
+    def _finish_table(self, table):
+        if not any(kupa in table["headers"] for kupa in KUPOT):
+            return
+        intro_title = self.intro_text.splitlines()[0].strip() if self.intro_text else ""
+        for cells in table["rows"][1:]:
+            if len(cells) != 4:
                 continue
-            base_service = cells[0].text.strip()
+            base_service = cells[0].strip()
             # Appending the intro title to the service
             service_with_intro = base_service
             if intro_title and intro_title not in base_service:
                 service_with_intro = f"{base_service} {intro_title}"
-            for i, kupa in enumerate(["מכבי", "מאוחדת", "כללית"]):
-                raw_txt = cells[i+1].text.strip().replace("\n", " ")
-                for maslul in ["זהב", "כסף", "ארד"]:
-                    match = re.search(rf"{maslul}:(.*?)(?:(?:זהב|כסף|ארד):|$)", raw_txt)
+            for i, kupa in enumerate(KUPOT):
+                raw_txt = cells[i + 1].strip().replace("\n", " ")
+                for maslul, pattern in MASLUL_PATTERNS.items():
+                    match = pattern.search(raw_txt)
                     if match:
-                        benefit = match.group(1).strip().replace("•", "-")
-                        all_chunks.append({
+                        self.service_chunks.append({
                             "chunk_type": "service",
                             "kupa": kupa,
                             "maslul": maslul,
-                            "service": service_with_intro,   # <<-- Here!
-                            "benefit": benefit,
-                            "intro": intro_text
+                            "service": service_with_intro,
+                            "benefit": match.group(1).strip().replace("•", "-"),
+                            "intro": self.intro_text
                         })
 
-    # Extract outro text (after last table)
-    outro = ""
-    if last_table:
-        for elem in last_table.find_all_next():
-            if elem.name == 'body':
-                break
-            if elem.name in ['p', 'div'] and elem.get_text(strip=True):
-                outro += elem.get_text(strip=True) + "\n"
-            if elem.name == 'a' and elem.get('href'):
-                link_text = elem.get_text(strip=True)
-                link_url = elem.get('href')
-                outro += f"{link_text}: {link_url}\n"
+    def close(self):
+        while len(self.stack) > 1:
+            self._close(self.stack.pop())
+        if self.intro_text is None:
+            # No table: the page has neither intro nor outro chunks
+            self.intro_text = ""
+        chunks = []
+        if self.intro_text:
+            chunks.append({"chunk_type": "intro", "text": self.intro_text})
+        chunks.extend(self.service_chunks)
+
+        outro = "".join(f"{text}\n" for _, text in sorted(self.outro_items))
         if outro.strip():
-            all_chunks.append({
-                "chunk_type": "outro",
-                "text": outro.strip()
-            })
-
-    kupa_contacts = extract_kupa_contacts(outro)
-    for chunk in all_chunks:
-        if chunk.get("chunk_type") == "service":
+            chunks.append({"chunk_type": "outro", "text": outro.strip()})
+        kupa_contacts = extract_kupa_contacts(outro)
+        for chunk in self.service_chunks:
             chunk["kupa_contacts"] = kupa_contacts.get(chunk["kupa"], {})
+        return chunks
+
+class _StdlibEvents(HTMLParser):
+    def __init__(self, builder):
+        super().__init__(convert_charrefs=True)
+        self.builder = builder
+
+    def handle_starttag(self, tag, attrs):
+        self.builder.start(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self.builder.start(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.builder.end(tag)
+
+    def handle_endtag(self, tag):
+        self.builder.end(tag)
+
+    def handle_data(self, data):
+        self.builder.data(data)
+
+    def handle_comment(self, data):
+        self.builder.comment(data)
+
+def _feed_lxml(builder, html_text):
+    import lxml.etree
+    import lxml.html
 
-    return all_chunks
+    def walk(element):
+        if isinstance(element.tag, str):
+            builder.start(element.tag, element.attrib.items())
+            if element.text:
+                builder.data(element.text)
+            for child in element:
+                walk(child)
+            builder.end(element.tag)
+        elif element.tag is lxml.etree.Comment:
+            builder.comment(element.text or "")
+        if element.tail:
+            builder.data(element.tail)
 
+    walk(lxml.html.document_fromstring(html_text))
+
+def parse_services_text(html_text, backend = "html.parser"):
+    """
+    Parses the HTML of one services page (see parse_services_html).
+    backend: "html.parser" (stdlib, streaming) or "lxml" (C parser, needs lxml installed).
+    """
+    builder = _ServicesPageBuilder()
+    if backend == "lxml":
+        _feed_lxml(builder, html_text)
+    else:
+        events = _StdlibEvents(builder)
+        events.feed(html_text)
+        events.close()
+    return builder.close()
+
+def parse_services_html(file_path, backend = None):
+    """
+    Parse an Israeli HMO services HTML file.
+    Each service will include also the intro text of the page under the key 'intro'.
+    The first line of the intro will also be appended to the 'service' field (in order to improve retrieval)
+    The backend defaults to HTML_PARSER_BACKEND ("html.parser").
+    """
+    with open(file_path, encoding="utf-8") as f:
+        html_text = f.read()
+    return parse_services_text(html_text, backend or os.getenv("HTML_PARSER_BACKEND", "html.parser"))
+
+class ParsedChunkCache:
+    """
+    Directory of parsed chunks, one JSON file per HTML file, so unchanged files
+    are not parsed again. An entry is reused when the file's mtime and size
+    match, or else when its SHA-1 matches (e.g. after a checkout that only
+    touched mtimes). Entries are independent files, so parser processes can
+    share the directory and nothing is loaded up front.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, file_path):
+        key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_entry(self, entry_path):
+        try:
+            with open(entry_path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("parser_version") == PARSER_VERSION else None
+
+    def _save_entry(self, entry_path, entry):
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+
+    def get_chunks(self, file_path, backend = None):
+        entry_path = self._entry_path(file_path)
+        stat = os.stat(file_path)
+        entry = self._load_entry(entry_path)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            self.hits += 1
+            return entry["chunks"]
+        with open(file_path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        if entry and entry["sha1"] == digest:
+            self.hits += 1
+            chunks = entry["chunks"]
+        else:
+            self.misses += 1
+            chunks = parse_services_text(raw.decode("utf-8"), backend or os.getenv("HTML_PARSER_BACKEND", "html.parser"))
+        self._save_entry(entry_path, {
+            "parser_version": PARSER_VERSION,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "sha1": digest,
+            "chunks": chunks
+        })
+        return chunks
+
+def _parse_file(file_path, cache_dir = "", backend = None):
+    if cache_dir:
+        return ParsedChunkCache(cache_dir).get_chunks(file_path, backend)
+    return parse_services_html(file_path, backend)
+
+def iter_services_chunks(file_paths, workers = 1, cache_dir = "", backend = None):
+    """
+    Yields the chunks of every file, file by file in the given order.
+    With workers > 1 files are parsed on a process pool; at most 2 x workers
+    files are parsed ahead of the consumer, so the chunks held here do not grow with the corpus.
+    With cache_dir, unchanged files are served from a ParsedChunkCache.
+    """
+    if workers <= 1:
+        for path in file_paths:
+            yield from _parse_file(path, cache_dir, backend)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    paths = iter(file_paths)
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(_parse_file, path, cache_dir, backend))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            chunks = pending.popleft().result()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append(pool.submit(_parse_file, next_path, cache_dir, backend))
+            yield from chunks
+
+def parse_services_files(file_paths, cache_dir = "", workers = 1):
+    """
+    Parses several HTML files and returns all their chunks, in file order.
+    """
+    return list(iter_services_chunks(file_paths, workers, cache_dir))
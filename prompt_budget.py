@@ -0,0 +1,178 @@
+# prompt_budget.py
+"""
+Token budgeting for the chat prompt.
+
+The prompt keeps the system prompt, the RAG context and the last N history
+messages. Older messages are replaced by a rolling summary, cached by a hash of
+the summarized prefix. Summaries are made per block of messages, so the
+summarized prefix (and with it the summarization call) changes once per block
+rather than every turn. A missing summary is produced in the background, so a
+request never waits for it: until it is ready, the older messages are kept
+verbatim while they fit the budget and dropped oldest-first when they do not.
+Compaction is for the QA phase; onboarding is sent verbatim (build(compact=False)),
+so ID and card numbers are never summarized away.
+
+In the QA phase the onboarding dialogue is not replayed; the confirmed
+user_data is given to the model as one compact line instead.
+"""
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+from token_counter import count_message_tokens
+
+# Sent by /confirm_user_data when the user confirms their details (end of onboarding)
+ONBOARDING_DONE_PREFIX = "תודה! הפרטים נקלטו בהצלחה"
+ONBOARDING_DONE_MESSAGE = f"{ONBOARDING_DONE_PREFIX}. כעת אפשר לשאול שאלות על ההטבות והכיסויים במסלול שלך."
+
+# Fields given to the model in the QA phase: what answers depend on (benefits by
+# age, e.g. "חינם עד גיל 18"). Never the name, ID or card number. The semantic
+# answer cache is partitioned by this line, so answers are only shared between
+# users with the same profile.
+PROFILE_FIELDS = [("gender", "gender"), ("age", "age"), ("hmo_name", "HMO"), ("membership_tier", "tier")]
+
+def user_profile_line(user_data):
+    """
+    'User profile (confirmed): gender=נקבה, age=34, HMO=מכבי, tier=זהב' ("" when empty).
+    """
+    parts = [f"{label}={user_data[key]}" for key, label in PROFILE_FIELDS if str(user_data.get(key, "")).strip()]
+    return f"User profile (confirmed): {', '.join(parts)}" if parts else ""
+
+def strip_onboarding(history):
+    """
+    Drops the onboarding dialogue (up to and including the confirmation message).
+    History from other clients, without that message, is returned unchanged.
+    """
+    for i in range(len(history) - 1, -1, -1):
+        msg = history[i]
+        if msg.get("role") == "assistant" and msg.get("content", "").startswith(ONBOARDING_DONE_PREFIX):
+            return history[i + 1:]
+    return history
+
+def prefix_hashes(messages):
+    """
+    hashes[i] identifies messages[:i + 1].
+    """
+    digest = hashlib.sha1()
+    hashes = []
+    for m in messages:
+        digest.update(f"{m.get('role', '')}\x00{m.get('content', '')}\x01".encode("utf-8"))
+        hashes.append(digest.copy().hexdigest())
+    return hashes
+
+class HistoryCompactor:
+    def __init__(self, summarize = None, token_budget = 6000, keep_messages = 6, cache_size = 1024, summary_block = 6):
+        """
+        summarize: async fn(previous_summary, messages) -> summary text, or None to never summarize.
+        summary_block: older messages are folded into the summary this many at a time.
+        """
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.keep_messages = keep_messages
+        self.summary_block = max(1, summary_block)
+        self.cache_size = cache_size
+        self._summaries = OrderedDict()     # prefix hash -> summary of that prefix
+        self._pending = {}                  # prefix hash -> background task
+        self.stats = {"requests": 0, "summary_hits": 0, "summaries_made": 0, "messages_dropped": 0}
+
+    def _cached_summary(self, hashes):
+        """
+        Longest summarized prefix: (number of messages covered, summary).
+        """
+        for i in range(len(hashes) - 1, -1, -1):
+            summary = self._summaries.get(hashes[i])
+            if summary is not None:
+                self._summaries.move_to_end(hashes[i])
+                return i + 1, summary
+        return 0, ""
+
+    def _schedule_summary(self, key, previous_summary, messages):
+        if self.summarize is None or key in self._pending or key in self._summaries:
+            return
+
+        async def run():
+            try:
+                summary = await self.summarize(previous_summary, messages)
+                if summary:
+                    self._summaries[key] = summary
+                    self.stats["summaries_made"] += 1
+                    while len(self._summaries) > self.cache_size:
+                        self._summaries.popitem(last=False)
+            except Exception:
+                logging.exception("History summarization failed")
+            finally:
+                self._pending.pop(key, None)
+
+        self._pending[key] = asyncio.get_running_loop().create_task(run())
+
+    async def wait_for_summaries(self):
+        """
+        Waits for the background summaries in flight (shutdown, benchmarks).
+        """
+        if self._pending:
+            await asyncio.gather(*list(self._pending.values()), return_exceptions=True)
+
+    def build(self, system_prompt, history, context_text = "", compact = True):
+        """
+        Returns (messages, stats). The RAG context (if any) is inserted just
+        before the last user message, as the server always did.
+        With compact=False the whole history is kept: nothing is summarized or dropped.
+        """
+        self.stats["requests"] += 1
+        keep = self.keep_messages if compact else len(history)
+        recent = list(history[-keep:]) if keep else []
+        older = list(history[:len(history) - len(recent)])
+
+        covered, summary = 0, ""
+        if older:
+            hashes = prefix_hashes(older)
+            covered, summary = self._cached_summary(hashes)
+            if covered:
+                self.stats["summary_hits"] += 1
+            # Only whole blocks, so later turns find the same summarized prefix
+            upto = covered + (len(older) - covered) // self.summary_block * self.summary_block
+            if upto > covered:
+                self._schedule_summary(hashes[upto - 1], summary, older[covered:upto])
+        unsummarized = older[covered:]
+
+        system = [{"role": "system", "content": system_prompt}]
+        summary_msgs = [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}] if summary else []
+        context_msgs = [{"role": "assistant", "content": context_text}] if context_text else []
+
+        # Never dropped: system prompt, summary, context and the last user message
+        last_user = max((i for i, m in enumerate(recent) if m.get("role") == "user"), default=None)
+        fixed = count_message_tokens(system + summary_msgs + context_msgs)
+        if last_user is not None:
+            fixed += count_message_tokens([recent[last_user]])
+        droppable = unsummarized + [m for i, m in enumerate(recent) if i != last_user]
+        costs = [count_message_tokens([m]) for m in droppable]
+
+        # Drop oldest-first until the rest fits
+        dropped = 0
+        total = fixed + sum(costs)
+        while compact and dropped < len(droppable) and total > self.token_budget:
+            total -= costs[dropped]
+            dropped += 1
+        self.stats["messages_dropped"] += dropped
+
+        dropped_ids = {id(m) for m in droppable[:dropped]}
+        conversation = [m for m in unsummarized + recent if id(m) not in dropped_ids]
+        if context_msgs:
+            for i in range(len(conversation) - 1, -1, -1):
+                if conversation[i].get("role") == "user":
+                    conversation = conversation[:i] + context_msgs + conversation[i:]
+                    break
+        messages = system + summary_msgs + conversation
+
+        stats = {
+            "prompt_tokens": count_message_tokens(messages),
+            "system_tokens": count_message_tokens(system),
+            "summary_tokens": count_message_tokens(summary_msgs),
+            "context_tokens": count_message_tokens(context_msgs),
+            "history_messages": len(history),
+            "summarized_messages": covered,
+            "kept_messages": len(conversation) - len(context_msgs),
+            "dropped_messages": dropped,
+        }
+        return messages, stats
@@ -0,0 +1,73 @@
+# records.py
+"""
+Conversion of parsed HTML chunks (parse_html.parse_services_html) into index records.
+Shared by the ingestion script and the server, so both derive the same chunk IDs.
+"""
+import glob
+import os
+
+from index_manifest import make_chunk_id
+from page_table import make_page_id
+
+# Mapping Hebrew kupa names to ASCII-safe Pinecone namespaces
+KUPA_NAMESPACE_MAP = {
+    "מכבי": "maccabi",
+    "מאוחדת": "meuhedet",
+    "כללית": "clalit"
+}
+
+def chunk_to_record(chunk):
+    """
+    Converts a parsed chunk into {"id", "namespace", "text", "metadata"} (no embedding yet).
+    Embeds only service and benefit. The page intro and kupa contacts are not
+    copied into every service's metadata, only a "page_id" into the PageTable.
+    The ID is derived from the chunk content (see index_manifest.make_chunk_id).
+    Returns None for chunk types that are not indexed.
+    """
+    # Mapping hebrew healthFund names into English
+    kupa_hebrew = chunk.get("kupa", "")
+    kupa_namespace = KUPA_NAMESPACE_MAP.get(kupa_hebrew, "general")
+
+    if chunk['chunk_type'] == "service":
+        # Embed ONLY service and benefit
+        text = f"{chunk['service']} - {chunk['benefit']}"
+        metadata = {
+            "service": chunk.get("service", ""),
+            "benefit": chunk.get("benefit", ""),
+            "maslul": chunk.get("maslul", ""),
+            "kupa": kupa_hebrew,
+            "page_id": make_page_id(chunk.get("intro", "")),
+        }
+    elif chunk['chunk_type'] in ["intro", "outro"]:
+        text = chunk['text']
+        metadata = {
+            "chunk_type": chunk["chunk_type"],
+            "kupa": kupa_hebrew,
+            "maslul": "",
+            "service": "",
+            "benefit": ""
+        }
+    else:
+        return None
+    return {
+        "id": make_chunk_id(kupa_namespace, chunk['chunk_type'], text, metadata),
+        "namespace": kupa_namespace,
+        "text": text,
+        "metadata": metadata
+    }
+
+def load_records(data_dir, cache_dir = "", page_table = None):
+    """
+    Parses every HTML file in data_dir and returns the de-duplicated records (no embeddings).
+    With cache_dir, unchanged files are read from the parsed-chunk cache.
+    Pages are recorded into page_table when one is given.
+    """
+    from parse_html import parse_services_files
+    records = {}
+    for chunk in parse_services_files(sorted(glob.glob(os.path.join(data_dir, "*.html"))), cache_dir):
+        if page_table is not None:
+            page_table.add_chunk(chunk)
+        record = chunk_to_record(chunk)
+        if record:
+            records[record["id"]] = record
+    return list(records.values())
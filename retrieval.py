@@ -0,0 +1,62 @@
+# retrieval.py
+"""
+Pluggable vector-search backends for rag_retrieve.
+Each backend exposes: async query(vector, namespace, maslul, top_k) -> list of matches
+(dicts with "id", "score", "metadata"), async warm_up() and close().
+"""
+import asyncio
+from functools import partial
+
+class PineconeRetriever:
+    """
+    Remote Pinecone index. The client is blocking, so queries run on the given executor.
+    """
+    name = "pinecone"
+
+    def __init__(self, index, executor):
+        self.index = index
+        self.executor = executor
+
+    async def query(self, vector, namespace, maslul, top_k = 5):
+        filter_obj = {"maslul": {"$eq": maslul}} if maslul else None
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.executor, partial(
+            self.index.query,
+            vector = vector,
+            top_k = top_k,
+            namespace = namespace,
+            include_metadata = True,
+            filter = filter_obj
+        ))
+        return [
+            {"id": m["id"], "score": m["score"], "metadata": m["metadata"]}
+            for m in results["matches"]
+        ]
+
+    async def warm_up(self):
+        """
+        Opens a pooled connection to the index (a stats call) before the first query.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.index.describe_index_stats)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+class LocalRetriever:
+    """
+    In-process LocalVectorIndex. Queries take microseconds, so they run inline.
+    """
+    name = "local"
+
+    def __init__(self, local_index):
+        self.local_index = local_index
+
+    async def query(self, vector, namespace, maslul, top_k = 5):
+        return self.local_index.query(vector, top_k=top_k, namespace=namespace, maslul=maslul)
+
+    async def warm_up(self):
+        pass
+
+    def close(self):
+        pass
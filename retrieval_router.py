@@ -0,0 +1,184 @@
+# retrieval_router.py
+"""
+Decides per QA turn whether the turn needs a retrieval, with compiled word
+rules only (no embedding or model call):
+
+    none     - acknowledgements and small talk ("תודה", "ok", "got it")
+    reuse    - follow-ups on the previous turn's rows ("and for silver?", "ומה המחיר?").
+               The client sends back its previous retrieved_docs; their services
+               are looked up again in the server's own rows (never trusted as sent),
+               re-filtered to the kupa / tier the follow-up names
+    retrieve - everything else. Elliptical follow-ups are rewritten into a
+               standalone query first: the new subject alone ("ומה לגבי משקפיים?"
+               -> "משקפיים"), or the previous question when there is no new subject
+               and nothing to reuse
+"""
+import re
+
+from records import KUPA_NAMESPACE_MAP
+
+TOKEN_RE = re.compile(r"[\w֐-׿]+", re.UNICODE)
+HEBREW_PREFIXES = set("והבלמשכ")
+
+ACKNOWLEDGEMENTS = {
+    "תודה", "תודות", "רבה", "אוקיי", "אוקי", "בסדר", "מעולה", "סבבה", "יופי", "אחלה", "הבנתי",
+    "מצוין", "מצויין", "נהדר", "טוב", "שלום", "היי", "ביי", "להתראות", "לילה", "יום",
+    "ok", "okay", "k", "thanks", "thank", "you", "thx", "ty", "great", "cool", "nice", "perfect",
+    "got", "it", "understood", "bye", "hi", "hello", "good", "fine", "awesome", "very", "much",
+}
+# Words that refer back to the previous answer
+ANAPHORA = {
+    "זה", "זו", "זאת", "הזה", "הזאת", "אותו", "אותה", "אותם", "עליו", "עליה", "עליהם", "לזה", "בזה",
+    "it", "this", "that", "them", "those", "these", "same",
+}
+# Words that open a follow-up ("ומה לגבי ...", "what about ...")
+LEADS = {"ומה", "ואם", "ולגבי", "ואיך", "וכמה", "ובמסלול", "and", "also", "about"}
+# Question and filler words that name no subject
+FILLER = {
+    "מה", "כמה", "איך", "האם", "אם", "עם", "לגבי", "גם", "יש", "אין", "לי", "אני", "את", "של", "על",
+    "עולה", "עולים", "עלות", "מחיר", "המחיר", "כסף", "מגיע", "מגיעה", "מגיעים", "הנחה", "ההנחה", "כיסוי",
+    "מכוסה", "מכוסים", "אפשר", "לקבל", "מקבלים", "מסלול", "במסלול", "קופה", "בקופה", "שם", "אז",
+    "what", "how", "much", "does", "do", "is", "are", "the", "for", "in", "on", "a", "an", "of",
+    "cost", "costs", "price", "money", "discount", "covered", "coverage", "get", "i", "my", "me", "plan",
+    "tier", "there", "any", "with", "then", "can", "would", "be", "and", "also", "about", "if",
+}
+TIERS = {"זהב": "זהב", "gold": "זהב", "כסף": "כסף", "silver": "כסף", "ארד": "ארד", "bronze": "ארד"}
+KUPOT = {**KUPA_NAMESPACE_MAP, "maccabi": "maccabi", "meuhedet": "meuhedet", "clalit": "clalit"}
+# Words that mark the next / previous word as a tier or kupa name
+NAMING_WORDS = {"מסלול", "במסלול", "קופה", "בקופה", "קופת", "בקופת", "tier", "plan", "hmo"}
+# Also common words: "כסף" is "money", "כללית" "general", "מאוחדת" "united"
+AMBIGUOUS = {"כסף", "כללית", "מאוחדת"}
+# Follow-up leads after which an ambiguous word is a kupa / tier ("מה עם כללית?", "ומה לגבי כסף?")
+FOLLOW_UP_WORDS = {"עם", "ועם", "לגבי", "ולגבי", "ומה", "about"}
+
+def _variants(word):
+    """
+    The word and its Hebrew prefix-stripped forms ("ולכסף" -> "ולכסף", "לכסף", "כסף").
+    """
+    variants = [word]
+    while len(word) > 2 and word[0] in HEBREW_PREFIXES:
+        word = word[1:]
+        variants.append(word)
+    return variants
+
+def _mentions(words, table):
+    """
+    [(position, value)] of the words naming an entry of table. Ambiguous words
+    only count with a prefix ("בכללית"), next to "מסלול" / "קופה" ("במסלול כסף"),
+    right after a follow-up lead ("מה לגבי כסף?") or as the whole message.
+    """
+    mentions = []
+    for i, word in enumerate(words):
+        for v in _variants(word):
+            if v not in table:
+                continue
+            named = (len(words) == 1 or (i > 0 and words[i - 1] in FOLLOW_UP_WORDS)
+                     or any(0 <= j < len(words) and words[j] in NAMING_WORDS for j in (i - 1, i + 1)))
+            if v not in AMBIGUOUS or v != word or named:
+                mentions.append((i, table[v]))
+            break
+    return mentions
+
+def _in(word, vocabulary):
+    return any(v in vocabulary for v in _variants(word))
+
+class RetrievalRouter:
+    def __init__(self, service_lookup = None):
+        """
+        service_lookup: ServiceLookup whose rows back the "reuse" outcome and whose
+        service names mark a question as standalone (None: never reuse).
+        """
+        self.service_lookup = service_lookup
+        self.routes = {"none": 0, "reuse": 0, "retrieve": 0, "rewritten": 0}
+
+    def route(self, query, history, namespace, maslul, previous_docs = ()):
+        """
+        Returns {"action": "none" | "reuse" | "retrieve", "query", "namespace",
+        "maslul", "docs" (reuse only), "reason"}. The namespace / maslul are the
+        user's own unless the follow-up names another kupa / tier.
+        """
+        decision = {"action": "retrieve", "query": query, "namespace": namespace, "maslul": maslul,
+                    "docs": [], "reason": "standalone"}
+        turn = self._parse(query)
+        if turn is None:
+            decision.update(action="none", reason="acknowledgement")
+            self.routes["none"] += 1
+            return decision
+
+        follow_up, content, tier, kupa = turn
+        decision["maslul"] = tier or maslul
+        decision["namespace"] = kupa or namespace
+        if not follow_up:
+            self.routes["retrieve"] += 1
+            return decision
+
+        if content:
+            # A new subject in an elliptical follow-up: retrieve for the subject alone
+            decision.update(query=" ".join(content), reason="follow-up with a new subject")
+            self.routes["rewritten"] += 1
+            self.routes["retrieve"] += 1
+            return decision
+
+        docs = self._reuse(previous_docs, decision["namespace"], decision["maslul"])
+        if docs:
+            decision.update(action="reuse", docs=docs, reason="follow-up on the previous rows")
+            self.routes["reuse"] += 1
+            return decision
+
+        # Nothing to reuse: ask the previous question again (with the new kupa / tier)
+        previous = self._previous_question(history)
+        if previous:
+            decision.update(query=previous, reason="follow-up without rows, previous question")
+            self.routes["rewritten"] += 1
+        self.routes["retrieve"] += 1
+        return decision
+
+    def _parse(self, query):
+        """
+        None for an acknowledgement, else (follow_up, content words, tier, kupa namespace).
+        Questions naming a service are never follow-ups.
+        """
+        words = TOKEN_RE.findall((query or "").lower())
+        if not words or all(w in ACKNOWLEDGEMENTS for w in words):
+            return None
+        tiers, kupot = _mentions(words, TIERS), _mentions(words, KUPOT)
+        tier = tiers[0][1] if tiers else None
+        kupa = kupot[0][1] if kupot else None
+        named = {i for i, _ in tiers + kupot}
+        lead = words[0] in LEADS or 0 in {i for i, _ in tiers} or " ".join(words[:2]) in ("מה לגבי", "מה עם", "what about", "how about")
+        refers_back = any(_in(w, ANAPHORA) for w in words)
+        content = [w for i, w in enumerate(words) if not (i in named or _in(w, FILLER) or _in(w, ANAPHORA)
+                                                          or w in LEADS or w in ACKNOWLEDGEMENTS)]
+        follow_up = lead or refers_back or tier is not None or kupa is not None
+        if follow_up and self.service_lookup is not None and self.service_lookup.match_service(query) is not None:
+            follow_up = False
+        return follow_up, content, tier, kupa
+
+    def _reuse(self, previous_docs, namespace, maslul):
+        if self.service_lookup is None:
+            return []
+        rows = self.service_lookup.rows
+        docs = []
+        for d in previous_docs or ():
+            row = rows.get((namespace, maslul, d.get("service", ""))) if isinstance(d, dict) else None
+            if row is not None and row not in docs:
+                docs.append(row)
+        return docs
+
+    def _previous_question(self, history):
+        """
+        The last earlier user message that can stand on its own (skipping follow-ups and thanks).
+        """
+        users = [m.get("content", "") for m in history if m.get("role") == "user"]
+        for question in reversed(users[:-1]):
+            turn = self._parse(question)
+            if turn is not None and (not turn[0] or turn[1]):
+                return question
+        return ""
+
+    def stats(self):
+        total = self.routes["none"] + self.routes["reuse"] + self.routes["retrieve"]
+        return {
+            **self.routes,
+            "avoided_rate": (self.routes["none"] + self.routes["reuse"]) / total if total else 0.0,
+        }
@@ -1,10 +1,28 @@
 # server.py
-from fastapi import FastAPI, Request
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import os
-from openai import AzureOpenAI
 from dotenv import load_dotenv
-from pinecone import Pinecone
-import os, sys, logging  
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import os, sys, logging, asyncio, json, time
+from embedding_cache import EmbeddingCache, SQLiteEmbeddingBackend, normalize_query
+from retrieval import PineconeRetriever, LocalRetriever
+from index_manifest import IndexVersionWatcher
+from user_info_extractor import extract_user_info, missing_fields, FIELD_LABELS, USER_INFO_FIELDS
+from records import KUPA_NAMESPACE_MAP, load_records
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from structured_lookup import ServiceLookup
+from retrieval_router import RetrievalRouter
+from page_table import PageTable
+from context_snippets import RAG_CONTEXT_FOOTER, RAG_CONTEXT_HEADER, row_snippet
+from prompt_budget import HistoryCompactor, ONBOARDING_DONE_MESSAGE, strip_onboarding, user_profile_line
+import metrics
+from metrics import Timings, record_usage
+from token_counter import count_message_tokens, count_tokens
+from single_flight import SingleFlight
+from embedding_batcher import EmbeddingBatcher
 
 logging.basicConfig(
     level=logging.INFO,                          
@@ -13,8 +31,6 @@ logging.basicConfig(
 )
 load_dotenv()
 
-app = FastAPI()
-
 # ENV and INIT
 AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY1")
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -25,167 +41,857 @@ AZURE_OPENAI_API_VERSION = "2024-02-15-preview"
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENV = os.getenv("PINECONE_ENVIRONMENT")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX")
-pc = Pinecone(api_key = PINECONE_API_KEY, environment = PINECONE_ENV)
-index = pc.Index(PINECONE_INDEX)
+PINECONE_HOST = os.getenv("PINECONE_HOST", "")  # skips the describe_index lookup when set
+
+# Retrieval backend: "pinecone" (remote) or "local" (in-process index from LOCAL_INDEX_DIR)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pinecone")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+
+# Hybrid retrieval: BM25 over the parsed knowledge base fused with vector results (RRF)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+KB_DATA_DIR = os.getenv("KB_DATA_DIR", "phase2_data")
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "parse_cache")  # parsed chunks of unchanged files
+# Page intros / kupa contacts referenced by "page_id" in the vector metadata (written by upload_to_pinecone.py)
+PAGE_TABLE_PATH = os.getenv("PAGE_TABLE_PATH", "page_table.json")
+# Knowledge-base snapshot written by upload_to_pinecone.py: records and pages without parsing HTML
+KB_SNAPSHOT_PATH = os.getenv("KB_SNAPSHOT_PATH", "")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))  # per retriever, before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Exact (kupa, maslul, service) lookup: questions naming one service skip embedding + vector search
+STRUCTURED_LOOKUP = os.getenv("STRUCTURED_LOOKUP", "1") == "1"
+LOOKUP_MIN_COVERAGE = float(os.getenv("LOOKUP_MIN_COVERAGE", "0.5"))  # share of service-name words in the question
+
+# Retrieval router: acknowledgements skip retrieval, follow-ups reuse the previous turn's rows
+RETRIEVAL_ROUTER = os.getenv("RETRIEVAL_ROUTER", "1") == "1"
+
+# Prompt budget: system prompt + RAG context + last HISTORY_KEEP_MESSAGES messages; older ones are summarized
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+HISTORY_KEEP_MESSAGES = int(os.getenv("HISTORY_KEEP_MESSAGES", "6"))
+HISTORY_SUMMARY = os.getenv("HISTORY_SUMMARY", "1") == "1"
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "1024"))
+HISTORY_SUMMARY_BLOCK = int(os.getenv("HISTORY_SUMMARY_BLOCK", "6"))  # older messages summarized per call
+
+# User info extraction: call the LLM only for fields the rule-based extractor missed
+USER_INFO_LLM_FALLBACK = os.getenv("USER_INFO_LLM_FALLBACK", "1") == "1"
+
+# Concurrent identical embedding / retrieval requests share one upstream call
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "1") == "1"
+
+# Query embeddings arriving within the window are sent as one batched call (0 disables batching)
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "16"))
+
+# /chat/batch: items accepted per request, completions in flight per batch
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "500"))   # <= 2048, the embeddings API input limit
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+
+# Startup: open the upstream connections (one tiny embedding + an index stats call) before serving
+STARTUP_WARM_UP = os.getenv("STARTUP_WARM_UP", "1") == "1"
+
+# Connection pooling / concurrency limits
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "16"))
+
+# Query-embedding cache
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")  # SQLite file shared by workers
+
+# Semantic answer cache (QA phase); invalidated whenever the index version changes
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))  # per (namespace, maslul)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# File holding the current "index_version": the local index, or the ingestion manifest for Pinecone
+INDEX_VERSION_PATH = os.getenv("INDEX_VERSION_PATH") or (
+    os.path.join(LOCAL_INDEX_DIR, "index.json") if RETRIEVAL_BACKEND == "local"
+    else os.getenv("INDEX_MANIFEST_PATH", "index_manifest.json")
+)
+
+def build_retriever():
+    """
+    Builds the vector-search backend selected by RETRIEVAL_BACKEND.
+    """
+    if RETRIEVAL_BACKEND == "local":
+        from local_index import LocalVectorIndex
+        local_index = LocalVectorIndex.load(LOCAL_INDEX_DIR)
+        logging.info(f"Local index loaded: {len(local_index)} vectors from {LOCAL_INDEX_DIR}")
+        return LocalRetriever(local_index)
+
+    from pinecone import Pinecone
+    pc = Pinecone(api_key = PINECONE_API_KEY, environment = PINECONE_ENV)
+    index = pc.Index(
+        PINECONE_INDEX or "",
+        host = PINECONE_HOST,
+        connection_pool_maxsize = PINECONE_POOL_THREADS
+    )
+    # The Pinecone data-plane client is blocking, so queries run on a bounded pool
+    # instead of the event loop.
+    executor = ThreadPoolExecutor(
+        max_workers = PINECONE_POOL_THREADS,
+        thread_name_prefix = "pinecone"
+    )
+    return PineconeRetriever(index, executor)
+
+def load_knowledge_base():
+    """
+    Parses the knowledge base (same HTML files and chunk IDs as ingestion) for the
+    in-process indexes, and loads the page side table. Pages parsed from the HTML
+    files take precedence over the ones in PAGE_TABLE_PATH.
+    With KB_SNAPSHOT_PATH, both come from the snapshot the index was built from instead.
+    """
+    if KB_SNAPSHOT_PATH and os.path.exists(KB_SNAPSHOT_PATH):
+        from kb_snapshot import KBSnapshot
+        snapshot = KBSnapshot.load(KB_SNAPSHOT_PATH)
+        logging.info(f"KB snapshot {KB_SNAPSHOT_PATH}: {len(snapshot)} chunks, corpus {snapshot.corpus_hash}")
+        return list(snapshot.records(with_values = False)), snapshot.page_table()
+    page_table = PageTable.load(PAGE_TABLE_PATH) if os.path.exists(PAGE_TABLE_PATH) else PageTable()
+    records = []
+    if HYBRID_RETRIEVAL or STRUCTURED_LOOKUP or not len(page_table):
+        parsed_pages = PageTable()
+        records = load_records(KB_DATA_DIR, PARSE_CACHE_DIR, parsed_pages)
+        page_table.pages.update(parsed_pages.pages)
+        if not records:
+            logging.warning(f"No HTML files parsed from KB_DATA_DIR {os.path.abspath(KB_DATA_DIR)}")
+    if not len(page_table):
+        # Vectors only carry page_ids: without the table no intro or contacts reach the prompt
+        logging.warning(f"Page table is empty (no {os.path.abspath(PAGE_TABLE_PATH)} and no pages in "
+                        f"{os.path.abspath(KB_DATA_DIR)}): RAG context will lack page intros and contacts")
+    logging.info(f"Page table: {len(page_table)} pages")
+    return records, page_table
+
+def build_bm25_index(kb_records):
+    """
+    Builds the in-process BM25 index from the parsed knowledge base.
+    """
+    if not HYBRID_RETRIEVAL:
+        return None
+    bm25 = BM25Index.from_records(kb_records)
+    logging.info(f"BM25 index built: {len(bm25)} service chunks from {KB_DATA_DIR}")
+    return bm25
+
+def build_service_lookup(kb_records, page_table):
+    """
+    Builds the (namespace, maslul, service) -> row table from the parsed knowledge base.
+    """
+    if not STRUCTURED_LOOKUP:
+        return None
+    lookup = ServiceLookup.from_records(kb_records, page_table, min_coverage = LOOKUP_MIN_COVERAGE)
+    logging.info(f"Service lookup built: {len(lookup.rows)} rows, {len(lookup.entries)} services")
+    return lookup
+
+def build_retrieval_router(service_lookup):
+    """
+    Rule-based router deciding per QA turn between no retrieval, reuse and a fresh retrieval.
+    """
+    if not RETRIEVAL_ROUTER:
+        return None
+    return RetrievalRouter(service_lookup)
+
+def build_openai_client(http_client = None):
+    """
+    Azure OpenAI client on one pooled HTTP client (keep-alive connections shared by every call).
+    Pass `http_client` to route the calls elsewhere (e.g. an in-process stand-in).
+    """
+    import httpx
+    from openai import AsyncAzureOpenAI
+    http_client = http_client or httpx.AsyncClient(
+        limits = httpx.Limits(
+            max_connections = HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections = HTTP_MAX_CONNECTIONS
+        ),
+        timeout = HTTP_TIMEOUT
+    )
+    return AsyncAzureOpenAI(
+        api_key = AZURE_OPENAI_KEY,
+        azure_endpoint = AZURE_OPENAI_ENDPOINT,
+        api_version = AZURE_OPENAI_API_VERSION,
+        http_client = http_client
+    )
+
+def build_embedding_cache():
+    return EmbeddingCache(
+        max_size = EMBEDDING_CACHE_SIZE,
+        ttl = EMBEDDING_CACHE_TTL,
+        backend = SQLiteEmbeddingBackend(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_TTL) if EMBEDDING_CACHE_PATH else None
+    )
+
+def build_answer_cache():
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    from answer_cache import SemanticAnswerCache
+    return SemanticAnswerCache(
+        threshold = ANSWER_CACHE_THRESHOLD,
+        max_entries = ANSWER_CACHE_SIZE,
+        ttl = ANSWER_CACHE_TTL
+    )
+
+# Clients, knowledge base and caches: created by startup(), not at import
+retriever = None
+client = None
+kb_records = []
+page_table = PageTable()
+bm25_index = None
+service_lookup = None
+retrieval_router = None
+embedding_cache = None
+answer_cache = None
+index_version = IndexVersionWatcher(INDEX_VERSION_PATH)
+startup_task = None
+startup_seconds = None
+embedding_flight = SingleFlight(enabled = REQUEST_COALESCING)
+retrieval_flight = SingleFlight(enabled = REQUEST_COALESCING)
+embedding_batcher = EmbeddingBatcher(
+    lambda texts: embed_texts(texts),   # defined below
+    window = EMBEDDING_BATCH_WINDOW_MS / 1000,
+    max_batch = EMBEDDING_MAX_BATCH
+) if EMBEDDING_BATCH_WINDOW_MS > 0 and EMBEDDING_MAX_BATCH > 1 else None
+
+def use_clients(openai_client = None, vector_retriever = None):
+    """
+    Replaces the Azure OpenAI client and/or the vector retriever, e.g. with clients
+    pointed at local stand-ins (benchmarks/stub_services.py) for offline load tests.
+    Clients set before startup are kept by it. The replaced clients are not closed.
+    """
+    global client, retriever
+    if openai_client is not None:
+        client = openai_client
+    if vector_retriever is not None:
+        retriever = vector_retriever
+
+async def warm_up():
+    """
+    Opens the upstream connections and loads the tokenizer before the first request.
+    Failures are only logged; the first request then pays for the connection instead.
+    """
+    count_tokens("warm-up")
+    results = await asyncio.gather(
+        client.embeddings.create(input = "warm-up", model = AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT),
+        retriever.warm_up(),
+        return_exceptions = True
+    )
+    for name, result in zip(("Azure OpenAI", "vector index"), results):
+        if isinstance(result, Exception):
+            logging.warning(f"Warm-up of {name} failed: {result!r}")
+
+async def startup():
+    """
+    Creates the clients, parses the knowledge base and builds the in-process indexes
+    (blocking work runs on threads), then warms the connection pools.
+    """
+    global retriever, client, kb_records, page_table, bm25_index, service_lookup, embedding_cache, answer_cache
+    global retrieval_router, startup_seconds
+    t0 = time.perf_counter()
+    if client is None:
+        client = build_openai_client()
+    jobs = [asyncio.to_thread(load_knowledge_base)]
+    if retriever is None:
+        jobs.append(asyncio.to_thread(build_retriever))
+    results = await asyncio.gather(*jobs)
+    kb_records, page_table = results[0]
+    if retriever is None:
+        retriever = results[1]
+    bm25_index, service_lookup = await asyncio.to_thread(
+        lambda: (build_bm25_index(kb_records), build_service_lookup(kb_records, page_table))
+    )
+    retrieval_router = build_retrieval_router(service_lookup)
+    embedding_cache = build_embedding_cache()
+    answer_cache = build_answer_cache()
+    if STARTUP_WARM_UP:
+        await warm_up()
+    startup_seconds = time.perf_counter() - t0
+    logging.info(f"Ready in {startup_seconds:.2f}s")
+
+def start():
+    """
+    Schedules startup() once (again if it failed) and returns its task.
+    """
+    global startup_task
+    if startup_task is None or (startup_task.done() and (startup_task.cancelled() or startup_task.exception())):
+        startup_task = asyncio.get_running_loop().create_task(startup())
+    return startup_task
+
+async def ensure_ready():
+    """
+    Waits for startup; called by every endpoint, so requests that arrive early
+    (or without the lifespan, e.g. in-process tests) wait instead of failing.
+    """
+    task = start()
+    if not task.done():
+        await asyncio.shield(task)
+    elif task.exception():
+        raise task.exception()
+
+async def shutdown():
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+    if client is not None:
+        await client.close()
+    if retriever is not None:
+        retriever.close()
+    if embedding_cache is not None and embedding_cache.backend is not None:
+        embedding_cache.backend.close()
+
+SUMMARY_MAX_TOKENS = 200
 
-client = AzureOpenAI(
-    api_key = AZURE_OPENAI_KEY,
-    azure_endpoint = AZURE_OPENAI_ENDPOINT,
-    api_version = AZURE_OPENAI_API_VERSION
+def summary_prompt(previous_summary, messages):
+    """
+    The chat messages of one summarization call.
+    """
+    transcript = "\n".join(f"{'User' if m['role'] == 'user' else 'Bot'}: {m['content']}" for m in messages)
+    if previous_summary:
+        transcript = f"Summary so far: {previous_summary}\n{transcript}"
+    return [
+        {"role": "system", "content": "Summarize this health-fund support conversation in 2-4 short sentences, "
+                                      "in the conversation's language. Keep the questions asked and facts given."},
+        {"role": "user", "content": transcript}
+    ]
+
+async def summarize_history(previous_summary, messages):
+    """
+    Folds older conversation messages into the rolling summary (runs in the background).
+    """
+    response = await client.chat.completions.create(
+        model = deployment_name,
+        messages = summary_prompt(previous_summary, messages),
+        max_tokens = SUMMARY_MAX_TOKENS,
+        temperature = 0.0
+    )
+    record_usage("summary", response.usage)
+    return response.choices[0].message.content.strip()
+
+metrics.cache_sources.update({
+    "embedding": lambda: embedding_cache.stats() if embedding_cache is not None else None,
+    "answer": lambda: answer_cache.stats() if answer_cache is not None else None,
+    "structured_lookup": lambda: service_lookup.stats() if service_lookup is not None else None,
+})
+metrics.coalescing_sources.update({
+    "embedding": embedding_flight.stats,
+    "retrieval": retrieval_flight.stats,
+})
+
+history_compactor = HistoryCompactor(
+    summarize = summarize_history if HISTORY_SUMMARY else None,
+    token_budget = PROMPT_TOKEN_BUDGET,
+    keep_messages = HISTORY_KEEP_MESSAGES,
+    cache_size = HISTORY_SUMMARY_CACHE_SIZE,
+    summary_block = HISTORY_SUMMARY_BLOCK
 )
+user_info_stats = {"extractions": 0, "llm_calls": 0, "fields_from_rules": 0, "fields_from_llm": 0}
+
+@asynccontextmanager
+async def lifespan(app):
+    # Startup runs in the background: the port opens at once and /healthz reports readiness
+    start()
+    yield
+    await shutdown()
+
+router = APIRouter()
 
 # RAG HELPERS 
-def get_query_embedding(query):
+async def embed_texts(texts):
     """
-    Gets the embedding vector for a query using Azure OpenAI.
+    One embeddings call for a list of texts; vectors are returned in input order.
     """
-    response = client.embeddings.create(
-        input = query,
+    response = await client.embeddings.create(
+        input = texts,
         model = AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT
     )
-    return response.data[0].embedding
+    record_usage("embedding", response.usage)
+    metrics.embedding_batch_size.observe(len(texts))
+    return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+async def get_query_embedding(query, batcher = None):
+    """
+    Gets the embedding vector for a query using Azure OpenAI.
+    Repeated questions are served from embedding_cache; concurrent misses for the
+    same query share one embeddings call, and misses for different queries are
+    micro-batched (embedding_batcher, or the given batcher).
+    """
+    batcher = batcher or embedding_batcher
+    cached = embedding_cache.get(query, AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        if batcher is not None:
+            embedding = await batcher.embed(query)
+        else:
+            embedding = (await embed_texts([query]))[0]
+        embedding_cache.set(query, AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT, embedding)
+        return embedding
 
-def rag_retrieve(query, namespace, maslul, top_k = 5):
+    embedding, _ = await embedding_flight.do(EmbeddingCache.make_key(query, AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT), fetch)
+    return embedding
+
+async def rag_retrieve(query, namespace, maslul, top_k = 5, embedding = None, timings = None):
+    """
+    Retrieves relevant chunks from the vector index by semantic similarity and filter (maslul).
+    With HYBRID_RETRIEVAL, BM25 matches from the same (namespace, maslul) partition
+    are fused with the vector matches by reciprocal rank fusion.
+    Pass `embedding` when the query embedding is already known.
+    Concurrent identical retrievals (normalized query, namespace, maslul, top_k)
+    share one search.
+    """
+    timings = timings or Timings("chat")
+    key = (normalize_query(query), namespace, maslul, top_k)
+    t0 = time.perf_counter()
+    docs, shared = await retrieval_flight.do(key, lambda: search_indexes(query, namespace, maslul, top_k, embedding, timings))
+    if shared:
+        # The stages were timed by the request that ran the search
+        timings.record("coalesced", time.perf_counter() - t0)
+    return docs
+
+async def search_indexes(query, namespace, maslul, top_k, embedding, timings):
     """
-    Retrieves relevant chunks from Pinecone by semantic similarity and filter (maslul).
+    The vector (+ BM25) search behind rag_retrieve.
     """
     logging.info(f"RAG: ns={namespace} | maslul={maslul} | q={query[:80]}")
-    emb = get_query_embedding(query)
-    filter_obj = {"maslul": {"$eq": maslul}} if maslul else None
-    results = index.query(
-        vector = emb,
-        top_k = top_k,
-        namespace = namespace,
-        include_metadata = True,
-        filter = filter_obj
-    )
-    return [m["metadata"] for m in results["matches"]]
+    if embedding is None:
+        with timings.stage("embedding"):
+            embedding = await get_query_embedding(query)
+    if bm25_index is None:
+        with timings.stage("vector"):
+            matches = await retriever.query(embedding, namespace, maslul, top_k=top_k)
+        return [m["metadata"] for m in matches]
+    candidates = max(top_k, HYBRID_CANDIDATES)
+    with timings.stage("vector"):
+        vector_matches = await retriever.query(embedding, namespace, maslul, top_k=candidates)
+    with timings.stage("bm25"):
+        lexical_matches = bm25_index.search(query, namespace, maslul, top_k=candidates)
+        matches = reciprocal_rank_fusion([vector_matches, lexical_matches], k=RRF_K)
+    return [m["metadata"] for m in matches[:top_k]]
 
-# FASTAPI ENDPOINT
-@app.post("/chat")
-async def chat_endpoint(request: Request):
+def build_context_text(retrieved_docs):
     """
-    Main chat endpoint for the bot.
-    Handles both phases:
-    1. Info collection (collecting user identity/profile fields).
-    2. Q&A (with RAG retrieval).
-    Returns the LLM reply and, for debugging, also the RAG context and filters.
+    Joins the pre-rendered context of the retrieved service rows. Rows of the same
+    page share one intro ("רקע") and one contact block instead of repeating them per row.
     """
-    data = await request.json()
-    history = data.get("history", [])
-    phase = data.get("phase", "user_info")
-    user_data = data.get("user_data", {})
+    groups = {}
+    for d in retrieved_docs:
+        key = (d.get("page_id") or d.get("intro", "").strip(), d.get("kupa", ""))
+        groups.setdefault(key, []).append(d)
 
-    # System prompts
-    user_info_system_prompt = (
-        "You are a helpful assistant for health fund services in Israel. "
-        "Before answering any service-related questions, you must verify the user's identity by collecting the following details through a natural, step-by-step conversation (not a form):\n"
-        "- Full name (first and last)\n"
-        "- ID number (9 digits)\n"
-        "- Gender\n"
-        "- Age (0-120)\n"
-        "- HMO name (מכבי | מאוחדת | כללית)\n"
-        "- HMO card number (9 digits)\n"
-        "- Insurance membership tier (זהב | כסף | ארד)\n"
-        "After collecting all details, summarize the information and ask the user for confirmation. "
-        "Do not answer any service-related questions until the identity has been confirmed."
-    )
-    qa_system_prompt = (
-        "You are an expert assistant for Israeli HMO (health-fund) services. "
-        "Rely ONLY on the retrieved knowledge-base snippets and the user-provided profile to answer. "
-        "If the answer is not found in those snippets, reply clearly that you don't have the information.\n\n"
-        "Always reply in the same language as the user's question (Hebrew or English). "
-        "If a question cannot be answered from the data, say so clearly."
-        """ When relevant, add the HMO's phone and website at the end:
+    parts = [RAG_CONTEXT_HEADER]
+    for docs in groups.values():
+        intro_block, contact_block = page_table.context_blocks(docs[0])
+        parts.append(intro_block)
+        parts.extend(row_snippet(d) for d in docs)
+        parts.append(contact_block)
+    parts.append(RAG_CONTEXT_FOOTER)
+    return "".join(parts)
+
+def referenced_pages(retrieved_docs):
+    """
+    The side-table entries of the pages the retrieved rows point to (sent once per response).
+    """
+    return {
+        d["page_id"]: page_table.pages[d["page_id"]]
+        for d in retrieved_docs if d.get("page_id") in page_table.pages
+    }
+
+# CHAT PROMPT
+# System prompts
+USER_INFO_SYSTEM_PROMPT = (
+    "You are a helpful assistant for health fund services in Israel. "
+    "Before answering any service-related questions, you must verify the user's identity by collecting the following details through a natural, step-by-step conversation (not a form):\n"
+    "- Full name (first and last)\n"
+    "- ID number (9 digits)\n"
+    "- Gender\n"
+    "- Age (0-120)\n"
+    "- HMO name (מכבי | מאוחדת | כללית)\n"
+    "- HMO card number (9 digits)\n"
+    "- Insurance membership tier (זהב | כסף | ארד)\n"
+    "After collecting all details, summarize the information and ask the user for confirmation. "
+    "Do not answer any service-related questions until the identity has been confirmed."
+)
+QA_SYSTEM_PROMPT = (
+    "You are an expert assistant for Israeli HMO (health-fund) services. "
+    "Rely ONLY on the retrieved knowledge-base snippets and the user-provided profile to answer. "
+    "If the answer is not found in those snippets, reply clearly that you don't have the information.\n\n"
+    "Always reply in the same language as the user's question (Hebrew or English). "
+    "If a question cannot be answered from the data, say so clearly."
+    """ When relevant, add the HMO's phone and website at the end:
             טלפון: 
            לקישור לחץ [כאן>>](URL)"""
-    )
+)
 
+# Namespace -> Hebrew kupa name, for context retrieved for another kupa / tier than the user's
+KUPA_NAMES = {namespace: name for name, namespace in KUPA_NAMESPACE_MAP.items()}
+RETRIEVED_FOR_LABEL = "המידע הבא הוא עבור:"
+
+async def prepare_chat_turn(history, phase, user_data, timings = None, previous_docs = (), embed = None):
+    """
+    Builds the OpenAI messages for a chat turn (system prompt, budgeted history and,
+    in the QA phase, the RAG context inserted before the last user message).
+    previous_docs: the retrieved_docs of the previous turn, sent back by the client
+    (reused for follow-ups, see RetrievalRouter).
+    embed: async fn(query) -> vector used instead of get_query_embedding (/chat/batch).
+    Returns a dict:
+        messages      - OpenAI chat messages
+        rag_info      - RAG debug payload returned to the client
+        cached_answer - answer from the semantic answer cache (skip the completion), or None
+        answer_key    - (namespace, maslul, embedding, index_version, profile line) for storing the answer, or None
+        prompt_stats  - prompt-size metrics (see HistoryCompactor.build)
+    Stage durations are recorded into `timings`.
+    """
+    timings = timings or Timings("chat")
     # RAG Retrieval for QA phase
     retrieved_docs = []     
     namespace = ""
     maslul = ""
     query = ""              
     context_text = ""
+    cached_answer = None
+    answer_key = None
+    retrieval = ""
+    route = None
 
     if phase == "qa" and user_data:
         # Map HMO names from Hebrew to english for Pinecone namespaces
-        kupa_map = {
-            "מכבי": "maccabi",
-            "מאוחדת": "meuhedet",
-            "כללית": "clalit"
-        }
-        namespace = kupa_map.get(user_data.get("hmo_name", ""), "general")
+        namespace = KUPA_NAMESPACE_MAP.get(user_data.get("hmo_name", ""), "general")
         maslul = user_data.get("membership_tier", "")
+        own_filters = (namespace, maslul)
         # Last user message as RAG query
         for msg in reversed(history):
             if msg["role"] == "user":
                 query = msg["content"]
                 break
-        retrieved_docs = rag_retrieve(query, namespace, maslul, top_k=4)
+        if retrieval_router is not None:
+            with timings.stage("route"):
+                route = retrieval_router.route(query, strip_onboarding(history), namespace, maslul, previous_docs)
+            query, namespace, maslul = route["query"], route["namespace"], route["maslul"]
+            logging.info(f"Route: {route['action']} ({route['reason']}) | ns={namespace} | maslul={maslul} | query={query}")
+        action = route["action"] if route is not None else "retrieve"
+        row = None
+        if action == "retrieve":
+            with timings.stage("lookup"):
+                row = service_lookup.lookup(query, namespace, maslul) if service_lookup is not None else None
+        if action == "none":
+            # Acknowledgement: answered from the conversation alone
+            retrieval = "none"
+        elif action == "reuse":
+            # Follow-up on the previous turn's rows (looked up again, possibly for another kupa / tier)
+            retrieved_docs = route["docs"]
+            retrieval = "reuse"
+        elif row is not None:
+            # The question names one service: its exact row is the context, no embedding needed
+            logging.info(f"Service lookup hit: ns={namespace} | maslul={maslul} | service={row['service']}")
+            retrieved_docs = [row]
+            retrieval = "lookup"
+        else:
+            with timings.stage("embedding"):
+                emb = await (embed or get_query_embedding)(query)
+            # Only the user's own standalone question is cached: a rewritten follow-up
+            # ("ומה זה?" -> the previous question) would be served the previous answer
+            standalone = route is None or route["reason"] == "standalone"
+            with timings.stage("answer_cache"):
+                # Partitioned by the profile line the prompt carries (age / gender dependent answers)
+                profile = user_profile_line(user_data)
+                answer_key = (namespace, maslul, emb, index_version.current(), profile) if standalone else None
+                cached = answer_cache.lookup(*answer_key) if answer_cache is not None and answer_key else None
+            if cached is not None:
+                # A near-identical question was already answered from this index
+                logging.info(f"Answer cache hit: ns={namespace} | maslul={maslul} | sim={cached['similarity']:.3f}")
+                retrieved_docs = cached["retrieved_docs"]
+                cached_answer = cached["answer"]
+                retrieval = "answer_cache"
+            else:
+                retrieved_docs = await rag_retrieve(query, namespace, maslul, top_k=4, embedding=emb, timings=timings)
+                retrieval = "rag"
+        metrics.retrievals.labels(retrieval).inc()
 
         # Build context for the LLM 
         if retrieved_docs:
-            for c in retrieved_docs:
-                # Add intro (if exists and not empty)
-                intro = c.get('intro', '').strip()
-                intro_line = ""
-                if intro:
-                    intro_line = f"\nרקע: {intro}\n"
-                context_text += f"{intro_line}● {c.get('service', '')} - {c.get('benefit', '')}\n"
-                if c.get("phones"):
-                    context_text += f"טלפון: {c['phones']}\n"
-                if c.get("links"):
-                    context_text += f"[לקישור לחץ כאן>>]({c['links']})\n"
-            context_text = f"\nמידע רלוונטי מהידע שנשאב (RAG):\n{context_text}\n"
-
-    # Construct OpenAI prompt
-    messages = [{"role": "system", "content": qa_system_prompt if phase == "qa" else user_info_system_prompt}]
-    if context_text and phase == "qa":
-        # Insert context just before last user message
-        new_history = []
-        found_user = False
-        for msg in reversed(history):
-            if not found_user and msg["role"] == "user":
-                found_user = True
-                new_history.append({"role": "assistant", "content": context_text})
-            new_history.append(msg)
-        messages.extend(reversed(new_history))
-    else:
-        messages.extend(history)
-
-    # OpenAI Completion 
+            with timings.stage("context"):
+                context_text = build_context_text(retrieved_docs)
+                if (namespace, maslul) != own_filters:
+                    # The follow-up asked about another kupa / tier than the user's own
+                    context_text = f"\n{RETRIEVED_FOR_LABEL} {KUPA_NAMES.get(namespace, namespace)} {maslul}\n{context_text}"
+
+    # Construct OpenAI prompt within PROMPT_TOKEN_BUDGET
+    system_prompt = USER_INFO_SYSTEM_PROMPT
+    if phase == "qa":
+        # The confirmed profile replaces the replayed onboarding dialogue
+        history = strip_onboarding(history)
+        system_prompt = QA_SYSTEM_PROMPT
+        profile = user_profile_line(user_data or {})
+        if profile:
+            system_prompt += f"\n\n{profile}"
+    with timings.stage("prompt"):
+        # Onboarding is sent verbatim: its ID / card numbers must not be summarized or dropped
+        messages, prompt_stats = history_compactor.build(system_prompt, history, context_text, compact = phase == "qa")
+    metrics.prompt_tokens.labels(phase).observe(prompt_stats["prompt_tokens"])
+    logging.info(
+        f"Prompt: phase={phase} | tokens={prompt_stats['prompt_tokens']} | context={prompt_stats['context_tokens']} "
+        f"| summary={prompt_stats['summary_tokens']} | messages kept={prompt_stats['kept_messages']}/"
+        f"{prompt_stats['history_messages']} summarized={prompt_stats['summarized_messages']} "
+        f"dropped={prompt_stats['dropped_messages']}"
+    )
+
+    rag_info = {
+        "retrieved_docs": retrieved_docs,
+        "pages": referenced_pages(retrieved_docs),
+        "namespace": namespace,
+        "maslul": maslul,
+        "rag_query": query,
+        "retrieval": retrieval,
+        "route": route["reason"] if route is not None else ""
+    }
+    return {
+        "messages": messages,
+        "rag_info": rag_info,
+        "cached_answer": cached_answer,
+        "answer_key": answer_key,
+        "prompt_stats": prompt_stats
+    }
+
+def remember_answer(turn, answer):
+    """
+    Stores a freshly generated QA answer in the semantic answer cache.
+    """
+    if answer_cache is None or turn["answer_key"] is None or not answer:
+        return
+    namespace, maslul, emb, version, profile = turn["answer_key"]
+    answer_cache.store(namespace, maslul, emb, answer, turn["rag_info"]["retrieved_docs"], version, profile)
+
+async def complete_turn(turn, timings):
+    """
+    The answer of a prepared turn: the cached answer, or a gpt-4o completion
+    (stored in the answer cache). Failures are logged and answered with an error text.
+    """
+    if turn["cached_answer"] is not None:
+        return turn["cached_answer"]
     try:
-        response = client.chat.completions.create(
-            model=deployment_name,
-            messages=messages,
-            max_tokens=512,
-            temperature=0.2,
-        )
+        with timings.stage("completion"):
+            response = await client.chat.completions.create(
+                model=deployment_name,
+                messages=turn["messages"],
+                max_tokens=512,
+                temperature=0.2,
+            )
+        record_usage("chat", response.usage, timings)
         answer = response.choices[0].message.content.strip()
+        remember_answer(turn, answer)
+        return answer
     except Exception as e:
-        import logging
         logging.exception("OpenAI call failed")
-        answer = "Internal server error. Please try again later."
+        return "Internal server error. Please try again later."
+
+def sse_event(event, data):
+    """
+    Formats one server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# FASTAPI ENDPOINT
+@router.post("/chat")
+async def chat_endpoint(request: Request):
+    """
+    Main chat endpoint for the bot.
+    Handles both phases:
+    1. Info collection (collecting user identity/profile fields).
+    2. Q&A (with RAG retrieval).
+    Returns the LLM reply and, for debugging, also the RAG context and filters
+    (plus per-stage "timings" when the request sets "timings": true).
+    Clients send back the previous turn's "retrieved_docs" as "previous_retrieved_docs"
+    so follow-up questions can reuse them instead of retrieving again.
+    """
+    timings = Timings("chat")
+    await ensure_ready()
+    data = await request.json()
+    history = data.get("history", [])
+    phase = data.get("phase", "user_info")
+    user_data = data.get("user_data", {})
+
+    turn = await prepare_chat_turn(history, phase, user_data, timings, data.get("previous_retrieved_docs", []))
+
+    # OpenAI Completion (skipped on an answer-cache hit)
+    answer = await complete_turn(turn, timings)
+    timings.finish()
 
     # Return: LLM reply + RAG debug info
-    return {
-        "answer": answer,
-        "retrieved_docs": retrieved_docs,
-        "namespace": namespace,
-        "maslul": maslul,
-        "rag_query": query   
-    }
+    result = {"answer": answer, **turn["rag_info"]}
+    if data.get("timings"):
+        result["timings"] = timings.as_dict()
+    return result
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: Request):
+    """
+    Streaming variant of /chat (server-sent events).
+    Events: "rag" (the RAG debug payload, sent first), "token" ({"text": delta})
+    for each completion delta, "error" on failure, and a final "done" (carrying
+    "timings" when the request sets "timings": true).
+    """
+    timings = Timings("chat_stream")
+    await ensure_ready()
+    data = await request.json()
+    history = data.get("history", [])
+    phase = data.get("phase", "user_info")
+    user_data = data.get("user_data", {})
+
+    turn = await prepare_chat_turn(history, phase, user_data, timings, data.get("previous_retrieved_docs", []))
+
+    def done_event():
+        timings.finish()
+        return sse_event("done", {"timings": timings.as_dict()} if data.get("timings") else {})
+
+    async def event_stream():
+        yield sse_event("rag", turn["rag_info"])
+        if turn["cached_answer"] is not None:
+            yield sse_event("token", {"text": turn["cached_answer"]})
+            yield done_event()
+            return
+        parts = []
+        try:
+            t0 = time.perf_counter()
+            stream = await client.chat.completions.create(
+                model=deployment_name,
+                messages=turn["messages"],
+                max_tokens=512,
+                temperature=0.2,
+                stream=True,
+            )
+            usage = None
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                # Azure sends a first chunk with prompt-filter results and no choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not parts:
+                        timings.record("first_token", time.perf_counter() - t0)
+                    parts.append(chunk.choices[0].delta.content)
+                    yield sse_event("token", {"text": chunk.choices[0].delta.content})
+            timings.record("completion", time.perf_counter() - t0)
+            answer = "".join(parts)
+            # AZURE_OPENAI_API_VERSION predates stream_options, so streams carry no
+            # usage: count both sides locally unless a usage chunk did arrive
+            record_usage("chat", usage or SimpleNamespace(prompt_tokens=count_message_tokens(turn["messages"]),
+                                                          completion_tokens=count_tokens(answer)), timings)
+            remember_answer(turn, answer.strip())
+        except Exception:
+            logging.exception("OpenAI streaming call failed")
+            yield sse_event("error", {"text": "Internal server error. Please try again later."})
+        yield done_event()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def batch_item_error(item):
+    """
+    Why a /chat/batch item is malformed (None when it is fine).
+    """
+    if not isinstance(item, dict):
+        return "must be an object"
+    if not isinstance(item.get("user_data") or {}, dict):
+        return "user_data must be an object"
+    if item.get("history") is not None:
+        if not isinstance(item["history"], list) or not all(isinstance(m, dict) for m in item["history"]):
+            return "history must be a list of messages"
+    elif not isinstance(item.get("question"), str) or not item["question"].strip():
+        return "question must be a non-empty string"
+    return None
+
+@router.post("/chat/batch")
+async def chat_batch_endpoint(request: Request):
+    """
+    Bulk Q&A for evaluation and back-office tools:
+        {"items": [{"id", "user_data", "question"}, ...], "user_data": default for items without one}
+    Items are grouped by (namespace, maslul) and started group by group; the query
+    embeddings of all items go out in one batched call, retrievals run concurrently
+    and at most CHAT_BATCH_CONCURRENCY completions are in flight.
+    Streams NDJSON, one line per item as it finishes ({"index", "id", "answer", the
+    RAG debug payload, "timings"} or {"index", "id", "error"}), then a summary line
+    ({"done": true, ...}).
+    """
+    await ensure_ready()
+    data = await request.json()
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return JSONResponse(status_code=400, content={"error": "items must be a non-empty list"})
+    if len(items) > CHAT_BATCH_MAX_ITEMS:
+        return JSONResponse(status_code=413, content={"error": f"At most {CHAT_BATCH_MAX_ITEMS} items per batch"})
+    default_user_data = data.get("user_data") or {}
+    if not isinstance(default_user_data, dict):
+        return JSONResponse(status_code=400, content={"error": "user_data must be an object"})
+    for i, item in enumerate(items):
+        error = batch_item_error(item)
+        if error:
+            return JSONResponse(status_code=400, content={"error": f"items[{i}]: {error}"})
+
+    groups = {}
+    for i, item in enumerate(items):
+        user_data = item.get("user_data") or default_user_data
+        key = (KUPA_NAMESPACE_MAP.get(user_data.get("hmo_name", ""), "general"), user_data.get("membership_tier", ""))
+        groups.setdefault(key, []).append(i)
+
+    # Routing and lookup never await, so every item that needs an embedding joins
+    # this batcher before its window ends
+    batcher = EmbeddingBatcher(embed_texts, window = max(EMBEDDING_BATCH_WINDOW_MS, 5) / 1000, max_batch = len(items))
+    completions = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+
+    async def answer_item(i):
+        item = items[i]
+        try:
+            timings = Timings("chat_batch")
+            history = item.get("history") or [{"role": "user", "content": item.get("question", "")}]
+            turn = await prepare_chat_turn(history, "qa", item.get("user_data") or default_user_data, timings,
+                                           embed = lambda query: get_query_embedding(query, batcher))
+            if turn["cached_answer"] is None:
+                t0 = time.perf_counter()
+                async with completions:
+                    timings.record("queued", time.perf_counter() - t0)
+                    answer = await complete_turn(turn, timings)
+            else:
+                answer = turn["cached_answer"]
+            timings.finish()
+            return {"index": i, "id": item.get("id", i), "answer": answer, **turn["rag_info"], "timings": timings.as_dict()}
+        except Exception:
+            logging.exception(f"Batch item {i} failed")
+            return {"index": i, "id": item.get("id", i), "error": "Internal server error. Please try again later."}
+
+    async def lines():
+        t0 = time.perf_counter()
+        tasks = [asyncio.create_task(answer_item(i)) for indices in groups.values() for i in indices]
+        errors = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                errors += "error" in result
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # The client went away: drop the items still running
+            for task in tasks:
+                task.cancel()
+        summary = {
+            "done": True,
+            "items": len(items),
+            "errors": errors,
+            "groups": [{"namespace": ns, "maslul": maslul, "items": len(indices)} for (ns, maslul), indices in groups.items()],
+            "embedding_calls": batcher.batches,
+            "embedded_queries": batcher.inputs,
+            "seconds": round(time.perf_counter() - t0, 3)
+        }
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 #  User info extraction for app.py 
-def get_user_data(chat_history):
+async def llm_extract_user_data(chat_history, fields, timings = None):
     """
-    Sends a system message to the LLM requesting only the extracted user info as a Python dict.
+    Sends a system message to the LLM requesting only the given user info fields as a Python dict.
     Returns the dict (not shown in UI).
     """
-    prompt = """
+    keys = ", ".join(f"'{f}'" for f in fields)
+    prompt = f"""
         Extract only the following user information as a Python dictionary from the conversation below.
         Do NOT add any text, explanations, or comments — only output a Python dict with these keys:
-        'first_name', 'last_name', 'id_number', 'gender', 'age', 'hmo_name', 'hmo_card_number', 'membership_tier'.
+        {keys}.
 
         If a field is missing, use an empty string. Conversation:
     """
@@ -195,7 +901,8 @@ def get_user_data(chat_history):
         history_text += f"{prefix} {m['content']}\n"
     prompt += history_text
 
-    response = client.chat.completions.create(
+    user_info_stats["llm_calls"] += 1
+    response = await client.chat.completions.create(
         model = deployment_name,
         messages = [
             {"role": "system", "content": "Extract user info for coding. Return only Python dict as requested."},
@@ -204,6 +911,7 @@ def get_user_data(chat_history):
         max_tokens = 256,
         temperature = 0.0
     )
+    record_usage("extract_user_data", response.usage, timings)
     answer = response.choices[0].message.content.strip()
     # Remove code fences if present
     if answer.startswith("```python"):
@@ -216,16 +924,110 @@ def get_user_data(chat_history):
     import ast
     try:
         user_info = ast.literal_eval(answer)
-        return user_info
+        return user_info if isinstance(user_info, dict) else {}
     except Exception:
         return {}
 
-@app.post("/extract_user_data")
+async def get_user_data(chat_history, timings = None):
+    """
+    Extracts the user info dict from the conversation.
+    The rule-based extractor runs first; the LLM is only asked for the fields it could not resolve.
+    """
+    timings = timings or Timings("extract_user_data")
+    with timings.stage("rules"):
+        user_info = extract_user_info(chat_history)
+        missing = missing_fields(user_info)
+    user_info_stats["extractions"] += 1
+    user_info_stats["fields_from_rules"] += len(USER_INFO_FIELDS) - len(missing)
+    if missing and USER_INFO_LLM_FALLBACK:
+        with timings.stage("llm"):
+            llm_info = await llm_extract_user_data(chat_history, missing, timings)
+        for field in missing:
+            value = str(llm_info.get(field, "") or "").strip()
+            if value:
+                user_info[field] = value
+                user_info_stats["fields_from_llm"] += 1
+    logging.info(f"User info extracted: rules={len(USER_INFO_FIELDS) - len(missing)} | llm_fields={missing}")
+    return user_info
+
+@router.post("/extract_user_data")
 async def extract_user_data_endpoint(request: Request):
     """
     Receives chat history and extracts user info as a dict (returns JSON).
     """
+    timings = Timings("extract_user_data")
+    await ensure_ready()
     data = await request.json()
     history = data.get("history", [])
-    user_info = get_user_data(history)  
-    return {"user_data": user_info}
\ No newline at end of file
+    user_info = await get_user_data(history, timings)
+    timings.finish()
+    return {"user_data": user_info}
+
+@router.post("/confirm_user_data")
+async def confirm_user_data_endpoint(request: Request):
+    """
+    Ends onboarding in one request once the user confirmed their details: extracts
+    the user info and returns it with the next phase and the message to show.
+    If fields are still missing, the phase stays "user_info" and the message asks for them.
+    """
+    timings = Timings("confirm_user_data")
+    await ensure_ready()
+    data = await request.json()
+    user_info = await get_user_data(data.get("history", []), timings)
+    missing = missing_fields(user_info)
+    timings.finish()
+    if missing:
+        labels = ", ".join(FIELD_LABELS[field] for field in missing)
+        message = f"חסרים עדיין הפרטים הבאים: {labels}. אנא השלם אותם."
+        return {"user_data": user_info, "phase": "user_info", "missing": missing, "message": message}
+    return {"user_data": user_info, "phase": "qa", "missing": [], "message": ONBOARDING_DONE_MESSAGE}
+
+@router.get("/cache_stats")
+async def cache_stats_endpoint():
+    """
+    Hit/miss counters of the in-process caches, retrieval-router outcomes, how
+    often user-info extraction needed the LLM, and history-compaction counters.
+    """
+    return {
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "structured_lookup": service_lookup.stats() if service_lookup is not None else None,
+        "retrieval_router": retrieval_router.stats() if retrieval_router is not None else None,
+        "user_info_extraction": user_info_stats,
+        "history_compaction": history_compactor.stats,
+        "coalescing": {"embedding": embedding_flight.stats(), "retrieval": retrieval_flight.stats()},
+        "embedding_batching": embedding_batcher.stats() if embedding_batcher is not None else None
+    }
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus metrics: per-stage latency histograms, OpenAI token counts and cache hit rates.
+    """
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@router.get("/healthz")
+async def healthz_endpoint():
+    """
+    Readiness probe: 200 once the clients and indexes are built and warmed,
+    503 while starting (or after a failed startup, which the next request retries).
+    """
+    task = start()
+    if not task.done():
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    if task.cancelled() or task.exception():
+        error = "cancelled" if task.cancelled() else repr(task.exception())
+        return JSONResponse(status_code=503, content={"status": "failed", "error": error})
+    return {"status": "ready", "startup_seconds": round(startup_seconds, 3)}
+
+def create_app():
+    """
+    Application factory (`uvicorn server:create_app --factory`); `server:app` is one instance.
+    Importing the module creates no clients: the lifespan starts them in the background.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    return app
+
+app = create_app()
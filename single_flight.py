@@ -0,0 +1,42 @@
+# single_flight.py
+"""
+Request coalescing ("single flight") for the event loop: concurrent calls with
+the same key share one in-flight call and its result. Nothing is cached once
+the call completes; later calls start a new one.
+"""
+import asyncio
+
+class SingleFlight:
+    def __init__(self, enabled = True):
+        self.enabled = enabled
+        self._in_flight = {}    # key -> task
+        self.calls = 0          # calls that went upstream
+        self.coalesced = 0      # calls that joined one already in flight
+
+    async def do(self, key, fn):
+        """
+        Returns (result, shared): fn() is awaited only if no call for `key` is in
+        flight; otherwise the caller waits for that call (shared=True). A caller
+        that is cancelled does not cancel the call for the others.
+        """
+        if not self.enabled:
+            self.calls += 1
+            return await fn(), False
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+        self.calls += 1
+        task = asyncio.ensure_future(fn())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def stats(self):
+        total = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+        }
@@ -0,0 +1,142 @@
+# structured_lookup.py
+"""
+Exact (kupa, maslul, service) -> benefit lookup over the parsed knowledge base.
+
+The HTML tables are already a structured table, so a question that names one
+service can be answered from its row without an embedding or a vector search.
+Service names are matched on their words (Hebrew prefixes stripped, close
+misspellings accepted). A question is only matched when exactly one service
+wins and none of its words point at a different service; anything else falls
+back to RAG.
+"""
+import difflib
+import re
+
+from bm25_index import tokenize
+
+def _word_variants(text):
+    """
+    One variant set per written word ("לשיניים" -> {"לשיניים", "שיניים"}).
+    """
+    return [set(tokenize(word)) for word in text.split() if tokenize(word)]
+
+PARENS_RE = re.compile(r"\(([^)]*)\)")
+
+class ServiceEntry:
+    def __init__(self, service, category):
+        self.service = service
+        self.category = category.strip()
+        name = service[:len(service) - len(category)]
+        # "דיקור סיני (אקופונקטורה)" can be asked for by either name
+        self.names = [_word_variants(PARENS_RE.sub(" ", name))]
+        self.names += [_word_variants(alias) for alias in PARENS_RE.findall(name)]
+        self.names = [n for n in self.names if n]
+        self.vocab = set().union(*_word_variants(service))
+
+class ServiceLookup:
+    def __init__(self, rows, page_table = None, min_coverage = 0.5, fuzzy_cutoff = 0.8):
+        """
+        rows: {(namespace, maslul, service): metadata}
+        page_table: PageTable holding the intros of the rows' "page_id"s
+        """
+        self.rows = rows
+        self.min_coverage = min_coverage
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.entries = {}
+        for (_, _, service), meta in rows.items():
+            if service not in self.entries:
+                intro = page_table.intro(meta.get("page_id")) if page_table is not None else meta.get("intro", "")
+                self.entries[service] = ServiceEntry(service, self._category(service, intro))
+        entries = list(self.entries.values())
+        self.vocab = set().union(*(e.vocab for e in entries))
+        self._vocab_list = sorted(self.vocab)
+        # Words that single out a service or a page: category titles and words
+        # of a single service name ("טיפולים" is generic, "שורש" is not)
+        df = {}
+        for e in entries:
+            for term in set().union(*(set().union(*n) for n in e.names)):
+                df[term] = df.get(term, 0) + 1
+        self.unique = {t for t, n in df.items() if n == 1}
+        self.distinctive = self.unique | set().union(*(set(tokenize(e.category)) for e in entries))
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _category(service, intro):
+        # parse_html appends the page title (first intro line) to every service name
+        title = (intro.splitlines() or [""])[0].strip()
+        return f" {title}" if title and service.endswith(f" {title}") else ""
+
+    @classmethod
+    def from_records(cls, records, page_table = None, **kwargs):
+        rows = {}
+        for r in records:
+            meta = r["metadata"]
+            if meta.get("service"):
+                rows[(r["namespace"], meta.get("maslul", ""), meta["service"])] = meta
+        return cls(rows, page_table, **kwargs)
+
+    def _query_words(self, query):
+        """
+        (variants, variants + close knowledge-base words) per query word. Words the
+        knowledge base does not contain are matched to close ones, which covers
+        misspellings and inflections ("אקופונקטורא", "משקפיים" / "משקפי").
+        """
+        words = []
+        for variants in _word_variants(query):
+            close = set()
+            if not variants & self.vocab:
+                for v in variants:
+                    if len(v) >= 5:
+                        close.update(difflib.get_close_matches(v, self._vocab_list, n=3, cutoff=self.fuzzy_cutoff))
+            words.append((variants, variants | close))
+        return words
+
+    def match_service(self, query):
+        """
+        Returns the single service name the query asks about, or None.
+        """
+        words = self._query_words(query)
+        scored = []
+        for entry in self.entries.values():
+            # A distinctive word of another service or page means that one is meant
+            if any(w & self.distinctive and not w & entry.vocab for w, _ in words):
+                continue
+            best = None
+            for name in entry.names:
+                matched = [core for core in name if any(core & w for _, w in words)]
+                coverage = len(matched) / len(name)
+                # Partial matches must include a word that singles this service out
+                if coverage < 1 and (coverage < self.min_coverage or not any(core & self.unique for core in matched)):
+                    continue
+                best = max(best or (0, 0), (coverage, len(matched)))
+            if best:
+                scored.append((*best, entry.service))
+        if not scored:
+            return None
+        scored.sort(reverse=True)
+        if len(scored) > 1 and scored[0][:2] == scored[1][:2]:
+            return None
+        return scored[0][2]
+
+    def lookup(self, query, namespace, maslul):
+        """
+        Returns the metadata row for the service named in the query, or None.
+        """
+        service = self.match_service(query)
+        row = self.rows.get((namespace, maslul, service)) if service else None
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "rows": len(self.rows),
+            "services": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
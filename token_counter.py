@@ -0,0 +1,57 @@
+# token_counter.py
+"""
+Local token counting for prompt-size measurements.
+Uses tiktoken's gpt-4o encoding (o200k_base) when it is installed and its
+encoding file is available; otherwise falls back to an estimate (about 4
+characters per token for Latin text and 3 for Hebrew), which is good enough
+for budgeting and before/after comparisons. The encoding is loaded on first
+use, not at import.
+"""
+import math
+import re
+
+WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+# Per-message overhead of the chat format (role markers, separators)
+MESSAGE_OVERHEAD = 4
+
+_encoding = None
+_loaded = False
+
+def _get_encoding():
+    global _encoding, _loaded
+    if not _loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = None
+        _loaded = True
+    return _encoding
+
+def tokenizer_name():
+    return "o200k_base" if _get_encoding() is not None else "estimate"
+
+def _estimate(text):
+    count = 0
+    for piece in WORD_RE.findall(text):
+        if len(piece) == 1:
+            count += 1
+        elif piece.isascii():
+            count += math.ceil(len(piece) / 4)
+        else:
+            count += math.ceil(len(piece) / 3)
+    return count
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _estimate(text)
+
+def count_message_tokens(messages):
+    """
+    Tokens of a list of chat messages ({"role", "content"}), including per-message overhead.
+    """
+    return sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD for m in messages)
@@ -1,9 +1,16 @@
 # upload_to_pinecone
 import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import openai
 from pinecone import Pinecone
 from openai import AzureOpenAI
 from tqdm import tqdm
 from dotenv import load_dotenv
+from index_manifest import IndexManifest, text_hash
+from records import chunk_to_record
+from page_table import PageTable
 
 load_dotenv()
 
@@ -11,111 +18,373 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENV = os.getenv("PINECONE_ENVIRONMENT")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX")
+PINECONE_HOST = os.getenv("PINECONE_HOST", "")
 AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY1")
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT")
 AZURE_OPENAI_API_VERSION = "2024-02-15-preview"
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "")  # also write a local index for RETRIEVAL_BACKEND=local
+INDEX_MANIFEST_PATH = os.getenv("INDEX_MANIFEST_PATH", "index_manifest.json")
+PAGE_TABLE_PATH = os.getenv("PAGE_TABLE_PATH", "page_table.json")  # page intros / kupa contacts, once per page
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "parse_cache")  # skip re-parsing unchanged HTML files
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Binary snapshot of the embedded KB (see kb_snapshot.py); re-seeds an index without embedding calls.
+# Off by default: writing it (like LOCAL_INDEX_DIR) keeps every record in memory for the run
+KB_SNAPSHOT_PATH = os.getenv("KB_SNAPSHOT_PATH", "")
+KB_SNAPSHOT_DTYPE = os.getenv("KB_SNAPSHOT_DTYPE", "float16")  # or "int8"
 
-# Mapping Hebrew kupa names to ASCII-safe Pinecone namespaces
-KUPA_NAMESPACE_MAP = {
-    "מכבי": "maccabi",
-    "מאוחדת": "meuhedet",
-    "כללית": "clalit"
-}
+# Ingestion tuning
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))      # inputs per embeddings request
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))   # vectors per upsert request
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))           # concurrent batches in flight
+MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "6"))
+RETRY_BASE_DELAY = float(os.getenv("INGEST_RETRY_BASE_DELAY", "1.0"))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
-# Initialize Pinecone
-pc = Pinecone(api_key = PINECONE_API_KEY, environment = PINECONE_ENV)
-index = pc.Index(PINECONE_INDEX)
+# Initialize Pinecone (optional when only building a local index)
+index = None
+if PINECONE_INDEX or PINECONE_HOST:
+    pc = Pinecone(api_key = PINECONE_API_KEY, environment = PINECONE_ENV)
+    index = pc.Index(
+        PINECONE_INDEX or "",
+        host = PINECONE_HOST,
+        connection_pool_maxsize = INGEST_WORKERS
+    )
+
+# Azure OpenAI client, created on the first embedding call (see get_openai_client)
+openai_client = None
 
-# Initialize Azure OpenAI client
-openai_client = AzureOpenAI(
-    api_key = AZURE_OPENAI_KEY,
-    azure_endpoint = AZURE_OPENAI_ENDPOINT,
-    api_version = AZURE_OPENAI_API_VERSION
-)
+def get_openai_client():
+    """
+    The Azure OpenAI client, created on first use so that importing this module
+    (or a --from-snapshot run) needs no credentials. Retries are handled by with_retries.
+    """
+    global openai_client
+    if openai_client is None:
+        openai_client = AzureOpenAI(
+            api_key = AZURE_OPENAI_KEY,
+            azure_endpoint = AZURE_OPENAI_ENDPOINT,
+            api_version = AZURE_OPENAI_API_VERSION,
+            max_retries = 0
+        )
+    return openai_client
+
+def use_clients(embeddings_client = None, pinecone_index = None):
+    """
+    Replaces the Azure OpenAI client and/or the Pinecone index, e.g. with clients
+    pointed at local stand-ins (benchmarks/stub_services.py).
+    """
+    global openai_client, index
+    if embeddings_client is not None:
+        openai_client = embeddings_client
+    if pinecone_index is not None:
+        index = pinecone_index
+
+def is_retryable(error):
+    """
+    True for throttling / transient server errors from Azure OpenAI or Pinecone.
+    """
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return status in RETRYABLE_STATUS
+
+def with_retries(fn, *args, **kwargs):
+    """
+    Calls fn, retrying throttled/transient failures with exponential backoff and jitter.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = RETRY_BASE_DELAY * (2 ** attempt) * (0.5 + random.random())
+            tqdm.write(f"Retrying after {type(e).__name__} (attempt {attempt + 1}) in {delay:.1f}s")
+            time.sleep(delay)
 
 def get_embedding(text):
     """
     Get embedding for the given text using Azure OpenAI.
     """
-    response = openai_client.embeddings.create(
-        input = text,
+    return get_embeddings([text])[0][0]
+
+def get_embeddings(texts):
+    """
+    Embeds many texts in one request. Returns (embeddings, tokens_used).
+    """
+    response = with_retries(
+        get_openai_client().embeddings.create,
+        input = texts,
         model = AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT
     )
-    return response.data[0].embedding
+    embeddings = [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+    tokens = response.usage.total_tokens if response.usage else 0
+    return embeddings, tokens
+
+def group_by_namespace(records):
+    by_namespace = {}
+    for r in records:
+        by_namespace.setdefault(r["namespace"], []).append(r)
+    return by_namespace
+
+def upsert_batch(namespace, rows):
+    vectors = [{"id": r["id"], "values": r["values"], "metadata": r["metadata"]} for r in rows]
+    with_retries(index.upsert, vectors = vectors, namespace = namespace)
+
+def delete_batch(namespace, ids):
+    with_retries(index.delete, ids = ids, namespace = namespace)
+
+def delete_stale(pool, stale):
+    """
+    Deletes (chunk id, namespace) pairs from the index, 1000 IDs per request.
+    """
+    delete_jobs = []
+    stale_by_namespace = {}
+    for cid, ns in stale:
+        stale_by_namespace.setdefault(ns, []).append(cid)
+    for namespace, ids in stale_by_namespace.items():
+        for i in range(0, len(ids), 1000):
+            batch = ids[i:i + 1000]
+            delete_jobs.append((len(batch), (namespace, batch)))
+    with tqdm(total = len(stale), unit = "chunk", desc = "delete") as delete_bar:
+        run_batches(pool, delete_batch, delete_jobs, delete_bar)
+
+def upsert_jobs_for(rows):
+    """
+    (weight, (namespace, batch)) upsert jobs of UPSERT_BATCH_SIZE vectors.
+    """
+    jobs = []
+    for namespace, ns_rows in group_by_namespace(rows).items():
+        for i in range(0, len(ns_rows), UPSERT_BATCH_SIZE):
+            batch = ns_rows[i:i + UPSERT_BATCH_SIZE]
+            jobs.append((len(batch), (namespace, batch)))
+    return jobs
+
+def run_batches(pool, fn, jobs, bar):
+    """
+    Runs fn(*job) for every job on the pool, advancing the progress bar; returns the results.
+    Each job is (weight, args) where weight is the number of chunks it covers.
+    """
+    results = []
+    futures = {pool.submit(fn, *args): w for w, args in jobs}
+    for future in as_completed(futures):
+        results.append(future.result())
+        bar.update(futures[future])
+    return results
 
-def upload_chunks_to_pinecone(chunks):
+def embed_texts(pool, texts, embed_batch_size, bar):
+    """
+    Embeds texts in multi-input requests, concurrently. Returns ({text: embedding}, tokens_used).
+    """
+    def embed_batch(batch):
+        embeddings, tokens = get_embeddings(batch)
+        return dict(zip(batch, embeddings)), tokens
+
+    jobs = [
+        (len(texts[i:i + embed_batch_size]), (texts[i:i + embed_batch_size],))
+        for i in range(0, len(texts), embed_batch_size)
+    ]
+    embedded, total_tokens = {}, 0
+    for mapping, tokens in run_batches(pool, embed_batch, jobs, bar):
+        embedded.update(mapping)
+        total_tokens += tokens
+    return embedded, total_tokens
+
+def upload_chunks_to_pinecone(chunks, embed_batch_size = None, workers = None, manifest = None, full = False,
+                              keep_records = True):
     """
     Uploads parsed HTML chunks to Pinecone, using healthFund as namespace.
-    Embeds only service and benefit, but stores phones/links in metadata.
-    """
-    for i, chunk in enumerate(tqdm(chunks)):
-        if chunk['chunk_type'] == "service":
-            kupa_contacts = chunk.get("kupa_contacts", {})
-            phones = ", ".join(kupa_contacts.get("phones", []))
-            links = ", ".join(kupa_contacts.get("links", []))
-
-            # Embed ONLY service and benefit
-            embed_text = f"{chunk['service']} - {chunk['benefit']}"
-
-            # Mapping hebrew healthFund names into English
-            kupa_hebrew = chunk.get("kupa", "")
-            kupa_namespace = KUPA_NAMESPACE_MAP.get(kupa_hebrew, "general")
-
-            
-            metadata = {
-                "service": chunk.get("service", ""),
-                "benefit": chunk.get("benefit", ""),
-                "maslul": chunk.get("maslul", ""),
-                "kupa": kupa_hebrew,
-                "phones": phones,
-                "links": links,
-                "intro": chunk.get("intro", ""),
-            }
-            chunk_id = f"{kupa_namespace}_{i}"
-            embedding = get_embedding(embed_text)
-            index.upsert(
-                vectors=[
-                    {
-                        "id": chunk_id,
-                        "values": embedding,
-                        "metadata": metadata
-                    }
-                ],
-                namespace=kupa_namespace
-            )
-        elif chunk['chunk_type'] in ["intro", "outro"]:
-            
-            kupa_hebrew = chunk.get("kupa", "")
-            kupa_namespace = KUPA_NAMESPACE_MAP.get(kupa_hebrew, "general")
-            metadata = {
-                "chunk_type": chunk["chunk_type"],
-                "kupa": kupa_hebrew,
-                "maslul": "",
-                "service": "",
-                "benefit": ""
-            }
-            chunk_id = f"{kupa_namespace}_{chunk['chunk_type']}"
-            embedding = get_embedding(chunk['text'])
-            index.upsert(
-                vectors=[
-                    {
-                        "id": chunk_id,
-                        "values": embedding,
-                        "metadata": metadata
-                    }
-                ],
-                namespace=kupa_namespace
-            )
+    Texts are embedded in multi-input requests and upserted in sized batches,
+    with up to `workers` batches in flight.
+
+    `chunks` can be any iterable, e.g. the parse_html.iter_services_chunks generator.
+    Records are processed in windows of embed_batch_size x workers as they arrive,
+    so only one window of vectors is held at a time unless keep_records is set.
+
+    With a manifest (diff mode) only new/changed chunks are upserted, only texts
+    without a stored embedding are embedded, and chunks no longer in the corpus
+    are deleted. full=True re-embeds and re-upserts everything but still deletes
+    stale chunks. After a switch of embeddings deployment (IndexManifest.load retires
+    the chunks) every chunk is upserted again. The manifest is updated in place; without a Pinecone index
+    (local-only run) only its embeddings change, its chunks still describe the index.
+    Returns all current records (with values) when keep_records, so they can also
+    be saved as a local index; otherwise an empty list.
+    """
+    embed_batch_size = embed_batch_size or EMBED_BATCH_SIZE
+    workers = workers or INGEST_WORKERS
+    window_size = embed_batch_size * workers
+    known_ids = manifest.chunks if manifest is not None else {}
+
+    current = {}            # chunk id -> namespace
+    text_hashes = set()
+    kept = []
+    totals = {"upserted": 0, "embedded": 0, "tokens": 0}
+
+    def process_window(pool, window):
+        # Reuse stored embeddings; embed each missing text once
+        missing = {}
+        for r in window:
+            values = manifest.get_embedding(r["text"]) if manifest is not None and not full else None
+            if values is not None:
+                r["values"] = values
+            else:
+                missing[r["text"]] = True
+        embedded, tokens = embed_texts(pool, list(missing), embed_batch_size, embed_bar)
+        for r in window:
+            if "values" not in r:
+                r["values"] = embedded[r["text"]]
+        if manifest is not None:
+            manifest.set_embeddings(embedded)
+        totals["embedded"] += len(embedded)
+        totals["tokens"] += tokens
+
+        to_upsert = window if full else [r for r in window if r["id"] not in known_ids]
+        if index is not None:
+            run_batches(pool, upsert_batch, upsert_jobs_for(to_upsert), upsert_bar)
+            totals["upserted"] += len(to_upsert)
+        if keep_records:
+            kept.extend(window)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = workers) as pool, \
+            tqdm(unit = "chunk", desc = "embed") as embed_bar, \
+            tqdm(unit = "chunk", desc = "upsert") as upsert_bar:
+        window = []
+        # Identical content maps to the same ID, so duplicates collapse here
+        for r in map(chunk_to_record, chunks):
+            if not r or r["id"] in current:
+                continue
+            current[r["id"]] = r["namespace"]
+            text_hashes.add(text_hash(r["text"]))
+            window.append(r)
+            if len(window) >= window_size:
+                process_window(pool, window)
+                window = []
+        if window:
+            process_window(pool, window)
+
+        indexed = manifest.indexed_chunks() if manifest is not None else {}
+        stale = [(cid, ns) for cid, ns in indexed.items() if cid not in current]
+        if index is not None and stale:
+            delete_stale(pool, stale)
+    elapsed = time.perf_counter() - start
+
+    if manifest is not None:
+        manifest.retain_embeddings(text_hashes)
+        if index is not None:
+            manifest.set_chunks(current)
+
+    print(
+        f"{len(current)} chunks: {totals['upserted']} upserted, {len(stale)} stale, "
+        f"{totals['embedded']} texts embedded"
+    )
+    if totals["upserted"] and elapsed > 0:
+        print(
+            f"Indexed {totals['upserted']} chunks in {elapsed:.2f}s: "
+            f"{totals['upserted'] / elapsed:.1f} chunks/sec, {totals['tokens'] / elapsed:.0f} tokens/sec"
+        )
+    return kept
+
+def seed_from_snapshot(snapshot, workers = None, manifest = None):
+    """
+    Upserts every record of a KBSnapshot: no HTML parsing and no embedding calls.
+    Chunks the manifest knows but the snapshot does not are deleted and, when
+    there is a Pinecone index, the manifest is set to the snapshot's chunks.
+    Its stored embeddings are left alone: the snapshot's dequantized vectors
+    must not be reused (and re-quantized) by later runs as if they were real.
+    Returns the records (with values).
+    """
+    workers = workers or INGEST_WORKERS
+    records = list(snapshot.records())
+    current = {r["id"]: r["namespace"] for r in records}
+    stale = [(cid, ns) for cid, ns in (manifest.indexed_chunks() if manifest is not None else {}).items()
+             if cid not in current]
+    start = time.perf_counter()
+    if index is not None:
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            with tqdm(total = len(records), unit = "chunk", desc = "upsert") as upsert_bar:
+                run_batches(pool, upsert_batch, upsert_jobs_for(records), upsert_bar)
+            if stale:
+                delete_stale(pool, stale)
+    if manifest is not None and index is not None:
+        manifest.set_chunks(current)
+    print(
+        f"{len(records)} chunks from snapshot {snapshot.corpus_hash} ({snapshot.header['dtype']}): "
+        f"{len(records) if index is not None else 0} upserted, {len(stale)} stale, 0 texts embedded "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return records
 
 if __name__ == "__main__":
-    from parse_html import parse_services_html
+    from parse_html import iter_services_chunks
+    import argparse
     import glob
 
-    html_files = glob.glob("phase2_data/*.html")
-    all_chunks = []
-    for file in html_files:
-        all_chunks.extend(parse_services_html(file))
+    parser = argparse.ArgumentParser(description="Embed the knowledge base and upload it to Pinecone")
+    parser.add_argument("--input-dir", action="append", dest="input_dirs",
+                        help="directory of HTML pages, searched recursively (repeatable; default: phase2_data)")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help="processes parsing HTML files (1 parses in this process)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="concurrent embedding / upsert batches")
+    parser.add_argument("--manifest", default=INDEX_MANIFEST_PATH,
+                        help="index manifest used for incremental (diff) reindexing")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the manifest and re-embed / re-upsert every chunk")
+    parser.add_argument("--from-snapshot", metavar="PATH",
+                        help="re-seed the index from a KB snapshot instead of parsing and embedding")
+    args = parser.parse_args()
+
+    if args.from_snapshot:
+        from kb_snapshot import KBSnapshot
+        snapshot = KBSnapshot.load(args.from_snapshot)
+        deployment = snapshot.header["deployment"]
+        if deployment and AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT and deployment != AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT:
+            parser.error(f"snapshot embeddings are from {deployment!r}, "
+                         f"queries use {AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT!r}")
+        manifest = IndexManifest.load(args.manifest, deployment or AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT)
+        records = seed_from_snapshot(snapshot, workers = args.workers, manifest = manifest)
+        manifest.save(args.manifest)
+        page_table = snapshot.page_table()
+        page_table.save(PAGE_TABLE_PATH)
+        print(f"Page table ({len(page_table)} pages) written to {PAGE_TABLE_PATH}")
+        if LOCAL_INDEX_DIR:
+            from local_index import save_local_index
+            save_local_index(records, LOCAL_INDEX_DIR)
+            print(f"Local index written to {LOCAL_INDEX_DIR}")
+        raise SystemExit(0)
+
+    html_files = sorted(
+        path
+        for input_dir in (args.input_dirs or ["phase2_data"])
+        for path in glob.glob(os.path.join(input_dir, "**", "*.html"), recursive = True)
+    )
+    print(f"{len(html_files)} HTML files, parsing with {args.parse_workers} process(es)")
+    page_table = PageTable()
+    chunks = page_table.collect(
+        iter_services_chunks(html_files, workers = args.parse_workers, cache_dir = PARSE_CACHE_DIR)
+    )
 
-    upload_chunks_to_pinecone(all_chunks)
-    print("Upload finished!")
\ No newline at end of file
+    manifest = IndexManifest.load(args.manifest, AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT)
+    records = upload_chunks_to_pinecone(
+        chunks,
+        workers = args.workers,
+        manifest = manifest,
+        full = args.full,
+        keep_records = bool(LOCAL_INDEX_DIR or KB_SNAPSHOT_PATH)
+    )
+    manifest.save(args.manifest)
+    page_table.save(PAGE_TABLE_PATH)
+    print(f"Page table ({len(page_table)} pages) written to {PAGE_TABLE_PATH}")
+    if LOCAL_INDEX_DIR:
+        from local_index import save_local_index
+        save_local_index(records, LOCAL_INDEX_DIR)
+        print(f"Local index written to {LOCAL_INDEX_DIR}")
+    if KB_SNAPSHOT_PATH:
+        from kb_snapshot import write_snapshot
+        header = write_snapshot(KB_SNAPSHOT_PATH, records, page_table, KB_SNAPSHOT_DTYPE,
+                                AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT or "")
+        print(f"KB snapshot ({header['count']} chunks, {KB_SNAPSHOT_DTYPE}, corpus {header['corpus_hash']}) "
+              f"written to {KB_SNAPSHOT_PATH}")
+    print("Upload finished!")
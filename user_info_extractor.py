@@ -0,0 +1,214 @@
+# user_info_extractor.py
+"""
+Rule-based extraction of the onboarding fields from the chat history (Hebrew & English).
+Runs before the LLM extractor in server.get_user_data; the LLM is only asked for
+fields these rules could not resolve.
+
+Messages are scanned in order and later values override earlier ones, so the
+assistant's final summary (which the user confirmed) wins over the dialogue.
+Assistant messages are only read through labeled patterns ("גיל: 35"), because
+the bot's questions also list the possible HMOs / tiers.
+"""
+import re
+
+USER_INFO_FIELDS = [
+    "first_name", "last_name", "id_number", "gender", "age",
+    "hmo_name", "hmo_card_number", "membership_tier"
+]
+# Hebrew names of the fields, for asking the user for missing ones
+FIELD_LABELS = {
+    "first_name": "שם פרטי", "last_name": "שם משפחה", "id_number": "מספר תעודת זהות",
+    "gender": "מגדר", "age": "גיל", "hmo_name": "קופת חולים",
+    "hmo_card_number": "מספר כרטיס קופה", "membership_tier": "מסלול ביטוח"
+}
+
+HMO_NAMES = {
+    "מכבי": "מכבי", "maccabi": "מכבי",
+    "מאוחדת": "מאוחדת", "meuhedet": "מאוחדת",
+    "כללית": "כללית", "clalit": "כללית",
+}
+TIERS = {
+    "זהב": "זהב", "gold": "זהב",
+    "כסף": "כסף", "silver": "כסף",
+    "ארד": "ארד", "bronze": "ארד",
+}
+GENDERS = {
+    "זכר": "זכר", "גבר": "זכר", "נקבה": "נקבה", "אישה": "נקבה",
+    "male": "male", "man": "male", "female": "female", "woman": "female",
+}
+
+def _alternation(words):
+    return "|".join(sorted(map(re.escape, words), key=len, reverse=True))
+
+def _gap(stop, length):
+    """
+    Up to `length` non-digits between a label and its number, not crossing another label:
+    in "I lost my card, my ID is 123456789" the number belongs to the ID only.
+    """
+    return r"(?:(?!" + stop + r")[^\d\n]){0," + str(length) + r"}?"
+
+SEP = r"\s*[:\-–=]?\s*"
+ID_KEYWORDS = r"ת\.?\s?ז\.?|ת\"ז|תעודת ה?זהות|מספר זהות|\bid\b|identity"
+CARD_KEYWORDS = r"כרטיס|\bcard\b"
+HMO_ALT = _alternation(HMO_NAMES)
+TIER_ALT = _alternation(TIERS)
+GENDER_ALT = _alternation(GENDERS)
+
+# Labeled values ("label: value"), used for user and assistant messages
+LABELED = {
+    "full_name": re.compile(r"(?:שם מלא|full name|my name is|שמי|קוראים לי)" + SEP + r"([^\n,.:;0-9]+)", re.I),
+    "first_name": re.compile(r"(?:שם פרטי|first name)" + SEP + r"([^\n,.:;0-9]+)", re.I),
+    "last_name": re.compile(r"(?:שם משפחה|last name|surname)" + SEP + r"([^\n,.:;0-9]+)", re.I),
+    "hmo_card_number": re.compile(r"(?:" + CARD_KEYWORDS + r")" + _gap(ID_KEYWORDS, 30) + r"(\d{9})(?!\d)", re.I),
+    "id_number": re.compile(r"(?:" + ID_KEYWORDS + r")" + _gap(CARD_KEYWORDS, 25) + r"(\d{9})(?!\d)", re.I),
+    "age": re.compile(r"(?:גיל|\bage\b)" + SEP + r"(\d{1,3})(?!\d)", re.I),
+    "gender": re.compile(r"(?:מגדר|מין|\bgender\b|\bsex\b)" + SEP + r"(" + GENDER_ALT + r")\b", re.I),
+    "hmo_name": re.compile(r"(?:קופת חולים|קופה|\bhmo\b|health fund)(?:\s+name)?" + SEP + r"ב?(" + HMO_ALT + r")", re.I),
+    "membership_tier": re.compile(r"(?:מסלול(?: ביטוח)?|רמת חברות|\btier\b|\bplan\b|membership)" + SEP + r"(" + TIER_ALT + r")", re.I),
+}
+
+# Free-form phrasings in user messages
+AGE_PHRASE = re.compile(r"(?:\bב[ןת]\s+(\d{1,3})\b|\b(\d{1,3})\s*(?:years old|y/o|שנים)|\bi'?m\s+(\d{1,3})\b)", re.I)
+NINE_DIGITS = re.compile(r"(?<!\d)(\d{9})(?!\d)")
+SMALL_NUMBER = re.compile(r"(?<!\d)(\d{1,3})(?!\d)")
+HMO_ANY = re.compile(HMO_ALT, re.I)
+TIER_WORD = re.compile(r"(?:^|\s|ב)(" + TIER_ALT + r")\b", re.I)
+TIER_BEFORE_LABEL = re.compile(r"\b(" + TIER_ALT + r")\s+(?:plan|tier|membership|member)\b", re.I)
+GENDER_WORD = re.compile(r"(?:^|\s)(" + GENDER_ALT + r")\b", re.I)
+# Unambiguous gender words are accepted anywhere in a user message
+EXPLICIT_GENDERS = {"זכר", "נקבה", "male", "female"}
+NAME_STOPWORDS = {"and", "i", "i'm", "im", "my", "ואני", "אני", "בן", "בת", "גיל", "מגדר"}
+NAME_REPLY = re.compile(r"^[A-Za-z֐-׿'\-]+(?:\s+[A-Za-z֐-׿'\-]+){1,3}$")
+
+# What the previous assistant message asked about (for unlabeled replies)
+ASKED = {
+    "id_number": re.compile(r"ת\.?\s?ז|ת\"ז|תעודת ה?זהות|\bid\b|identity", re.I),
+    "hmo_card_number": re.compile(r"כרטיס|\bcard\b", re.I),
+    "age": re.compile(r"גיל|\bage\b|how old", re.I),
+    "gender": re.compile(r"מגדר|\bgender\b|\bsex\b", re.I),
+    "full_name": re.compile(r"שם|שמך|\bname\b", re.I),
+    "membership_tier": re.compile(r"מסלול|\btier\b|\bplan\b|membership", re.I),
+}
+
+def _valid_age(value):
+    return value.isdigit() and 0 <= int(value) <= 120
+
+def _name_words(value):
+    """
+    The words of a name, up to the first word that starts the rest of the sentence
+    ("יוסי ואני בן 35" -> ["יוסי"]). "בן" / "בת" before another word are part of
+    the name ("בן דוד"), before an age (or at the end) they are not.
+    """
+    words = value.strip(" -–'\"").split()
+    parts = []
+    for i, word in enumerate(words):
+        if word.lower() in NAME_STOPWORDS:
+            if word not in ("בן", "בת") or i + 1 == len(words) or words[i + 1].isdigit():
+                break
+        parts.append(word)
+    return parts
+
+def _set_name(info, full_name):
+    parts = _name_words(full_name)
+    if not parts:
+        return
+    info["first_name"] = parts[0]
+    if len(parts) > 1:
+        info["last_name"] = " ".join(parts[1:])
+
+def _apply_labeled(text, info):
+    for field, pattern in LABELED.items():
+        for match in pattern.finditer(text):
+            value = match.group(1).strip()
+            if field == "full_name":
+                _set_name(info, value)
+            elif field in ("first_name", "last_name"):
+                # Compound names stay whole ("בן דוד", "Mary Ann")
+                info[field] = " ".join(_name_words(value))
+            elif field == "age":
+                if _valid_age(value):
+                    info["age"] = value
+            elif field == "gender":
+                info["gender"] = GENDERS[value.lower()]
+            elif field == "hmo_name":
+                info["hmo_name"] = HMO_NAMES[value.lower()]
+            elif field == "membership_tier":
+                info["membership_tier"] = TIERS[value.lower()]
+            else:
+                info[field] = value
+
+def _apply_unlabeled(text, asked, info, labeled_fields):
+    """
+    Reads bare values from a user message, using what the bot just asked as a hint.
+    """
+    stripped = text.strip()
+
+    if not labeled_fields & {"id_number", "hmo_card_number"}:
+        numbers = NINE_DIGITS.findall(text)
+        if len(numbers) == 1:
+            if asked.get("hmo_card_number") and not asked.get("id_number"):
+                info["hmo_card_number"] = numbers[0]
+            elif asked.get("id_number") and not asked.get("hmo_card_number"):
+                info["id_number"] = numbers[0]
+
+    if "age" not in labeled_fields:
+        m = AGE_PHRASE.search(text)
+        value = next((g for g in m.groups() if g), None) if m else None
+        if value is None and asked.get("age"):
+            small = SMALL_NUMBER.findall(text)
+            value = small[0] if len(small) == 1 else None
+        if value is not None and _valid_age(value):
+            info["age"] = value
+
+    if "hmo_name" not in labeled_fields:
+        found = {HMO_NAMES[h.lower()] for h in HMO_ANY.findall(text)}
+        if len(found) == 1:
+            info["hmo_name"] = found.pop()
+
+    if "membership_tier" not in labeled_fields:
+        found = {TIERS[t.lower()] for t in TIER_WORD.findall(text)}
+        suffixed = {TIERS[t.lower()] for t in TIER_BEFORE_LABEL.findall(text)}
+        # "כסף" also means "money", so bare tier words need a tier question or a one-word reply
+        if len(suffixed) == 1:
+            info["membership_tier"] = suffixed.pop()
+        elif len(found) == 1 and (asked.get("membership_tier") or len(stripped.split()) <= 2):
+            info["membership_tier"] = found.pop()
+
+    if "gender" not in labeled_fields:
+        words = {g.lower() for g in GENDER_WORD.findall(text)}
+        found = {GENDERS[g] for g in words}
+        if len(found) == 1 and (asked.get("gender") or len(stripped.split()) <= 2 or words & EXPLICIT_GENDERS):
+            info["gender"] = found.pop()
+
+    if not labeled_fields & {"first_name", "last_name", "full_name"} and asked.get("full_name") \
+            and not any(asked.get(k) for k in ("id_number", "hmo_card_number", "age", "gender", "membership_tier")) \
+            and NAME_REPLY.match(stripped):
+        _set_name(info, stripped)
+
+def _labeled_fields(text):
+    fields = set()
+    for field, pattern in LABELED.items():
+        if pattern.search(text):
+            fields.add(field)
+    return fields
+
+def extract_user_info(chat_history):
+    """
+    Returns a dict with all USER_INFO_FIELDS ("" when not found).
+    """
+    info = {field: "" for field in USER_INFO_FIELDS}
+    asked = {}
+    for msg in chat_history:
+        text = msg.get("content", "")
+        if msg.get("role") == "assistant":
+            _apply_labeled(text, info)
+            asked = {field: bool(p.search(text)) for field, p in ASKED.items()}
+            continue
+        labeled = _labeled_fields(text)
+        _apply_labeled(text, info)
+        _apply_unlabeled(text, asked, info, labeled)
+        asked = {}
+    return info
+
+def missing_fields(info):
+    return [field for field in USER_INFO_FIELDS if not str(info.get(field, "")).strip()]